@@ -17,10 +17,14 @@ class ArimaModel:
         self.order = order
         self.percent_ci = percent_ci
     
-    def fit(self, **kwargs):
-        '''Fits the ARIMA model based on the data. '''
+    def fit(self, start_params: np.array=None, cov_type: str=None, **kwargs):
+        '''Fits the ARIMA model based on the data. 
+        Arguments:
+            start_params: The initial parameters of the optimizer, e.g. the parameters of a previous fit. Default: None (the default starting values). 
+            cov_type: The method to calculate the covariance of the parameters, 'none' to skip it. Default: None (the default method). 
+        '''
         arima = ARIMA(self.y_train, order=self.order, **kwargs)
-        self.model = arima.fit()
+        self.model = arima.fit(start_params=start_params, cov_type=cov_type)
     
     def get_model_summary(self):
         '''Obtains the model summary results. '''
@@ -44,3 +48,41 @@ class ArimaModel:
             print(f'[{datetime.now()}] Predicted {self.percent_ci * 100}% confidence interval: '
                   f'[{lower_est}, {upper_est}]')
         return lower_est, forecast_point_est, upper_est
+
+
+# ARIMA model class for a rolling window of data, which keeps the previous fit
+# the parameters of the previous fit are used to filter the new window, and as the starting values of the optimizer when the model is refitted
+# only the forecasts are used, so the covariance of the parameters is not calculated
+class RollingArimaModel(ArimaModel):
+    def __init__(self, order: tuple, percent_ci: float, refit_every: int=1):
+        '''Initializer method. 
+        Arguments:
+            order: The ARIMA model order. 
+            percent_ci: The percentage to calculate the confidence interval of the predicted quantities. 
+            refit_every: The number of updates between the (warm-started) refits of the parameters. 
+                The windows in between are filtered with the parameters of the last fit. Default: 1 (refit on every update). 
+        '''
+        super().__init__(None, order, percent_ci)
+        self.refit_every = refit_every
+        self.model = None
+        self.updates_since_fit = 0
+        self.n_fits = 0
+        self.n_filters = 0
+    
+    def update(self, y_train: np.array):
+        '''Updates the model with the latest window of data, by a warm-started refit or by filtering the window. 
+        Arguments:
+            y_train: A numpy array containing the time-series data. 
+        '''
+        self.y_train = y_train
+        if self.model is not None and self.updates_since_fit < self.refit_every - 1:
+            self.model = self.model.model.clone(y_train).filter(self.model.params, cov_type='none')
+            self.updates_since_fit += 1
+            self.n_filters += 1
+            return
+        start_params = None if self.model is None else self.model.params
+        # reset the model first, so that a failed fit is not reused
+        self.model = None
+        self.fit(start_params=start_params, cov_type='none')
+        self.updates_since_fit = 0
+        self.n_fits += 1
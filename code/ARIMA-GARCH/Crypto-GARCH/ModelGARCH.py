@@ -20,10 +20,13 @@ class GarchModel:
         self.p = p
         self.q = q
     
-    def fit(self, **kwargs):
-        '''Fits the GARCH model based on the data. '''
+    def fit(self, starting_values: np.array=None, **kwargs):
+        '''Fits the GARCH model based on the data. 
+        Arguments:
+            starting_values: The initial parameters of the optimizer, e.g. the parameters of a previous fit. Default: None (the default starting values). 
+        '''
         model = arch_model(self.y_train, rescale=False, p=self.p, q=self.q, **kwargs)
-        self.model = model.fit(show_warning=False)
+        self.model = model.fit(starting_values=starting_values, show_warning=False)
     
     def get_model_summary(self):
         '''Obtains the model summary results. '''
@@ -45,3 +48,104 @@ class GarchModel:
         if print_output:
             print(f'[{datetime.now()}] Predicted value: {forecast_value}')
         return forecast_value, forecast_std
+
+
+# GARCH model class for a rolling window of data, which keeps the previous fit
+# between the (warm-started) refits, the conditional variance is updated with the GARCH recursion of each new return, 
+# sigma2[t] = omega + sum(alpha[i] * resid[t-i] ** 2) + sum(beta[j] * sigma2[t-j]), in constant time
+class RollingGarchModel(GarchModel):
+    def __init__(self, p: int=1, q: int=1, refit_every: int=1):
+        '''Initializer method. 
+        Arguments:
+            p: The GARCH model autoregressive order. 
+            q: The GARCH model moving average order. 
+            refit_every: The number of updates between the refits of the parameters. 
+                The conditional variance is updated with the last parameters in between. Default: 1 (refit on every update). 
+        '''
+        self.p = p
+        self.q = q
+        self.refit_every = refit_every
+        self.model = None
+        self.y = None
+        # the parameters mu, omega, alpha[1..p] and beta[1..q] of the last fit
+        self.params = None
+        # the squared residuals of the last p returns and the conditional variances of the last q returns, the latest last
+        self.resid2 = None
+        self.variance = None
+        self.updates_since_fit = 0
+        self.n_fits = 0
+        self.n_recursions = 0
+    
+    def update(self, y: np.array, last_obs_value: float):
+        '''Updates the model with the latest window of prices, by a refit or by the GARCH recursion of the new return. 
+        Arguments:
+            y: A numpy array containing the time-series data. (raw prices)
+            last_obs_value: The last observed price value. 
+        '''
+        self.last_obs_value = last_obs_value
+        if self.params is not None and self.updates_since_fit < self.refit_every - 1:
+            n_new = self.count_new_prices(y)
+            if n_new is not None:
+                if n_new == 1:
+                    self.step(np.log(y[-1] / y[-2]))
+                    self.updates_since_fit += 1
+                    self.n_recursions += 1
+                self.y = y
+                return
+        starting_values = self.params
+        # reset the model first, so that a failed fit is not reused
+        self.params = None
+        self.y_train = np.diff(np.log(y))
+        self.fit(starting_values=starting_values)
+        # a warm start which does not converge is retried from the default starting values
+        if starting_values is not None and self.model.convergence_flag != 0:
+            self.fit()
+        self.y = y
+        self.params = self.model.params.values
+        resid2 = self.model.resid ** 2
+        variance = self.model.conditional_volatility ** 2
+        self.resid2 = np.asarray(resid2[len(resid2) - self.p:], dtype=float)
+        self.variance = np.asarray(variance[len(variance) - self.q:], dtype=float)
+        self.updates_since_fit = 0
+        self.n_fits += 1
+    
+    def count_new_prices(self, y: np.array):
+        '''Compares a window of prices with the previous window. 
+        Arguments:
+            y: A numpy array containing the time-series data. (raw prices)
+        
+        Returns: 0 if the window ends at the same price, 1 if it has moved by one price, or None otherwise (e.g. a gap in the data). 
+        '''
+        n = min(len(y), len(self.y))
+        if np.array_equal(y[-n:], self.y[-n:]):
+            return 0
+        n = min(len(y) - 1, len(self.y))
+        if n > 0 and np.array_equal(y[-n-1:-1], self.y[-n:]):
+            return 1
+        return None
+    
+    def next_variance(self) -> float:
+        '''Calculates the conditional variance of the next return with the GARCH recursion. '''
+        omega, alpha, beta = self.params[1], self.params[2:2+self.p], self.params[2+self.p:]
+        return omega + alpha @ self.resid2[::-1] + beta @ self.variance[::-1]
+    
+    def step(self, log_return: float):
+        '''Updates the squared residuals and the conditional variances with a new return. '''
+        variance = self.next_variance()
+        self.resid2 = np.append(self.resid2, (log_return - self.params[0]) ** 2)[1:]
+        self.variance = np.append(self.variance, variance)[1:]
+    
+    def predict_forecasts(self, n_steps=1, print_output=True):
+        '''Predicts the one-step forecasts based on the last parameters and the recursion of the conditional variance. 
+        As in GarchModel, the forecasts of the first step are returned for any n_steps. 
+        Arguments:
+            n_steps: The number of steps ahead to forecast. Default: 1. 
+            print_output: Whether to print the output or not. Default: True. 
+        
+        Returns: The predicted point estimate and the standard deviation of the predicted log return. 
+        '''
+        forecast_value = self.last_obs_value * np.exp(self.params[0])
+        forecast_std = np.sqrt(self.next_variance())
+        if print_output:
+            print(f'[{datetime.now()}] Predicted value: {forecast_value}')
+        return forecast_value, forecast_std
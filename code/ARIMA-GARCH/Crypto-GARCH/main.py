@@ -1,7 +1,7 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-from ModelGARCH import GarchModel
+from ModelGARCH import RollingGarchModel
 
 # The trading strategy based on the GARCH model in the US Stock market. 
 # NOTE: This algorithm is not published in the report and final results, 
@@ -35,6 +35,7 @@ class GARCHCrypto(QCAlgorithm):
         self.model = None
         self.GARCHp = 2
         self.GARCHq = 1
+        self.refitEvery = 5 # number of days between the refits of the GARCH parameters, the variance is updated recursively in between (1: refit daily)
 
         # additional defined variables - trade
         self.sellPositionsRatio = 0.75
@@ -112,8 +113,9 @@ class GARCHCrypto(QCAlgorithm):
         '''Fits the GARCH model and obtain the predicted quantity. '''
         try:
             lastObsValue = self.pastClosingPrices[-1]
-            self.model = GarchModel(self.pastClosingPrices, lastObsValue, p=self.GARCHp, q=self.GARCHq)
-            self.model.fit()
+            if self.model is None:
+                self.model = RollingGarchModel(p=self.GARCHp, q=self.GARCHq, refit_every=self.refitEvery)
+            self.model.update(self.pastClosingPrices, lastObsValue)
             forecastMean, forecastStd = self.model.predict_forecasts()
             return forecastMean, forecastStd
         except ValueError:
@@ -1,7 +1,9 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-from ModelARIMA import ArimaModel
+from ModelARIMA import RollingArimaModel
+from optionchain import OptionChainIndex
+from optionpositions import OptionPositions
 from typing import Union
 
 
@@ -39,6 +41,7 @@ class ARIMAOptions(QCAlgorithm):
         self.model = None
         self.modelTSOrder = (1, 1, 1) # corresponding to (p, d, q) for the class of ARIMA models
         self.predictionIntervalConfidenceLevel = 0.99
+        self.refitEvery = 5 # number of days between the refits of the ARIMA parameters, the days in between are filtered with the last parameters (1: refit daily)
 
         # additional defined variables - trade
         self.predictNDays = 25
@@ -56,6 +59,8 @@ class ARIMAOptions(QCAlgorithm):
         self.maxExpiryDays = 30
         option.SetFilter(-15, 15, timedelta(self.minExpiryDays), timedelta(self.maxExpiryDays))
         self.optionInvested = False
+        self.optionPositions = OptionPositions()
+        self.chainIndex = None
 
     def OnData(self, data: Slice):
         '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
@@ -181,6 +186,17 @@ class ARIMAOptions(QCAlgorithm):
             self.state = 0
         self.Log(str(self.Time) + f'options invested: {optionsInvested}' + f'underlying invested: {underlyingInvested}' + f'state: {self.state}')
 
+    def OnOrderEvent(self, orderEvent: OrderEvent):
+        '''OnOrder event is an entry point which processes an order. 
+        Arguments:
+            orderEvent: OrderEvent object containing the order details. 
+        '''
+
+        # updates the open option positions based on the fills, including the exercises, assignments and expiries
+        if orderEvent.Status == OrderStatus.Filled or orderEvent.Status == OrderStatus.PartiallyFilled:
+            if orderEvent.Symbol.SecurityType == SecurityType.Option:
+                self.optionPositions.fill(orderEvent.Symbol, orderEvent.FillQuantity)
+
     def GetPastClosingPrices(self, daysBefore: int) -> Union[np.array, None]:
         '''Obtains the past closing prices. 
 
@@ -197,9 +213,10 @@ class ARIMAOptions(QCAlgorithm):
     
     def FitPredictModel(self) -> (int, int, int):
         '''Fits the ARIMA model and obtain the predicted quantity. '''
-        self.model = ArimaModel(self.pastClosingPrices, order=self.modelTSOrder, 
-                                percent_ci=self.predictionIntervalConfidenceLevel)
-        self.model.fit()
+        if self.model is None:
+            self.model = RollingArimaModel(order=self.modelTSOrder, percent_ci=self.predictionIntervalConfidenceLevel, 
+                                           refit_every=self.refitEvery)
+        self.model.update(self.pastClosingPrices)
         lower, est, upper = self.model.predict_forecasts(n_steps=self.predictNDays)
         return lower, est, upper
 
@@ -215,14 +232,8 @@ class ARIMAOptions(QCAlgorithm):
         '''Determines if options are invested in the portfolio or not. 
         
         Returns: whether the options are invested in the portfolio or not. '''
-        invested = False
-        for symbol in self.Portfolio.keys():
-            # self.Debug(f"Symbol: {symbol}")
-            holding = self.Portfolio[symbol]
-            securityType = holding.Type
-            if securityType == 2: # check if the security type is an option
-                if holding.Invested:
-                    invested = True
+        self.optionPositions.remove_expired(self.Time)
+        invested = len(self.optionPositions) > 0
         self.optionInvested = invested
         return invested
     
@@ -235,16 +246,8 @@ class ARIMAOptions(QCAlgorithm):
 
         Returns: The corresponding call option contract
         '''
-        # Get the ATM strike price
-        atm_strike = sorted(chain, key = lambda x: abs(price - x.Strike))[0].Strike
-        # Select the ATM call Option contracts
-        calls = [x for x in chain if x.Strike == atm_strike and x.Right == OptionRight.Call] 
-        if len(calls) == 0: 
-            return None
-        # Select the contract with the furthest strike price
-        contracts = sorted(calls, key=lambda x: abs(price - x.Strike))
-        contract = contracts[0]
-        return contract
+        # select the call contract at the ATM strike price, i.e. the strike nearest to the price
+        return self.getChainIndex(chain).get_contract(OptionRight.Call, price)
     
     def getPut(self, chain: OptionChain, price: float):
         '''Obtains the put option contract given the option chain and strike price. 
@@ -255,14 +258,17 @@ class ARIMAOptions(QCAlgorithm):
 
         Returns: The corresponding put option contract
         '''
-        # Get the ATM strike price
-        atm_strike = sorted(chain, key = lambda x: abs(price - x.Strike))[0].Strike
-        # Select the ATM call Option contracts
-        puts = [x for x in chain if x.Strike == atm_strike and x.Right == OptionRight.Put] 
-        if len(puts) == 0: 
-            return None
-        # Select the contract with the furthest strike price
-        contracts = sorted(puts, key=lambda x: abs(price - x.Strike))
-        contract = contracts[0]
-        return contract
-    
\ No newline at end of file
+        # select the put contract at the ATM strike price, i.e. the strike nearest to the price
+        return self.getChainIndex(chain).get_contract(OptionRight.Put, price)
+    
+    def getChainIndex(self, chain: OptionChain) -> OptionChainIndex:
+        '''Obtains the index of the contracts of the option chain by their strikes, which is built once per slice. 
+        
+        Arguments:
+            chain: The option chain. 
+
+        Returns: The index of the option chain. 
+        '''
+        if self.chainIndex is None or self.chainIndex.chain is not chain:
+            self.chainIndex = OptionChainIndex(chain)
+        return self.chainIndex
\ No newline at end of file
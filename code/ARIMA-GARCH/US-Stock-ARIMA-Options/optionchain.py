@@ -0,0 +1,57 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+
+
+# an index of the contracts of an option chain by their right and strike, built once per slice
+# the strikes of each right are kept in a sorted array, so that the nearest strike to a price is found by a binary search
+class OptionChainIndex:
+    def __init__(self, chain):
+        '''Initializer method.
+
+        Arguments:
+            chain: The option chain of a slice.
+        '''
+        self.chain = chain
+        # the strike and right of each contract are read once, in the order of the chain
+        self.contracts = list(chain)
+        self.contract_strikes = np.array([contract.Strike for contract in self.contracts], dtype=float)
+        self.contract_rights = np.array([contract.Right for contract in self.contracts])
+        # the position of the first contract of each strike in the chain, which breaks the ties of the nearest strikes
+        strikes, first_positions = np.unique(self.contract_strikes, return_index=True)
+        self.first_positions = dict(zip(strikes.tolist(), first_positions.tolist()))
+        # the sorted unique strikes of each right
+        self.strikes = {right: np.unique(self.contract_strikes[self.contract_rights == right]) for right in (OptionRight.Call, OptionRight.Put)}
+
+    def __len__(self):
+        return len(self.contracts)
+
+    def nearest_strikes(self, strikes: np.array, price: float) -> list:
+        '''Finds the strikes of a sorted array which are the nearest to a price (two strikes if the price is halfway between them). '''
+        i = np.searchsorted(strikes, price)
+        candidates = strikes[max(i - 1, 0):i + 1]
+        if len(candidates) == 0:
+            return []
+        distances = np.abs(price - candidates)
+        return candidates[distances == distances.min()].tolist()
+
+    def get_contract(self, right: OptionRight, price: float):
+        '''Obtains the contract of a right at the strike which is the nearest to a price among all the contracts of the chain.
+        As with sorting the chain by the distance to the price, a tie goes to the strike which appears first in the chain.
+
+        Arguments:
+            right: The option right, OptionRight.Call or OptionRight.Put.
+            price: The strike price.
+
+        Returns: The first contract of the right at the nearest strike, or None if the nearest strike has no contract of the right.
+        '''
+        candidates = self.nearest_strikes(self.strikes[OptionRight.Call], price) + self.nearest_strikes(self.strikes[OptionRight.Put], price)
+        if len(candidates) == 0:
+            return None
+        distance = min(abs(price - strike) for strike in candidates)
+        atm_strike = min((strike for strike in candidates if abs(price - strike) == distance), key=lambda strike: self.first_positions[strike])
+        positions = np.flatnonzero((self.contract_strikes == atm_strike) & (self.contract_rights == right))
+        if len(positions) == 0:
+            return None
+        return self.contracts[positions[0]]
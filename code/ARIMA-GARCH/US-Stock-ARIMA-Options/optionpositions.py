@@ -0,0 +1,57 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+from collections import defaultdict
+
+
+# a registry of the open option positions, maintained from the fills of the order events
+# the exercises, assignments and expiries of the options are filled as orders as well, and the positions after their expiry
+# date are removed in case an expiry is not filled, so that the checks only go through the open positions
+class OptionPositions:
+    def __init__(self):
+        '''Initializer method. '''
+        # the quantity of each open option contract, keyed by its symbol
+        self.quantities = {}
+
+    def __len__(self):
+        return len(self.quantities)
+
+    def fill(self, symbol: Symbol, quantity: float):
+        '''Records the fill of an option order.
+
+        Arguments:
+            symbol: The symbol of the option contract.
+            quantity: The filled quantity, positive for a buy and negative for a sell.
+        '''
+        quantity = self.quantities.get(symbol, 0) + quantity
+        if quantity == 0:
+            self.quantities.pop(symbol, None)
+        else:
+            self.quantities[symbol] = quantity
+
+    def remove_expired(self, time: datetime) -> list:
+        '''Removes the positions of the contracts which expired before the date of a point in time.
+
+        Arguments:
+            time: The current time.
+
+        Returns: The symbols of the removed contracts.
+        '''
+        expired = [symbol for symbol in self.quantities if symbol.ID.Date.date() < time.date()]
+        for symbol in expired:
+            del self.quantities[symbol]
+        return expired
+
+    def exposure_by_underlying(self) -> dict:
+        '''Calculates the net quantity of the open option contracts of each underlying. '''
+        exposure = defaultdict(float)
+        for symbol, quantity in self.quantities.items():
+            exposure[symbol.Underlying] += quantity
+        return dict(exposure)
+
+    def exposure_by_expiry(self) -> dict:
+        '''Calculates the net quantity of the open option contracts of each expiry date. '''
+        exposure = defaultdict(float)
+        for symbol, quantity in self.quantities.items():
+            exposure[symbol.ID.Date] += quantity
+        return dict(exposure)
@@ -1,7 +1,7 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-from ModelARIMA import ArimaModel
+from ModelARIMA import RollingArimaModel
 
 
 # The trading strategy based on the ARIMA model in the US Stock market. 
@@ -36,6 +36,7 @@ class StockARIMA(QCAlgorithm):
         self.model = None
         self.modelTSOrder = (1, 1, 0) # corresponding to (p, d, q) for the class of ARIMA models
         self.predictionIntervalConfidenceLevel = 0.9
+        self.refitEvery = 5 # number of days between the refits of the ARIMA parameters, the days in between are filtered with the last parameters (1: refit daily)
 
         # additional defined variables - trade
         self.sellPositionsRatio = 0.75
@@ -101,9 +102,10 @@ class StockARIMA(QCAlgorithm):
     
     def FitPredictModel(self) -> (int, int, int):
         '''Fits the ARIMA model and obtain the predicted quantity. '''
-        self.model = ArimaModel(self.pastClosingPrices, order=self.modelTSOrder, 
-                                percent_ci=self.predictionIntervalConfidenceLevel)
-        self.model.fit()
+        if self.model is None:
+            self.model = RollingArimaModel(order=self.modelTSOrder, percent_ci=self.predictionIntervalConfidenceLevel, 
+                                           refit_every=self.refitEvery)
+        self.model.update(self.pastClosingPrices)
         lower, est, upper = self.model.predict_forecasts()
         return lower, est, upper
     
@@ -1,6 +1,35 @@
 from AlgoAPI import AlgoAPIUtil, AlgoAPI_Backtest
 from datetime import datetime, timedelta
-import pandas as pd
+import numpy as np
+
+
+# a cache of the daily closes, which are only requested again when a new daily bar appears, i.e. on the first tick of each day
+class DailyBarCache:
+    def __init__(self, evt, instrument, n_days, volatility_n_days):
+        self.evt = evt
+        self.instrument = instrument
+        self.n_days = n_days
+        self.volatility_n_days = volatility_n_days
+        self.date = None
+        self.MA = None
+        self.volatility = None
+
+    def get_closes(self, n_days):
+        res = self.evt.getHistoricalBar({"instrument":self.instrument}, n_days, "D")
+        return np.array([res[t]['c'] for t in res], dtype=float)
+
+    def update(self, timestamp):
+        # returns whether the MA and the volatility are refreshed
+        if timestamp.date() == self.date:
+            return False
+        self.date = timestamp.date()
+        self.MA = self.get_closes(self.n_days).mean()
+        # the standard deviation of the daily returns, with one degree of freedom as in pandas
+        closes = self.get_closes(self.volatility_n_days)
+        returns = closes[1:] / closes[:-1] - 1
+        self.volatility = returns.std(ddof=1) if len(returns) > 1 else np.nan
+        return True
+
 
 class AlgoEvent:
     def __init__(self):
@@ -28,20 +57,18 @@ class AlgoEvent:
         self.cur_purchaseprice = 0
         self.cont_liquidate = False
         self.highwatermark = 0
+        self.dailybars = DailyBarCache(self.evt, self.instrument, self.n_days, self.volatility_n_days)
         self.evt.start()
 
     def on_marketdatafeed(self, md, ab):
-        res = self.evt.getHistoricalBar({"instrument":self.instrument},self.n_days, "D")
-        df = pd.DataFrame(data=[[res[t]['o'],res[t]['h'],res[t]['l'],res[t]['c']] for t in res],columns=['Open', 'High', 'Low', 'Close'])
-        #self.evt.consoleLog(res)
-        MA = df["Close"].mean()
-        #self.evt.consoleLog(MA)
+        # the MA and the MA bands only change with the daily bars
+        if self.dailybars.update(md.timestamp):
+            self.percent_above = self.dailybars.volatility * self.volatility_coefficient
+            self.upperband = self.dailybars.MA*(1+self.percent_above)
+            self.lowerband = self.dailybars.MA/(1+self.percent_above)
+        MA = self.dailybars.MA
         
-        res = self.evt.getHistoricalBar({"instrument":self.instrument},self.volatility_n_days, "D")
-        df2 = pd.DataFrame(data=[[res[t]['o'],res[t]['h'],res[t]['l'],res[t]['c']] for t in res],columns=['Open', 'High', 'Low', 'Close'])
-        c = df2["Close"].pct_change().dropna().std()
         pos, osOrder, pendOrder = self.evt.getSystemOrders()
-        self.percent_above = c * self.volatility_coefficient
         price = md.lastPrice
         if len(osOrder) > 0:
             self.highwatermark = max(price,self.highwatermark)
@@ -54,10 +81,10 @@ class AlgoEvent:
                 self.evt.consoleLog("Trailing stop loss: price: {}, highwm:{}, lowwm:{},{}, q:{}".format(price,self.highwatermark,self.lowwatermark,self.strikethrough,quantity))
                 close_trades = True
             elif self.strikethrough == "Upper":
-                if price <= MA*(1+self.percent_above):
+                if price <= self.upperband:
                     self.evt.consoleLog("Pass MA: sell")
                     close_trades = True
-                if price >= MA/(1+self.percent_above):
+                if price >= self.lowerband:
                     self.evt.consoleLog("Pass MA: buy back")
                     close_trades = True
             if close_trades:
@@ -65,7 +92,7 @@ class AlgoEvent:
                     self.close_order(tradeID)
         else:
             r = self.evt.getAccountBalance()
-            if self.upperlinepos == "Lower" and price >= MA*(1+self.percent_above):
+            if self.upperlinepos == "Lower" and price >= self.upperband:
                 q = r["availableBalance"]/price*0.8 
                 self.open_order(1,q)
                 # self.Log(f"Price: {price}, MA: {MA}, buy {q}")
@@ -73,7 +100,7 @@ class AlgoEvent:
                 self.highwatermark = price
                 self.lowwatermark = price
                 self.cur_purchaseprice = price
-            if self.lowerlinepos == "Upper" and price <= MA/(1+self.percent_above):
+            if self.lowerlinepos == "Upper" and price <= self.lowerband:
                 q = r["availableBalance"]/price*0.8
                 self.open_order(-1,q)
                 # self.Log(f"Price: {price}, MA: {MA}, sell {q}")
@@ -82,12 +109,12 @@ class AlgoEvent:
                 self.lowwatermark = price
                 self.cur_purchaseprice = price
         
-        if price >= MA*(1+self.percent_above):
+        if price >= self.upperband:
             self.upperlinepos = "Upper"
         else:
             self.upperlinepos = "Lower"
         
-        if price <= MA/(1+self.percent_above):
+        if price <= self.lowerband:
             self.lowerlinepos = "Lower"
         else:
             self.lowerlinepos = "Upper"
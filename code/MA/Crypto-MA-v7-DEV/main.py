@@ -1,6 +1,10 @@
 from AlgorithmImports import *
 from QuantConnect.Statistics import *
 from datetime import datetime, timedelta
+from turningpoints import TurningPointDetector
+from dailybars import DailyBarBuffer
+from dailycache import DailyCache
+from pasttrades import PastTradesTracker
 
 
 # Version 7 of the algorithm in the cryptocurrency market. 
@@ -48,6 +52,26 @@ class CryptoMA(QCAlgorithm):
         ### End Parameters
 
 
+        # (v5) detector of the peaks and troughs for the dynamic MA
+        self.turningPoints = TurningPointDetector(self.n_days, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+        # (v7) rolling store of the daily bars, warmed up once here and fed by a daily consolidator afterwards
+        # it holds enough bars for the longest possible dynamic MA
+        longest_MA = int(max(self.n_days, self.default_MA)*self.MA_coef)
+        self.dailyBars = DailyBarBuffer(max(longest_MA, self.volatility_n_days, self.close_volatility_n_days))
+        history = self.History(self.symbol, self.dailyBars.capacity, Resolution.Daily)
+        if 'close' in history:
+            times = history.index.get_level_values("time")
+            self.dailyBars.extend(times, history["open"].values, history["high"].values, history["low"].values, history["close"].values, history["volume"].values)
+            self.turningPoints.sync(times, history["close"].values)
+        self.Consolidate(self.symbol, Resolution.Daily, self.OnDailyBar)
+
+        # (v5) cache of the quantities derived from daily data, recalculated once per daily bar
+        self.dailyCache = DailyCache()
+
+        # (v7) recent closed trades for the past trades control, fed by the order events
+        self.pastTrades = PastTradesTracker(timedelta(days=self.num_days_lookback), self.num_days_lookback*10, self.initialCash//2)
+
         self.upperlinepos = ""
         self.lowerlinepos = ""
         self.cur_purchaseprice = 0
@@ -57,6 +81,53 @@ class CryptoMA(QCAlgorithm):
         self.SetTradeBuilder(TradeBuilder(FillGroupingMethod.FlatToReduced, FillMatchingMethod.FIFO))
 
 
+    def OnDailyBar(self, bar: TradeBar):
+        '''Event handler of the daily consolidator. Stores the completed daily bar and updates the dynamic MA. 
+        Arguments:
+            bar: The consolidated daily bar
+        '''
+        if self.dailyBars.add(bar.EndTime, bar.Open, bar.High, bar.Low, bar.Close, bar.Volume):
+            self.turningPoints.update(bar.Close, bar.EndTime)
+
+    def CalculateMA(self):
+        '''Calculates the dynamic moving average of the underlying from the daily closes. 
+
+        Returns: The moving average, or None if the data is incomplete. 
+        '''
+        # if data is incomplete, exit the function
+        if self.dailyBars.count < self.n_days:
+            return
+
+        ### (v5) Analysis to calculate MA (dynamic MA)
+        # dynamic MA is calculated based on the number of peaks and troughs
+        # the detector is fed by the daily consolidator
+        final_MA = self.turningPoints.final_MA
+
+        ### end of dynamic MA calculation
+
+        # calculate the moving average of the underlying
+        MA = self.dailyBars.last(final_MA).mean()
+        return MA
+
+    def CalculateVolatility(self):
+        '''Calculates the past volatility of the underlying to determine the width of the MA bands. 
+
+        Returns: The past volatility to open trades and the past volatility to close trades. 
+        '''
+        return self.dailyBars.volatility(self.volatility_n_days), self.dailyBars.volatility(self.close_volatility_n_days)
+
+    def CountPastLosses(self, price: float) -> int:
+        '''Calculates the number of recent trades which incur losses net the number of recent trades which are profitable. 
+
+        Arguments:
+            price: The current price of the underlying. 
+
+        Returns: The net number of losing trades, floored at zero. 
+        '''
+        # only the trades closed within self.num_days_lookback days, among the last self.num_days_lookback*10 trades,
+        # with a value of at least half of the initial cash are counted
+        return self.pastTrades.pnl_count(self.UtcTime, price)
+
     def OnData(self, slice:Slice):
         '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
         Arguments:
@@ -73,101 +144,11 @@ class CryptoMA(QCAlgorithm):
         else:
             return
         
-        # obtain the past history of the underlying
-        df = self.History(self.symbol, self.n_days, Resolution.Daily)
-        # self.Log(f"{'close' in df} {df.shape[0]}")
-
-        # if data is incomplete, exit the function
-        if 'close' not in df or df.shape[0] != self.n_days:
+        # (v5) the dynamic MA only changes when a new daily bar is completed
+        MA = self.dailyCache.get(self.dailyBars.last_time, "MA", self.CalculateMA)
+        if MA is None:
             return
 
-        ### (v5) Analysis to calculate MA (dynamic MA)
-        # dynamic MA is calculated based on the number of peaks and troughs
-
-        # identify the peaks
-        lastmax = 0
-        lastmaxindex = 0
-        reset = True
-        high_points = []
-        low_points = []
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].max()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax > lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            high_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax < lastmax:
-                        high_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 0
-                    reset = True
-
-        # identify the troughs
-        lastmax = 1000000000
-        lastmaxindex = 0
-        reset = True
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].min()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax < lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 1000000000:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            low_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax > lastmax:
-                        low_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 1000000000
-                    reset = True
-
-        high_diff = []
-        if len(high_points) >= 2:
-            for i in range(1,len(high_points)):
-                high_diff.append(high_points[i]-high_points[i-1])
-
-        low_diff = []
-        if len(low_points) >= 2:
-            for i in range(1,len(low_points)):
-                low_diff.append(low_points[i]-low_points[i-1])
-        
-        if len(high_diff) == 0:
-            high_MA = self.default_MA
-        else:
-            high_MA = sum(high_diff) / len(high_diff)
-
-        if len(low_diff) == 0:
-            low_MA = self.default_MA
-        else:
-            low_MA = sum(low_diff) / len(low_diff)
-        
-        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
-
-        if final_MA < self.min_MA:
-            final_MA = self.min_MA
-
-        ### end of dynamic MA calculation
-
-        df = self.History(self.symbol, final_MA, Resolution.Daily)
-
-        # calculate the moving average of the underlying
-        MA = df['close'].mean()
-
         # the same pair of MA bands is used to close trades
         close_MA = MA
 
@@ -175,34 +156,22 @@ class CryptoMA(QCAlgorithm):
 
         ### (v7) Past trades control
         # calculates the number of trades which incur losses net the number of trades which is profitable
-        trades = self.TradeBuilder.ClosedTrades
-        trades = trades[-min(len(trades),self.num_days_lookback*10):]
-        pnl_count = 0 #+ve: loss
-        for trade in trades:
-            if trade.ExitTime > self.UtcTime - timedelta(days=self.num_days_lookback) and trade.Quantity*price >= self.initialCash//2:
-                if not trade.IsWin:
-                    pnl_count += 1
-                else:
-                    pnl_count -= 1
-                
-        pnl_count = max(pnl_count,0)
+        # it is calculated on every bar rather than cached with the daily quantities, as it depends on the current price and the lookback of the trades
+        pnl_count = self.CountPastLosses(price)
         ### End (v7)
 
-        # obtain the past price data of the underlying stock
-        df3 = self.History(self.symbol, self.volatility_n_days, Resolution.Daily)
+        # obtain the past volatility of the underlying stock, only once per daily bar
+        volatility, close_volatility = self.dailyCache.get(self.dailyBars.last_time, "volatility", self.CalculateVolatility)
 
         # determine the width of the MA bands based on past volatility
-        self.percent_above = df3['close'].pct_change().dropna().std() * self.volatility_coefficient + pnl_count * self.penalty_coefficient
+        self.percent_above = volatility * self.volatility_coefficient + pnl_count * self.penalty_coefficient
         
-        # obtain the past volatility of the underlying stock
-        df4 = self.History(self.symbol, self.close_volatility_n_days, Resolution.Daily)
-
         # determine the width of the MA bands based on past volatility to close trades
         if self.adjustCloseVol:
             # penalty term added to close trades
-            self.close_above = df4['close'].pct_change().dropna().std() * self.close_volatility_coefficient + pnl_count * self.penalty_coefficient
+            self.close_above = close_volatility * self.close_volatility_coefficient + pnl_count * self.penalty_coefficient
         else:
-            self.close_above = df4['close'].pct_change().dropna().std() * self.close_volatility_coefficient
+            self.close_above = close_volatility * self.close_volatility_coefficient
         
         # check for conditions to close the position and execute market orders
         # the MA bands are used to close the positions in this version
@@ -277,3 +246,16 @@ class CryptoMA(QCAlgorithm):
             self.lowerlinepos = "Lower"
         else:
             self.lowerlinepos = "Upper"
+
+    def OnOrderEvent(self, orderEvent: OrderEvent):
+        '''OnOrder event is an entry point which processes an order. 
+        Arguments:
+            orderEvent: OrderEvent object containing the order details. 
+        '''
+        # (v7) the trades closed by the fill are added to the past trades control
+        if orderEvent.Status == OrderStatus.Filled or orderEvent.Status == OrderStatus.PartiallyFilled:
+            self.pastTrades.sync(self.TradeBuilder.ClosedTrades)
+
+    def OnEndOfAlgorithm(self):
+        '''Logs the hit and miss counts of the daily cache at the end of the algorithm. '''
+        self.Log(f"Daily cache: {self.dailyCache.hits} hits, {self.dailyCache.misses} misses, hit ratio {self.dailyCache.hit_ratio():.3f}")
@@ -0,0 +1,271 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import time
+import numpy as np
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+def linear(x):
+    return x
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+ACTIVATIONS = {"sigmoid": sigmoid, "hard_sigmoid": hard_sigmoid, "tanh": np.tanh, "linear": linear, "relu": relu}
+
+# the maximum absolute difference of the numpy predictions from those of keras, above which keras is used for the inference
+EXPORT_TOLERANCE = 1e-5
+
+
+# a forward pass of a trained keras Sequential model of stacked LSTM layers and a Dense output layer, in numpy only
+class NumpyLSTM:
+    def __init__(self, layers: list, dtype=np.float32):
+        '''Initializer method.
+
+        Arguments:
+            layers: A list of layers, each a dictionary with the keys "type" ("LSTM" or "Dense"), "weights",
+                "activation", and also "recurrent_activation" and "return_sequences" for LSTM layers.
+            dtype: The data type used in the calculation. Default: np.float32, as in keras.
+        '''
+        self.dtype = dtype
+        self.layers = []
+        for layer in layers:
+            layer = dict(layer)
+            layer["weights"] = [np.asarray(w, dtype=dtype) for w in layer["weights"]]
+            self.layers.append(layer)
+
+    @classmethod
+    def from_keras(cls, model, dtype=np.float32):
+        '''Exports the weights of a trained keras model. Dropout layers are skipped as they are only active in training.
+
+        Arguments:
+            model: The trained keras Sequential model.
+            dtype: The data type used in the calculation. Default: np.float32.
+
+        Returns: A NumpyLSTM instance with the same forward pass as the model.
+
+        Raises: ValueError if a layer, an activation or an option of a layer is not supported.
+        '''
+        layers = []
+        for layer in model.layers:
+            name = type(layer).__name__
+            if name == "Dropout":
+                continue
+            if name not in ("LSTM", "Dense"):
+                raise ValueError(f"Layer {name} is not supported")
+            config = layer.get_config()
+            for key in ("activation", "recurrent_activation") if name == "LSTM" else ("activation",):
+                # custom activations are serialised as dictionaries
+                if not isinstance(config.get(key), str) or config[key] not in ACTIVATIONS:
+                    raise ValueError(f"The {key.replace('_', ' ')} {config.get(key)} of layer {layer.name} is not supported")
+            for option in ("go_backwards", "stateful", "return_state"):
+                if config.get(option):
+                    raise ValueError(f"The option {option} of layer {layer.name} is not supported")
+            weights = layer.get_weights()
+            # a layer without a bias is the same as a layer with a zero bias
+            if not config.get("use_bias", True):
+                weights.append(np.zeros(weights[0].shape[1]))
+            if name == "LSTM":
+                layers.append({"type": "LSTM", "weights": weights,
+                               "activation": config["activation"], "recurrent_activation": config["recurrent_activation"],
+                               "return_sequences": config["return_sequences"]})
+            else:
+                layers.append({"type": "Dense", "weights": weights, "activation": config["activation"]})
+        return cls(layers, dtype)
+
+    def lstm(self, x: np.array, layer: dict) -> np.array:
+        '''Runs an LSTM layer over the time steps.
+
+        Arguments:
+            x: The input of shape (batch, time steps, features).
+            layer: The LSTM layer.
+
+        Returns: The hidden states of shape (batch, time steps, units), or of the last time step (batch, units).
+        '''
+        kernel, recurrent_kernel, bias = layer["weights"]
+        activation = ACTIVATIONS[layer["activation"]]
+        recurrent_activation = ACTIVATIONS[layer["recurrent_activation"]]
+        units = recurrent_kernel.shape[0]
+        batch, steps, _ = x.shape
+
+        # the input projection of all time steps is calculated at once
+        z_input = x @ kernel + bias
+        h = np.zeros((batch, units), dtype=self.dtype)
+        c = np.zeros((batch, units), dtype=self.dtype)
+        outputs = []
+        for t in range(steps):
+            # gates in the keras order: input, forget, cell, output
+            z = z_input[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2*units])
+            g = activation(z[:, 2*units:3*units])
+            o = recurrent_activation(z[:, 3*units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            if layer["return_sequences"]:
+                outputs.append(h)
+        if layer["return_sequences"]:
+            return np.stack(outputs, axis=1)
+        return h
+
+    def predict(self, x: np.array) -> np.array:
+        '''Predicts the outputs of the model.
+
+        Arguments:
+            x: The input of shape (batch, time steps, features).
+
+        Returns: The predicted outputs of shape (batch, output units).
+        '''
+        x = np.asarray(x, dtype=self.dtype)
+        for layer in self.layers:
+            if layer["type"] == "LSTM":
+                x = self.lstm(x, layer)
+            else:
+                kernel, bias = layer["weights"]
+                x = ACTIVATIONS[layer["activation"]](x @ kernel + bias)
+        return x
+
+
+# the inference with the keras model itself, used if the model cannot be exported to the numpy engine
+class KerasInference:
+    def __init__(self, model, reason: str):
+        '''Initializer method.
+
+        Arguments:
+            model: The trained keras model.
+            reason: The reason why the model is not exported to the numpy engine.
+        '''
+        self.model = model
+        self.reason = reason
+
+    def predict(self, x: np.array) -> np.array:
+        '''Predicts the outputs of the model with keras, in the same way as NumpyLSTM.predict. '''
+        return np.asarray(self.model.predict(x, verbose=0))
+
+
+def export_inference(model, x: np.array, tolerance=EXPORT_TOLERANCE, dtype=np.float32):
+    '''Exports a trained keras model to the numpy engine, and checks the predictions of the engine against keras on sample inputs.
+
+    Arguments:
+        model: The trained keras model.
+        x: The sample inputs, e.g. the last inputs of the training set.
+        tolerance: The maximum absolute difference of the predictions. Default: EXPORT_TOLERANCE.
+        dtype: The data type used in the calculation. Default: np.float32.
+
+    Returns: The NumpyLSTM instance, or a KerasInference instance of the model if the model is not supported
+        or the predictions differ by more than the tolerance.
+    '''
+    try:
+        engine = NumpyLSTM.from_keras(model, dtype)
+    except ValueError as e:
+        return KerasInference(model, str(e))
+    max_abs_error = float(np.max(np.abs(engine.predict(x) - model.predict(x, verbose=0))))
+    # NaN predictions also fail the check
+    if not max_abs_error <= tolerance:
+        return KerasInference(model, f"the maximum absolute error {max_abs_error:.3g} is above the tolerance {tolerance:g}")
+    return engine
+
+
+def benchmark_inference(model, engine: NumpyLSTM, x: np.array, n_runs=100) -> dict:
+    '''Compares the per-prediction latency of the numpy engine against the keras model.
+
+    Arguments:
+        model: The trained keras model.
+        engine: The numpy engine exported from the model.
+        x: A sample input of the model.
+        n_runs: The number of predictions timed for each method. Default: 100.
+
+    Returns: A dictionary of the mean latency (in seconds) of each method and the maximum absolute difference of the outputs.
+    '''
+    methods = {
+        "model.predict": lambda: model.predict(x, verbose=0),
+        "model(x, training=False)": lambda: np.asarray(model(x, training=False)),
+        "numpy": lambda: engine.predict(x),
+    }
+    results = {}
+    for name, method in methods.items():
+        # the first call is excluded as it may include the tracing of the keras graph
+        method()
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            method()
+        results[name] = (time.perf_counter() - start) / n_runs
+    results["max_abs_error"] = float(np.max(np.abs(engine.predict(x) - model.predict(x, verbose=0))))
+    return results
+
+
+def daily_windows(bars: np.array, times, n_days: int) -> tuple:
+    '''Builds the model inputs of every n_days consecutive daily bars.
+
+    Arguments:
+        bars: A numpy array of shape (5, n) with the open, high, low, close and volume of the daily bars.
+        times: The (end) times of the daily bars.
+        n_days: The number of daily bars in each input.
+
+    Returns: The inputs of shape (n - n_days + 1, 5, n_days), and the time of the last daily bar of each input.
+    '''
+    if bars.shape[1] < n_days:
+        return np.empty((0, bars.shape[0], n_days)), []
+    windows = np.lib.stride_tricks.sliding_window_view(bars, n_days, axis=1).transpose(1, 0, 2)
+    return windows, list(times[n_days-1:])
+
+
+# the predictions of the model for the daily inputs up to the next (re)train, calculated in one batched forward pass
+class PredictionTable:
+    def __init__(self):
+        '''Initializer method. '''
+        # key (usually the time of the last daily bar of the input) -> prediction
+        self.values = {}
+        # the time up to which the inputs are predicted
+        self.until = None
+        self.hits = 0
+        self.misses = 0
+
+    def fill(self, engine: NumpyLSTM, x: np.array, keys: list, until=None):
+        '''Predicts all the inputs at once and replaces the predictions of the previous model.
+
+        Arguments:
+            engine: The inference engine of the current model.
+            x: The inputs of shape (batch, 5, n_days).
+            keys: The key of each input.
+            until: The time up to which the inputs are predicted. Default: None.
+        '''
+        self.values = {}
+        self.until = until
+        if len(keys) == 0:
+            return
+        y = engine.predict(x)
+        self.values = dict(zip(keys, y))
+
+    def expired(self, time) -> bool:
+        '''Checks whether the current time is after the predicted period, e.g. if the model is kept as a retrain is skipped.
+
+        Arguments:
+            time: The current time.
+        '''
+        return self.until is not None and time > self.until
+
+    def get(self, key):
+        '''Obtains a precomputed prediction.
+
+        Arguments:
+            key: The key of the input.
+
+        Returns: The prediction of shape (output units,), or None if it is not precomputed.
+        '''
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
@@ -0,0 +1,94 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+from bisect import bisect_left
+from collections import deque
+from datetime import timedelta
+
+
+# a running count of the recent losing trades net the recent profitable trades (v7 past trades control)
+class PastTradesTracker:
+    def __init__(self, lookback: timedelta, max_trades: int, min_value: float):
+        '''Initializer method.
+
+        Arguments:
+            lookback: The period within which a closed trade is counted.
+            max_trades: The maximum number of the most recent closed trades which are counted.
+            min_value: The minimum value of a counted trade, i.e. its quantity times the current price.
+        '''
+        self.lookback = lookback
+        self.max_trades = max_trades
+        self.min_value = min_value
+        # the number of closed trades consumed from the trade builder
+        self.seen = 0
+        # (exit time, quantity, +1 for a loss or -1 for a win) of the counted trades, in the order they are closed
+        self.trades = deque()
+        # the quantities of the trades in ascending order, and the suffix sums of their signs
+        self.quantities = []
+        self.suffix = [0]
+
+    def sync(self, closed_trades):
+        '''Consumes the trades which are closed since the last call.
+
+        Arguments:
+            closed_trades: All the closed trades of the trade builder, in the order they are closed.
+        '''
+        n = len(closed_trades)
+        if n <= self.seen:
+            return
+        self.extend(closed_trades[self.seen:n])
+        self.seen = n
+
+    def extend(self, trades):
+        '''Adds closed trades which are already selected, e.g. the trades of one security among several.
+
+        Arguments:
+            trades: The new closed trades, in the order they are closed.
+        '''
+        for trade in trades:
+            if len(self.trades) == self.max_trades:
+                self.trades.popleft()
+            self.trades.append((trade.ExitTime, trade.Quantity, -1 if trade.IsWin else 1))
+        self.reindex()
+
+    def evict(self, time):
+        '''Discards the trades which are closed before the lookback period.
+
+        Arguments:
+            time: The current (UTC) time.
+        '''
+        cutoff = time - self.lookback
+        evicted = False
+        while self.trades and self.trades[0][0] <= cutoff:
+            self.trades.popleft()
+            evicted = True
+        if evicted:
+            self.reindex()
+
+    def reindex(self):
+        '''Sorts the counted trades by quantity, which only happens when a trade is added or evicted. '''
+        trades = sorted((quantity, sign) for _, quantity, sign in self.trades)
+        self.quantities = [quantity for quantity, _ in trades]
+        self.suffix = [0] * (len(trades) + 1)
+        for i in range(len(trades) - 1, -1, -1):
+            self.suffix[i] = self.suffix[i+1] + trades[i][1]
+
+    def pnl_count(self, time, price: float) -> int:
+        '''Calculates the number of recent trades which incur losses net the number of recent trades which are profitable.
+
+        Arguments:
+            time: The current (UTC) time.
+            price: The current price of the underlying, which determines the trades large enough to be counted.
+
+        Returns: The net number of losing trades, floored at zero.
+        '''
+        self.evict(time)
+        quantities = self.quantities
+        n = len(quantities)
+        # the first trade with quantity*price >= min_value, the division is only a starting point of the exact comparison
+        i = bisect_left(quantities, self.min_value / price)
+        while i > 0 and quantities[i-1] * price >= self.min_value:
+            i -= 1
+        while i < n and quantities[i] * price < self.min_value:
+            i += 1
+        return max(self.suffix[i], 0)
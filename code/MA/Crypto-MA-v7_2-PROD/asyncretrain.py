@@ -0,0 +1,76 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# runs the retraining of a model on a worker thread, so that the algorithm keeps handling the data in the meantime
+class AsyncRetrainer:
+    # the policies when a retrain is due while the previous one is still running
+    # "skip": the new retrain is dropped
+    # "queue": the new retrain starts once the running one completes (only the latest one is kept)
+    # "wait": the algorithm blocks until the running retrain completes, then starts the new one
+    POLICIES = ["skip", "queue", "wait"]
+
+    def __init__(self, policy="skip"):
+        '''Initializer method.
+
+        Arguments:
+            policy: The policy when a retrain is due while the previous one is still running. Default: "skip".
+        '''
+        if policy not in self.POLICIES:
+            raise ValueError(f"Retrain policy {policy} is not one of {self.POLICIES}")
+        self.policy = policy
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.pending = None
+        # the result of a retrain collected by the "wait" policy, which has not been swapped in yet
+        self.result = None
+        self.completed = 0
+        self.skipped = 0
+
+    def is_running(self) -> bool:
+        '''Determines whether a retrain is running on the worker thread. '''
+        return self.future is not None and not self.future.done()
+
+    def join(self):
+        '''Blocks until the running retrain completes, so that its result is collected by the next poll. '''
+        if self.future is not None:
+            wait([self.future])
+
+    def submit(self, train) -> bool:
+        '''Starts a retrain on the worker thread, subject to the policy if a retrain is still running.
+
+        Arguments:
+            train: A function without arguments which trains a copy of the model and returns the objects to be swapped in.
+
+        Returns: A boolean value indicating whether the retrain is started or queued.
+        '''
+        if self.is_running():
+            if self.policy == "skip":
+                self.skipped += 1
+                return False
+            if self.policy == "queue":
+                self.pending = train
+                return True
+            self.result = self.future.result()
+            self.completed += 1
+        self.future = self.executor.submit(train)
+        return True
+
+    def poll(self):
+        '''Collects the result of a completed retrain. It should be called on the algorithm thread,
+        so that the new model is swapped in between two data events.
+        An exception raised by the retrain is raised again here.
+
+        Returns: The objects returned by the retrain, or None if no retrain has completed since the last call.
+        '''
+        result, self.result = self.result, None
+        if self.future is not None and self.future.done():
+            future, self.future = self.future, None
+            result = future.result()
+            self.completed += 1
+            if self.pending is not None:
+                self.future = self.executor.submit(self.pending)
+                self.pending = None
+        return result
@@ -0,0 +1,35 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def build_training_set(bars: np.array, past_n_days: int, future_n_days: int, dtype=np.float64) -> tuple:
+    '''Builds the training set of the LSTM volatility model from the daily bars in one vectorized pass.
+    The i-th sample takes the bars from day i to day i+past_n_days-1 as the input, and the volatility of the
+    daily returns from day i+past_n_days to day i+past_n_days+future_n_days-1 as the output.
+
+    Arguments:
+        bars: A numpy array of shape (5, n) with the daily open, high, low, close and volume in rows.
+        past_n_days: The number of past days used as the input of the model.
+        future_n_days: The number of future days used to calculate the output volatility.
+        dtype: The data type of the returned arrays. Default: np.float64.
+
+    Returns: The model inputs of shape (n_samples, 5, past_n_days) and the outputs of shape (n_samples, 1).
+    '''
+    n_samples = bars.shape[1] - past_n_days - future_n_days
+    if n_samples <= 0:
+        return np.empty((0, bars.shape[0], past_n_days), dtype=dtype), np.empty((0, 1), dtype=dtype)
+
+    # inputs: open, high, low, close and volume
+    windows = sliding_window_view(bars, past_n_days, axis=1)[:, :n_samples]
+    x = np.ascontiguousarray(windows.transpose(1, 0, 2), dtype=dtype)
+
+    # output: standard deviation of the daily returns over the next future_n_days closes
+    # (the same operations as pd.Series.pct_change().dropna().std())
+    close = bars[3]
+    future = sliding_window_view(close[past_n_days:], future_n_days)[:n_samples]
+    returns = np.ascontiguousarray(future[:, 1:] / future[:, :-1] - 1)
+    y = returns.std(axis=1, ddof=1)[:, np.newaxis].astype(dtype, copy=False)
+    return x, y
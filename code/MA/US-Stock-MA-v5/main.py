@@ -1,5 +1,7 @@
 from AlgorithmImports import *
 from datetime import datetime, timedelta
+from turningpoints import TurningPointDetector
+from dailycache import DailyCache
 
 
 # Version 5 of the algorithm in the US stock market. 
@@ -41,6 +43,14 @@ class StockMA(QCAlgorithm):
         ### End Parameters
 
 
+        # (v5) detector of the peaks and troughs for the dynamic MA
+        self.turningPoints = TurningPointDetector(self.n_days, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+        # (v5) cache of the quantities derived from daily data, recalculated once per daily bar
+        self.dailyCache = DailyCache()
+        self.lastDailyBarTime = None
+        self.Consolidate(self.symbol, Resolution.Daily, self.OnDailyBar)
+
         self.upperlinepos = ""
         self.lowerlinepos = ""
         self.cur_purchaseprice = 0
@@ -50,22 +60,18 @@ class StockMA(QCAlgorithm):
 
 
 
-    def OnData(self, slice:Slice):
-        '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
+    def OnDailyBar(self, bar: TradeBar):
+        '''Event handler of the daily consolidator. Records the time of the completed daily bar. 
         Arguments:
-            data: Slice object keyed by symbol containing the stock data
+            bar: The consolidated daily bar
         '''
+        self.lastDailyBarTime = bar.EndTime
 
-        # first, check the existence of the data
-        if self.symbol in slice.Bars:
-            trade_bar = slice.Bars[self.symbol]
-            price = trade_bar.Close
-            high = trade_bar.High
-            low = trade_bar.Low
-        # if data does not exist, exit this function
-        else:
-            return
-        
+    def CalculateMA(self):
+        '''Calculates the dynamic moving average of the underlying from the daily closes. 
+
+        Returns: The moving average, or None if the data is incomplete. 
+        '''
         # obtain the past history of the underlying
         df = self.History(self.symbol, self.n_days, Resolution.Daily)
         # self.Log(f"{'close' in df} {df.shape[0]}")
@@ -76,83 +82,9 @@ class StockMA(QCAlgorithm):
 
         ### (v5) Analysis to calculate MA (dynamic MA)
         # dynamic MA is calculated based on the number of peaks and troughs
-
-        # identify the peaks
-        lastmax = 0
-        lastmaxindex = 0
-        reset = True
-        high_points = []
-        low_points = []
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].max()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax > lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            high_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax < lastmax:
-                        high_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 0
-                    reset = True
-
-        # identify the troughs
-        lastmax = 1000000000
-        lastmaxindex = 0
-        reset = True
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].min()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax < lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 1000000000:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            low_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax > lastmax:
-                        low_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 1000000000
-                    reset = True
-
-        high_diff = []
-        if len(high_points) >= 2:
-            for i in range(1,len(high_points)):
-                high_diff.append(high_points[i]-high_points[i-1])
-
-        low_diff = []
-        if len(low_points) >= 2:
-            for i in range(1,len(low_points)):
-                low_diff.append(low_points[i]-low_points[i-1])
-        
-        if len(high_diff) == 0:
-            high_MA = self.default_MA
-        else:
-            high_MA = sum(high_diff) / len(high_diff)
-
-        if len(low_diff) == 0:
-            low_MA = self.default_MA
-        else:
-            low_MA = sum(low_diff) / len(low_diff)
-        
-        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
-
-        if final_MA < self.min_MA:
-            final_MA = self.min_MA
+        # the detector only consumes the daily closes which it has not seen before
+        self.turningPoints.sync(df.index.get_level_values("time"), df["close"].values)
+        final_MA = self.turningPoints.final_MA
 
         ### end of dynamic MA calculation
 
@@ -160,6 +92,37 @@ class StockMA(QCAlgorithm):
         
         # calculate the moving average of the underlying
         MA = df['close'].mean()
+        return MA
+
+    def CalculateVolatility(self):
+        '''Calculates the past volatility of the underlying to determine the width of the MA bands. 
+
+        Returns: The past volatility to open trades and the past volatility to close trades. 
+        '''
+        df3 = self.History(self.symbol, self.volatility_n_days, Resolution.Daily)
+        df4 = self.History(self.symbol, self.close_volatility_n_days, Resolution.Daily)
+        return df3['close'].pct_change().dropna().std(), df4['close'].pct_change().dropna().std()
+
+    def OnData(self, slice:Slice):
+        '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
+        Arguments:
+            data: Slice object keyed by symbol containing the stock data
+        '''
+
+        # first, check the existence of the data
+        if self.symbol in slice.Bars:
+            trade_bar = slice.Bars[self.symbol]
+            price = trade_bar.Close
+            high = trade_bar.High
+            low = trade_bar.Low
+        # if data does not exist, exit this function
+        else:
+            return
+        
+        # (v5) the dynamic MA only changes when a new daily bar is completed
+        MA = self.dailyCache.get(self.lastDailyBarTime, "MA", self.CalculateMA)
+        if MA is None:
+            return
 
         # the same pair of MA bands is used to close trades
         close_MA = MA
@@ -167,17 +130,14 @@ class StockMA(QCAlgorithm):
         # obtain the past volatility of the underlying stock
         quantity = self.Portfolio[self.symbol].Quantity
 
-        # obtain the past volatility of the underlying stock
-        df3 = self.History(self.symbol, self.volatility_n_days, Resolution.Daily)
+        # obtain the past volatility of the underlying stock, only once per daily bar
+        volatility, close_volatility = self.dailyCache.get(self.lastDailyBarTime, "volatility", self.CalculateVolatility)
 
         # determine the width of the MA bands based on past volatility
-        self.percent_above = df3['close'].pct_change().dropna().std() * self.volatility_coefficient
-        
-        # obtain the past volatility of the underlying stock
-        df4 = self.History(self.symbol, self.close_volatility_n_days, Resolution.Daily)
+        self.percent_above = volatility * self.volatility_coefficient
         
         # determine the width of the MA bands based on past volatility to close trades
-        self.close_above = df4['close'].pct_change().dropna().std() * self.close_volatility_coefficient
+        self.close_above = close_volatility * self.close_volatility_coefficient
 
         # check for conditions to close the position and execute market orders
         # the MA bands are used to close the positions in this version
@@ -252,3 +212,7 @@ class StockMA(QCAlgorithm):
             self.lowerlinepos = "Lower"
         else:
             self.lowerlinepos = "Upper"
+
+    def OnEndOfAlgorithm(self):
+        '''Logs the hit and miss counts of the daily cache at the end of the algorithm. '''
+        self.Log(f"Daily cache: {self.dailyCache.hits} hits, {self.dailyCache.misses} misses, hit ratio {self.dailyCache.hit_ratio():.3f}")
@@ -0,0 +1,47 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+
+
+# a cache of the quantities derived from daily data, which only change when a new daily bar is completed
+class DailyCache:
+    def __init__(self):
+        '''Initializer method. '''
+        # name -> (key, value)
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, name: str, calculate):
+        '''Obtains a cached quantity, or calculates it if the key has changed since the last calculation.
+
+        Arguments:
+            key: The key of the quantity, usually the time of the last completed daily bar.
+            name: The name of the quantity.
+            calculate: A function without arguments which calculates the quantity.
+
+        Returns: The (cached) value of the quantity, or None if the calculation fails.
+        '''
+        entry = self.values.get(name)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = calculate()
+        # a failed calculation (None) is not cached, so that it is retried on the next request, e.g. after an incomplete history
+        if value is not None:
+            self.values[name] = (key, value)
+        return value
+
+    def invalidate(self, name: str):
+        '''Discards a cached quantity, so that it is recalculated on the next request.
+
+        Arguments:
+            name: The name of the quantity.
+        '''
+        self.values.pop(name, None)
+
+    def hit_ratio(self) -> float:
+        '''Calculates the proportion of the requests served from the cache. '''
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0
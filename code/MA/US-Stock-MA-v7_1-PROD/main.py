@@ -5,6 +5,14 @@ from keras.layers import Dense, LSTM, Dropout, GRU, Bidirectional
 import pandas as pd
 import numpy as np
 from keras.optimizers import SGD
+from turningpoints import TurningPointDetector
+from dailybars import DailyBarBuffer
+from dailycache import DailyCache
+from trainingset import build_training_set
+from lstminference import KerasInference, PredictionTable, benchmark_inference, daily_windows, export_inference
+from checkpoints import CheckpointStore, checkpoint_key
+from asyncretrain import AsyncRetrainer
+from pasttrades import PastTradesTracker
 
 
 # Version 7 of the algorithm in the cryptocurrency market. 
@@ -51,6 +59,11 @@ class StockMA(QCAlgorithm):
         #LSTM param
         self.resolution = 150
         self.retrain = 50
+        self.benchmark_inference = False # log the latency of the numpy inference engine against keras after training
+        self.async_retrain = False # retrain on a worker thread while the current model keeps serving the predictions
+        self.retrain_policy = "skip" # "skip", "queue" or "wait", if a retrain is due while the previous one is still running
+        self.precompute_inference = False # (backtest only) predict the daily bars up to the next retrain in one batch, needs the history after the current time
+        self.checkpoint_dir = None # folder of the checkpoints of the trained LSTM weights, which are loaded instead of fitting again (None: always fit)
         
 
         #v7 param
@@ -60,6 +73,26 @@ class StockMA(QCAlgorithm):
         ### End Parameters
 
 
+        # (v5) detector of the peaks and troughs for the dynamic MA
+        self.turningPoints = TurningPointDetector(self.n_days, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+        # (v7) rolling store of the daily bars, warmed up once here and fed by a daily consolidator afterwards
+        # it holds enough bars for the longest possible dynamic MA and the training window
+        longest_MA = int(max(self.n_days, self.default_MA)*self.MA_coef)
+        self.dailyBars = DailyBarBuffer(max(longest_MA, self.resolution))
+        history = self.History(self.symbol, self.dailyBars.capacity, Resolution.Daily)
+        if 'close' in history:
+            times = history.index.get_level_values("time")
+            self.dailyBars.extend(times, history["open"].values, history["high"].values, history["low"].values, history["close"].values, history["volume"].values)
+            self.turningPoints.sync(times, history["close"].values)
+        self.Consolidate(self.symbol, Resolution.Daily, self.OnDailyBar)
+
+        # (v5) cache of the quantities derived from daily data, recalculated once per daily bar
+        self.dailyCache = DailyCache()
+
+        # (v7) recent closed trades for the past trades control, fed by the order events
+        self.pastTrades = PastTradesTracker(timedelta(days=self.num_days_lookback), self.num_days_lookback*10, self.initialCash//2)
+
         self.upperlinepos = ""
         self.lowerlinepos = ""
         self.cur_purchaseprice = 0
@@ -67,57 +100,182 @@ class StockMA(QCAlgorithm):
         self.highwatermark = 0
 
         self.train = False
+        self.retrainer = AsyncRetrainer(self.retrain_policy)
+        self.predictions = PredictionTable()
+        self.checkpoints = CheckpointStore(self.checkpoint_dir)
 
-    def TrainAlgo(self):
-        '''Trains the algorithm with the deep learning model. '''
-        # obtains the past history
-        history = self.History(self.symbol, self.resolution, Resolution.Daily)
-
+    def TrainAlgo(self, background=False):
+        '''Trains the algorithm with the deep learning model. 
+        Arguments:
+            background: Whether the model is trained on a worker thread, while the current model keeps serving the predictions. Default: False
+        '''
         # if the history is incomplete, early exit the function
-        if history.shape[0] != self.resolution:
+        if self.dailyBars.count < self.resolution:
             return
-       
-        # obtain open, high, low, close and volume as the input to the model
-        open = history["open"].values
-        high = history["high"].values
-        low = history["low"].values
-        close = history["close"].values
-        volume = history["volume"].values
-        x_train = []
-        y_train = []
 
+        # obtain open, high, low, close and volume as the input to the model
+        bars = self.dailyBars.window(self.resolution)
+        end = self.dailyBars.last_time
         # inputs: open, high, low, close and volume
         # output: future volatility after self.past_volatility_n_days
-        for i in range(self.past_volatility_n_days,len(close)-self.volatility_n_days):
-            x_train.append([open[i-self.past_volatility_n_days:i],high[i-self.past_volatility_n_days:i],low[i-self.past_volatility_n_days:i],close[i-self.past_volatility_n_days:i],volume[i-self.past_volatility_n_days:i]])
-            y_train.append([pd.DataFrame({"Close":close[i:i+self.volatility_n_days]})["Close"].pct_change().dropna().std()])
-
-        x_train = np.array(x_train)
-        y_train = np.array(y_train)
+        x_train, y_train = build_training_set(bars, self.past_volatility_n_days, self.volatility_n_days)
 
         # create an instance of the model and build its architecture
-        self.regressorLSTM = Sequential()
+        model = Sequential()
         # First LSTM layer
-        self.regressorLSTM.add(LSTM(units=256, return_sequences=True, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
-        self.regressorLSTM.add(Dropout(0.2))
+        model.add(LSTM(units=256, return_sequences=True, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
+        model.add(Dropout(0.2))
         # Second LSTM layer
-        self.regressorLSTM.add(LSTM(units=128, return_sequences=True, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
-        self.regressorLSTM.add(Dropout(0.2))
+        model.add(LSTM(units=128, return_sequences=True, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
+        model.add(Dropout(0.2))
         # Third LSTM layer
-        self.regressorLSTM.add(LSTM(units=64, return_sequences=False, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
-        self.regressorLSTM.add(Dropout(0.2))
+        model.add(LSTM(units=64, return_sequences=False, input_shape=(x_train.shape[1],self.past_volatility_n_days)))
+        model.add(Dropout(0.2))
         # The output layer
-        self.regressorLSTM.add(Dense(units=1))
+        model.add(Dense(units=1))
         # Compiling the LSTM model
-        self.regressorLSTM.compile(optimizer=SGD(learning_rate=0.001, momentum=0.9, nesterov=False),loss='mean_squared_error')
+        model.compile(optimizer=SGD(learning_rate=0.001, momentum=0.9, nesterov=False),loss='mean_squared_error')
+        if background:
+            # the new model is swapped in by OnData once the training on the worker thread completes
+            def train():
+                self.FitModel(model, x_train, y_train, end, epochs=25,validation_split=0.1,batch_size=150,verbose=0)
+                return model, export_inference(model, x_train[-10:])
+            self.retrainer.submit(train)
+            self.lasttraintime = self.Time
+            return
+
         # Fitting to the training set
-        self.regressorLSTM.fit(x_train,y_train,epochs=25,validation_split=0.1,batch_size=150)
+        self.FitModel(model, x_train, y_train, end, epochs=25,validation_split=0.1,batch_size=150)
+        self.regressorLSTM = model
+        # export the trained weights to the numpy inference engine, which falls back to keras if its predictions differ
+        self.inferenceLSTM = export_inference(self.regressorLSTM, x_train[-10:])
+        self.LogInference()
+        self.PrecomputeVolatility(self.Time + timedelta(days=self.retrain+1))
+        if self.benchmark_inference:
+            self.Log(f"LSTM inference latency: {benchmark_inference(self.regressorLSTM, self.inferenceLSTM, x_train[-1:])}")
 
         self.train = True
+        self.dailyCache.invalidate("y_predict")
         self.lasttraintime = self.Time
         return
 
 
+    def FitModel(self, model, x_train: np.array, y_train: np.array, end: datetime, previous=None, **fit_args) -> str:
+        '''Fits the model to the training set, or loads its weights from the checkpoint store if it has been trained
+        on the same window with the same hyperparameters before. The weights are saved to the store after each fit. 
+        Arguments:
+            model: The compiled model
+            x_train, y_train: The training set
+            end: The time of the last daily bar of the training window
+            previous: The key of the weights which are retrained, for the progressive retrain. Default: None
+            fit_args: The arguments of model.fit
+
+        Returns: The key of the weights in the checkpoint store. 
+        '''
+        optimizer = model.optimizer.get_config()
+        hyperparameters = {
+            "layers": [(type(layer).__name__, layer.get_config().get("units"), layer.get_config().get("rate")) for layer in model.layers],
+            "optimizer": (type(model.optimizer).__name__, optimizer.get("learning_rate"), optimizer.get("momentum"), optimizer.get("nesterov")),
+            "fit": {name: value for name, value in fit_args.items() if name != "verbose"},
+            "data": (x_train.shape, self.past_volatility_n_days, self.volatility_n_days),
+            "previous": previous,
+        }
+        key = checkpoint_key(self.instrument, end, hyperparameters)
+        weights = self.checkpoints.Read(key)
+        if weights is not None:
+            model.set_weights(weights)
+            self.Log(f"LSTM weights loaded from the checkpoint {key}")
+            return key
+        model.fit(x_train, y_train, **fit_args)
+        self.checkpoints.Save(key, model.get_weights())
+        return key
+
+    def OnDailyBar(self, bar: TradeBar):
+        '''Event handler of the daily consolidator. Stores the completed daily bar and updates the dynamic MA. 
+        Arguments:
+            bar: The consolidated daily bar
+        '''
+        if self.dailyBars.add(bar.EndTime, bar.Open, bar.High, bar.Low, bar.Close, bar.Volume):
+            self.turningPoints.update(bar.Close, bar.EndTime)
+
+    def CalculateMA(self):
+        '''Calculates the dynamic moving average of the underlying from the daily closes. 
+
+        Returns: The moving average, or None if the data is incomplete. 
+        '''
+        # if data is incomplete, exit the function
+        if self.dailyBars.count < self.n_days:
+            return
+
+        ### (v5) Analysis to calculate MA
+        # dynamic MA is calculated based on the number of peaks and troughs
+        # the detector is fed by the daily consolidator
+        final_MA = self.turningPoints.final_MA
+
+        ### end of dynamic MA calculation
+
+        # calculate the moving average of the underlying
+        MA = self.dailyBars.last(final_MA).mean()
+        return MA
+
+    def PredictVolatility(self):
+        '''Predicts the future volatility of the underlying with the deep learning model. 
+
+        Returns: The predicted future volatility, or None if the prediction fails. 
+        '''
+        # use the prediction calculated in one batch after the last (re)train, if it covers the current daily bar
+        if self.precompute_inference:
+            # the model may be kept after the predicted period, e.g. if a retrain is skipped
+            if self.predictions.expired(self.Time):
+                self.PrecomputeVolatility(self.Time + timedelta(days=self.retrain+1))
+            y_predict = self.predictions.get(self.dailyBars.last_time)
+            if y_predict is not None:
+                return y_predict[np.newaxis]
+
+        # obtain the recent open, high, low, close and volume data for model prediction
+        x_test = self.dailyBars.window(self.past_volatility_n_days)[np.newaxis]
+        
+        # predict the future volatility
+        try:
+            y_predict = self.inferenceLSTM.predict(x_test)
+        except:
+            return
+        return y_predict
+
+    def PrecomputeVolatility(self, until: datetime):
+        '''Predicts the future volatility of the underlying for every daily bar up to the next retrain, in one forward pass. 
+        It is only used in backtests, as it requests the daily bars after the current time. 
+        Arguments:
+            until: The time of the next retrain
+        '''
+        if not self.precompute_inference or self.LiveMode:
+            return
+
+        # the daily bars from a few days before the current time, so that the input of the current day is also covered
+        start = self.Time - timedelta(days=3*self.past_volatility_n_days)
+        history = self.History(self.symbol, start, until, Resolution.Daily)
+        x_test, keys = None, []
+        if 'close' in history:
+            x_test, keys = daily_windows(history[["open", "high", "low", "close", "volume"]].values.T, history.index.get_level_values("time"), self.past_volatility_n_days)
+        self.predictions.fill(self.inferenceLSTM, x_test, keys, until)
+
+    def CountPastLosses(self, price: float) -> int:
+        '''Calculates the number of recent trades which incur losses net the number of recent trades which are profitable. 
+
+        Arguments:
+            price: The current price of the underlying. 
+
+        Returns: The net number of losing trades, floored at zero. 
+        '''
+        # only the trades closed within self.num_days_lookback days, among the last self.num_days_lookback*10 trades,
+        # with a value of at least half of the initial cash are counted
+        return self.pastTrades.pnl_count(self.UtcTime, price)
+
+    def LogInference(self):
+        '''Logs the reason if the LSTM model is not exported to the numpy inference engine, so that keras is used for its predictions. '''
+        if isinstance(self.inferenceLSTM, KerasInference):
+            self.Log(f"LSTM inference with keras: {self.inferenceLSTM.reason}")
+
     def OnData(self, slice:Slice):
         '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
         Arguments:
@@ -134,10 +292,21 @@ class StockMA(QCAlgorithm):
         else:
             return
 
+        # swap in the model retrained on the worker thread, if its training has completed
+        retrained = self.retrainer.poll()
+        if retrained is not None:
+            self.regressorLSTM, self.inferenceLSTM = retrained
+            self.LogInference()
+            self.PrecomputeVolatility(self.lasttraintime + timedelta(days=self.retrain+1))
+            self.dailyCache.invalidate("y_predict")
+
         # if it is time for a retrain
         # we train the model
         if self.train and self.lasttraintime + timedelta(days=self.retrain) < self.Time:
-            self.train = False
+            if self.async_retrain:
+                self.TrainAlgo(background=True)
+            else:
+                self.train = False
         
         # if the model is not trained or it is time for a retrain
         # we first train the model
@@ -146,138 +315,27 @@ class StockMA(QCAlgorithm):
             if not self.train:
                 return
         
-        # obtain the past history of the underlying
-        df = self.History(self.symbol, self.n_days, Resolution.Daily)
-        # self.Log(f"{'close' in df} {df.shape[0]}")
-
-        # if data is incomplete, exit the function
-        if 'close' not in df or df.shape[0] != self.n_days:
+        # (v5) the dynamic MA only changes when a new daily bar is completed
+        MA = self.dailyCache.get(self.dailyBars.last_time, "MA", self.CalculateMA)
+        if MA is None:
             return
 
-        ### (v5) Analysis to calculate MA
-        # dynamic MA is calculated based on the number of peaks and troughs
-
-        # identify the peaks
-        lastmax = 0
-        lastmaxindex = 0
-        reset = True
-        high_points = []
-        low_points = []
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].max()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax > lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            high_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax < lastmax:
-                        high_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 0
-                    reset = True
-
-        # identify the troughs
-        lastmax = 1000000000
-        lastmaxindex = 0
-        reset = True
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].min()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax < lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 1000000000:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            low_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax > lastmax:
-                        low_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 1000000000
-                    reset = True
-
-        high_diff = []
-        if len(high_points) >= 2:
-            for i in range(1,len(high_points)):
-                high_diff.append(high_points[i]-high_points[i-1])
-
-        low_diff = []
-        if len(low_points) >= 2:
-            for i in range(1,len(low_points)):
-                low_diff.append(low_points[i]-low_points[i-1])
-        
-        if len(high_diff) == 0:
-            high_MA = self.default_MA
-        else:
-            high_MA = sum(high_diff) / len(high_diff)
-
-        if len(low_diff) == 0:
-            low_MA = self.default_MA
-        else:
-            low_MA = sum(low_diff) / len(low_diff)
-        
-        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
-
-        if final_MA < self.min_MA:
-            final_MA = self.min_MA
-
-        ### end of dynamic MA calculation
-
-        df = self.History(self.symbol, final_MA, Resolution.Daily)
-        # calculate the moving average of the underlying
-        MA = df['close'].mean()
-
         # the same pair of MA bands is used to close trades
         close_MA = MA
 
         quantity = self.Portfolio[self.symbol].Quantity
 
-        # obtain the past price data of the underlying stock
-        df3 = self.History(self.symbol, self.past_volatility_n_days, Resolution.Daily)
-
-        # obtain the recent open, high, low, close and volume data for model prediction
-        open = df3["open"].values
-        high = df3["high"].values
-        low = df3["low"].values
-        close = df3["close"].values
-        volume = df3["volume"].values
-
-        x_test = np.array([[open,high,low,close,volume]])
-        
-        # predict the future volatility
-        try:
-            y_predict = self.regressorLSTM.predict(x_test)
-        except:
+        # predict the future volatility, only once per daily bar as the model inputs are daily bars
+        y_predict = self.dailyCache.get(self.dailyBars.last_time, "y_predict", self.PredictVolatility)
+        if y_predict is None:
             return
         # y_predict = np.squeeze(y_predict)
         # self.Log(y_predict)
 
         ### (v7) Past trades control
         # calculates the number of trades which incur losses net the number of trades which is profitable
-        trades = self.TradeBuilder.ClosedTrades
-        trades = trades[-min(len(trades),self.num_days_lookback*10):]
-        pnl_count = 0 #+ve: loss
-        for trade in trades:
-            if trade.ExitTime > self.UtcTime - timedelta(days=self.num_days_lookback) and trade.Quantity*price >= self.initialCash//2:
-                if not trade.IsWin:
-                    pnl_count += 1
-                else:
-                    pnl_count -= 1
-                
-        pnl_count = max(pnl_count,0)
+        # it is calculated on every bar rather than cached with the daily quantities, as it depends on the current price and the lookback of the trades
+        pnl_count = self.CountPastLosses(price)
         ### End (v7)
 
         # determine the width of the MA bands based on future volatility prediction of the LSTM model adjusted by the no. of trades which incur losses
@@ -361,3 +419,22 @@ class StockMA(QCAlgorithm):
             self.lowerlinepos = "Lower"
         else:
             self.lowerlinepos = "Upper"
+
+    def OnOrderEvent(self, orderEvent: OrderEvent):
+        '''OnOrder event is an entry point which processes an order. 
+        Arguments:
+            orderEvent: OrderEvent object containing the order details. 
+        '''
+        # (v7) the trades closed by the fill are added to the past trades control
+        if orderEvent.Status == OrderStatus.Filled or orderEvent.Status == OrderStatus.PartiallyFilled:
+            self.pastTrades.sync(self.TradeBuilder.ClosedTrades)
+
+    def OnEndOfAlgorithm(self):
+        '''Logs the hit and miss counts of the daily cache at the end of the algorithm. '''
+        self.Log(f"Daily cache: {self.dailyCache.hits} hits, {self.dailyCache.misses} misses, hit ratio {self.dailyCache.hit_ratio():.3f}")
+        if self.checkpoint_dir is not None:
+            self.Log(f"LSTM checkpoints: {self.checkpoints.summary()}")
+        if self.precompute_inference:
+            self.Log(f"Precomputed predictions: {self.predictions.hits} hits, {self.predictions.misses} misses")
+        if self.async_retrain:
+            self.Log(f"Asynchronous retrains: {self.retrainer.completed} completed, {self.retrainer.skipped} skipped")
@@ -0,0 +1,273 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+from collections import deque
+import numpy as np
+
+
+# a stateful detector of the peaks and troughs used to calculate the dynamic MA (v5)
+class TurningPointDetector:
+    def __init__(self, n_days: int, rolling_window: int, rolling_reset: int, default_MA: int, MA_coef: float, min_MA: int):
+        '''Initializer method.
+
+        Arguments:
+            n_days: The number of daily closes used to identify the peaks and troughs (= max MA).
+            rolling_window: The rolling window (in days) of the local maximum and minimum.
+            rolling_reset: The number of days without a new extremum before a turning point is confirmed.
+            default_MA: The MA used when less than two peaks or troughs are identified.
+            MA_coef: The coefficient applied to the average distance between the turning points.
+            min_MA: The minimum MA.
+        '''
+        self.n_days = n_days
+        self.rolling_window = rolling_window
+        self.rolling_reset = rolling_reset
+        self.default_MA = default_MA
+        self.MA_coef = MA_coef
+        self.min_MA = min_MA
+
+        # the number of daily closes consumed and the time of the last one
+        self.count = 0
+        self.last_time = None
+
+        # monotonic deques of (index, close), the front holds the extremum of the current rolling window
+        self.max_deque = deque()
+        self.min_deque = deque()
+
+        # rolling maximum and minimum of the last n_days closes
+        self.rolling_max = deque(maxlen=n_days)
+        self.rolling_min = deque(maxlen=n_days)
+
+        self.high_points = []
+        self.low_points = []
+        self.final_MA = None
+
+    def batch_final_MA(self, closes: np.array) -> np.array:
+        '''Calculates the dynamic MA of many securities at once with the parameters of this detector.
+
+        Arguments:
+            closes: A numpy array of shape (n_symbols, n_days) of the last n_days daily closes of each security.
+
+        Returns: A numpy array of the number of days of the dynamic MA of each security.
+        '''
+        return batch_final_MA(closes, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+    def is_ready(self) -> bool:
+        '''Determines whether enough daily closes are consumed to calculate the dynamic MA. '''
+        return len(self.rolling_max) == self.n_days
+
+    def sync(self, times, closes):
+        '''Consumes the daily closes which are newer than the last consumed close.
+
+        Arguments:
+            times: The times of the daily bars, in ascending order.
+            closes: The closing prices of the daily bars.
+        '''
+        # the new daily closes can only be found at the end of the history
+        k = len(times)
+        while k > 0 and (self.last_time is None or times[k-1] > self.last_time):
+            k -= 1
+        for j in range(k, len(times)):
+            self.update(closes[j], times[j])
+
+    def update(self, close: float, time=None):
+        '''Consumes one new daily close and updates the turning points and the dynamic MA.
+
+        Arguments:
+            close: The new daily closing price.
+            time: The time of the daily bar. Default: None.
+        '''
+        index = self.count
+        self.count += 1
+        self.last_time = time
+
+        # the rolling window of the close at index covers the closes from index-rolling_window to index
+        while self.max_deque and self.max_deque[-1][1] <= close:
+            self.max_deque.pop()
+        self.max_deque.append((index, close))
+        while self.max_deque[0][0] < index - self.rolling_window:
+            self.max_deque.popleft()
+
+        while self.min_deque and self.min_deque[-1][1] >= close:
+            self.min_deque.pop()
+        self.min_deque.append((index, close))
+        while self.min_deque[0][0] < index - self.rolling_window:
+            self.min_deque.popleft()
+
+        self.rolling_max.append(self.max_deque[0][1])
+        self.rolling_min.append(self.min_deque[0][1])
+
+        if self.is_ready():
+            self.high_points = self.find_peaks()
+            self.low_points = self.find_troughs()
+            self.final_MA = self.calculate_final_MA()
+
+    def find_peaks(self) -> list:
+        '''Identifies the peaks within the last n_days closes.
+
+        Returns: A list of indices of the peaks, relative to the first close of the window.
+        '''
+        rolling_max = list(self.rolling_max)
+        n = len(rolling_max)
+        lastmax = 0
+        lastmaxindex = 0
+        reset = True
+        high_points = []
+        # the windows which are truncated by the start of the history do not give any extremum
+        for i in range(max(5, self.rolling_window), n):
+            curmax = rolling_max[i]
+            if curmax > lastmax:
+                if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
+                    lastmaxindex = i
+                    lastmax = curmax
+                else:
+                    if not reset:
+                        high_points.append(lastmaxindex)
+                    lastmaxindex = i
+                    lastmax = curmax
+                    reset = False
+            if i - lastmaxindex > self.rolling_reset or i == n-1:
+                if not reset or curmax < lastmax:
+                    high_points.append(lastmaxindex)
+                lastmaxindex = 0
+                lastmax = 0
+                reset = True
+        return high_points
+
+    def find_troughs(self) -> list:
+        '''Identifies the troughs within the last n_days closes.
+
+        Returns: A list of indices of the troughs, relative to the first close of the window.
+        '''
+        rolling_min = list(self.rolling_min)
+        n = len(rolling_min)
+        lastmin = 1000000000
+        lastminindex = 0
+        reset = True
+        low_points = []
+        for i in range(max(5, self.rolling_window), n):
+            curmin = rolling_min[i]
+            if curmin < lastmin:
+                if lastminindex >= i - self.rolling_window or lastminindex == 1000000000:
+                    lastminindex = i
+                    lastmin = curmin
+                else:
+                    if not reset:
+                        low_points.append(lastminindex)
+                    lastminindex = i
+                    lastmin = curmin
+                    reset = False
+            if i - lastminindex > self.rolling_reset or i == n-1:
+                if not reset or curmin > lastmin:
+                    low_points.append(lastminindex)
+                lastminindex = 0
+                lastmin = 1000000000
+                reset = True
+        return low_points
+
+    def calculate_final_MA(self) -> int:
+        '''Calculates the dynamic MA from the average distance between the turning points.
+
+        Returns: The number of days of the dynamic MA.
+        '''
+        # the average of the differences between consecutive turning points
+        if len(self.high_points) < 2:
+            high_MA = self.default_MA
+        else:
+            high_MA = (self.high_points[-1] - self.high_points[0]) / (len(self.high_points) - 1)
+
+        if len(self.low_points) < 2:
+            low_MA = self.default_MA
+        else:
+            low_MA = (self.low_points[-1] - self.low_points[0]) / (len(self.low_points) - 1)
+
+        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
+
+        if final_MA < self.min_MA:
+            final_MA = self.min_MA
+        return final_MA
+
+
+def rolling_extremum(values: np.array, window: int, function) -> np.array:
+    '''Calculates the rolling maximum or minimum along the rows, by doubling the window in each pass.
+
+    Arguments:
+        values: A numpy array of shape (n_rows, n).
+        window: The length of the rolling window.
+        function: np.maximum or np.minimum.
+
+    Returns: A numpy array of shape (n_rows, n-window+1), the extremum of values[:, j:j+window] in column j.
+    '''
+    result = values.copy()
+    span = 1
+    while span < window:
+        step = min(span, window - span)
+        result[:, step:] = function(result[:, step:], result[:, :-step])
+        span += step
+    return result[:, window-1:]
+
+
+def batch_final_MA(closes: np.array, rolling_window: int, rolling_reset: int, default_MA: int, MA_coef: float, min_MA: int) -> np.array:
+    '''Calculates the dynamic MA of many securities at once, with the same result as a TurningPointDetector
+    which has consumed the closes of each security. The rolling maxima and minima are calculated for all the
+    securities with numpy, and the peaks and troughs are scanned day by day with the state of all the securities
+    in arrays, so the number of numpy calls only depends on the number of days.
+
+    Arguments:
+        closes: A numpy array of shape (n_symbols, n_days) of the last n_days daily closes of each security.
+        rolling_window: The rolling window (in days) of the local maximum and minimum.
+        rolling_reset: The number of days without a new extremum before a turning point is confirmed.
+        default_MA: The MA used when less than two peaks or troughs are identified.
+        MA_coef: The coefficient applied to the average distance between the turning points.
+        min_MA: The minimum MA.
+
+    Returns: A numpy array of the number of days of the dynamic MA of each security.
+    '''
+    closes = np.asarray(closes, dtype=np.float64)
+    n_symbols, n = closes.shape
+    first = max(5, rolling_window)
+    if n <= first:
+        return np.full(n_symbols, max(int(default_MA * MA_coef), min_MA), dtype=np.int64)
+
+    # the peaks of the rolling maxima in the first n_symbols rows, and the troughs of the rolling minima
+    # in the other rows, which are negated so that both are scanned for new maxima
+    # the rolling window of day i is the row i-rolling_window, the days are in rows so that each day is contiguous
+    rolling = np.concatenate([rolling_extremum(closes, rolling_window + 1, np.maximum),
+                              -rolling_extremum(closes, rolling_window + 1, np.minimum)]).T.copy()
+    offset = rolling_window
+    rows = 2 * n_symbols
+    initial = np.concatenate([np.zeros(n_symbols), np.full(n_symbols, -1000000000.0)])
+    # an index of 0 means that no peak is being tracked, which the troughs do not check (as in find_troughs)
+    peak = np.arange(rows) < n_symbols
+
+    last = initial.copy()
+    last_index = np.zeros(rows, dtype=np.int64)
+    reset = np.ones(rows, dtype=bool)
+    # only the first and the last turning points and their count determine the average distance
+    first_point = np.zeros(rows, dtype=np.int64)
+    last_point = np.zeros(rows, dtype=np.int64)
+    count = np.zeros(rows, dtype=np.int64)
+
+    def append(mask, index):
+        np.copyto(first_point, index, where=mask & (count == 0))
+        np.copyto(last_point, index, where=mask)
+        count[mask] += 1
+
+    for i in range(first, n):
+        current = rolling[i - offset]
+        higher = current > last
+        keep = higher & ((last_index >= i - rolling_window) | (peak & (last_index == 0)))
+        new = higher ^ keep
+        append(new & ~reset, last_index)
+        np.copyto(last_index, i, where=higher)
+        np.copyto(last, current, where=higher)
+        reset &= ~new
+
+        end = (i - last_index > rolling_reset) if i < n - 1 else np.ones(rows, dtype=bool)
+        append(end & (~reset | (current < last)), last_index)
+        np.copyto(last_index, 0, where=end)
+        np.copyto(last, initial, where=end)
+        reset |= end
+
+    distance = np.where(count >= 2, (last_point - first_point) / np.maximum(count - 1, 1), default_MA)
+    final_MA = ((distance[:n_symbols] + distance[n_symbols:]) / 2 * MA_coef).astype(np.int64)
+    return np.maximum(final_MA, min_MA)
@@ -0,0 +1,113 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import hashlib
+import json
+import os
+import numpy as np
+
+
+def checkpoint_key(symbol: str, end, hyperparameters: dict) -> str:
+    '''Builds the key of the weights of a model trained on a window of daily bars.
+
+    Arguments:
+        symbol: The symbol (or symbols) of the training data.
+        end: The time of the last daily bar of the training window.
+        hyperparameters: The hyperparameters of the model and its training, and anything else the weights depend on,
+            e.g. the key of the weights which are retrained.
+
+    Returns: A key of the form <symbol>_<yyyymmdd>_<hash of the hyperparameters>.
+    '''
+    digest = hashlib.sha1(json.dumps(hyperparameters, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f"{symbol}_{end:%Y%m%d}_{digest}"
+
+
+# a store of the weights of trained models in local files, with the method names of the QuantConnect ObjectStore
+# the least recently used checkpoints are evicted when the store is full
+class CheckpointStore:
+    def __init__(self, directory=None, max_checkpoints=20):
+        '''Initializer method.
+
+        Arguments:
+            directory: The folder of the checkpoint files, or None to disable the store (nothing is read or saved). Default: None.
+            max_checkpoints: The maximum number of checkpoints kept in the folder. Default: 20.
+        '''
+        self.directory = directory
+        self.max_checkpoints = max_checkpoints
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self.evictions = 0
+
+    def GetFilePath(self, key: str) -> str:
+        '''Obtains the path of the file of a checkpoint. '''
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def ContainsKey(self, key: str) -> bool:
+        '''Determines whether a checkpoint is stored. '''
+        return self.directory is not None and os.path.exists(self.GetFilePath(key))
+
+    def Read(self, key: str) -> list:
+        '''Loads the weights of a checkpoint.
+
+        Arguments:
+            key: The key of the checkpoint.
+
+        Returns: The list of weight arrays in the order of model.get_weights(), or None if the checkpoint is not stored.
+        '''
+        if self.directory is None:
+            return
+        if not self.ContainsKey(key):
+            self.misses += 1
+            return
+        path = self.GetFilePath(key)
+        with np.load(path) as data:
+            weights = [data[f"arr_{i}"] for i in range(len(data.files))]
+        # the modification time orders the checkpoints by their last use
+        os.utime(path)
+        self.hits += 1
+        return weights
+
+    def Save(self, key: str, weights: list):
+        '''Saves the weights of a trained model, and evicts the least recently used checkpoints if the store is full.
+
+        Arguments:
+            key: The key of the checkpoint.
+            weights: The list of weight arrays, i.e. model.get_weights().
+        '''
+        if self.directory is None:
+            return
+        path = self.GetFilePath(key)
+        # the weights are written to a temporary file first, so that a partially written checkpoint is never read
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, *weights)
+        os.replace(temp_path, path)
+        self.saves += 1
+        self.evict()
+
+    def Delete(self, key: str) -> bool:
+        '''Deletes a checkpoint.
+
+        Returns: A boolean value indicating whether the checkpoint was stored.
+        '''
+        if not self.ContainsKey(key):
+            return False
+        os.remove(self.GetFilePath(key))
+        return True
+
+    def evict(self):
+        '''Deletes the least recently used checkpoints beyond max_checkpoints. '''
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        if len(paths) <= self.max_checkpoints:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_checkpoints]:
+            os.remove(path)
+            self.evictions += 1
+
+    def summary(self) -> str:
+        '''Summarises the lookups and evictions of the store. '''
+        return f"{self.hits} hits, {self.misses} misses, {self.saves} saves, {self.evictions} evictions"
@@ -0,0 +1,164 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+
+
+# a fixed-capacity ring buffer of the daily open, high, low, close and volume
+class DailyBarBuffer:
+    FIELDS = ["open", "high", "low", "close", "volume"]
+
+    def __init__(self, capacity: int):
+        '''Initializer method.
+
+        Arguments:
+            capacity: The maximum number of daily bars kept in the buffer.
+        '''
+        self.capacity = capacity
+        # every bar is written twice, so that the last n bars are always contiguous in memory
+        self.bars = np.zeros((len(self.FIELDS), 2 * capacity))
+        self.head = 0
+        self.count = 0
+        self.last_time = None
+
+    def add(self, time, open: float, high: float, low: float, close: float, volume: float) -> bool:
+        '''Appends one daily bar to the buffer. Bars which are not newer than the last bar are ignored.
+
+        Arguments:
+            time: The (end) time of the daily bar.
+            open, high, low, close, volume: The prices and volume of the daily bar.
+
+        Returns: A boolean value indicating whether the bar is added.
+        '''
+        if self.last_time is not None and time <= self.last_time:
+            return False
+        values = (open, high, low, close, volume)
+        self.bars[:, self.head] = values
+        self.bars[:, self.head + self.capacity] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.last_time = time
+        return True
+
+    def extend(self, times, opens, highs, lows, closes, volumes):
+        '''Appends the daily bars of a history request to the buffer.
+
+        Arguments:
+            times: The (end) times of the daily bars, in ascending order.
+            opens, highs, lows, closes, volumes: The prices and volumes of the daily bars.
+        '''
+        for i in range(len(times)):
+            self.add(times[i], opens[i], highs[i], lows[i], closes[i], volumes[i])
+
+    def window(self, n: int) -> np.array:
+        '''Obtains the last n daily bars. Fewer bars are returned if the buffer is not yet filled.
+        The returned array is a view, so it is only valid until the next bar is added.
+
+        Arguments:
+            n: The number of daily bars.
+
+        Returns: A numpy array of shape (5, n) with the open, high, low, close and volume in rows.
+        '''
+        n = min(n, self.count)
+        end = self.head + self.capacity
+        return self.bars[:, end-n:end]
+
+    def last(self, n: int, field="close") -> np.array:
+        '''Obtains one field of the last n daily bars as a view.
+
+        Arguments:
+            n: The number of daily bars.
+            field: The field of the daily bars. Default: "close".
+
+        Returns: A numpy array containing the last n values of the field.
+        '''
+        return self.window(n)[self.FIELDS.index(field)]
+
+    def volatility(self, n: int) -> float:
+        '''Calculates the standard deviation of the daily returns of the last n closing prices.
+
+        Arguments:
+            n: The number of daily closes.
+
+        Returns: The sample standard deviation of the daily returns.
+        '''
+        close = self.last(n)
+        return np.std(close[1:] / close[:-1] - 1, ddof=1)
+
+
+# the daily bars of several securities in one array, so that their windows are obtained in one call
+class DailyBarPanel:
+    FIELDS = DailyBarBuffer.FIELDS
+
+    def __init__(self, n_symbols: int, capacity: int):
+        '''Initializer method.
+
+        Arguments:
+            n_symbols: The number of securities.
+            capacity: The maximum number of daily bars kept for each security.
+        '''
+        self.capacity = capacity
+        # every bar is written twice as in DailyBarBuffer, each security has its own position in the buffer
+        self.bars = np.zeros((n_symbols, len(self.FIELDS), 2 * capacity))
+        self.head = np.zeros(n_symbols, dtype=np.int64)
+        self.count = np.zeros(n_symbols, dtype=np.int64)
+        self.last_time = [None] * n_symbols
+        # the number of bars added to all the securities, which changes whenever a daily bar is completed
+        self.added = 0
+
+    def add(self, i: int, time, open: float, high: float, low: float, close: float, volume: float) -> bool:
+        '''Appends one daily bar of a security. Bars which are not newer than the last bar of the security are ignored.
+
+        Arguments:
+            i: The index of the security.
+            time: The (end) time of the daily bar.
+            open, high, low, close, volume: The prices and volume of the daily bar.
+
+        Returns: A boolean value indicating whether the bar is added.
+        '''
+        if self.last_time[i] is not None and time <= self.last_time[i]:
+            return False
+        values = (open, high, low, close, volume)
+        head = self.head[i]
+        self.bars[i, :, head] = values
+        self.bars[i, :, head + self.capacity] = values
+        self.head[i] = (head + 1) % self.capacity
+        self.count[i] = min(self.count[i] + 1, self.capacity)
+        self.last_time[i] = time
+        self.added += 1
+        return True
+
+    def extend(self, i: int, times, opens, highs, lows, closes, volumes):
+        '''Appends the daily bars of a history request of a security.
+
+        Arguments:
+            i: The index of the security.
+            times: The (end) times of the daily bars, in ascending order.
+            opens, highs, lows, closes, volumes: The prices and volumes of the daily bars.
+        '''
+        for j in range(len(times)):
+            self.add(i, times[j], opens[j], highs[j], lows[j], closes[j], volumes[j])
+
+    def window(self, n: int) -> np.array:
+        '''Obtains the last n daily bars of all the securities. The bars before the first bar of a security are zeros,
+        so only the last count[i] bars of the security i are valid.
+
+        Arguments:
+            n: The number of daily bars, at most the capacity.
+
+        Returns: A numpy array of shape (n_symbols, 5, n) with the open, high, low, close and volume in the second axis.
+        '''
+        n = min(n, self.capacity)
+        columns = (self.head + self.capacity)[:, np.newaxis] - n + np.arange(n)
+        return np.take_along_axis(self.bars, columns[:, np.newaxis, :], axis=2)
+
+    def last(self, n: int, field="close") -> np.array:
+        '''Obtains one field of the last n daily bars of all the securities.
+
+        Arguments:
+            n: The number of daily bars.
+            field: The field of the daily bars. Default: "close".
+
+        Returns: A numpy array of shape (n_symbols, n).
+        '''
+        return self.window(n)[:, self.FIELDS.index(field)]
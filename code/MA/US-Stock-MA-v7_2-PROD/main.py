@@ -1,10 +1,19 @@
 from AlgorithmImports import *
 from datetime import datetime, timedelta
-from keras.models import Sequential
+from keras.models import Sequential, clone_model
 from keras.layers import Dense, LSTM, Dropout, GRU, Bidirectional
 import pandas as pd
 import numpy as np
 from keras.optimizers import SGD
+from turningpoints import TurningPointDetector
+from dailybars import DailyBarPanel
+from dailycache import DailyCache
+from trainingset import build_pooled_training_set
+from lstminference import KerasInference, PredictionTable, benchmark_inference, daily_windows, export_inference
+from checkpoints import CheckpointStore, checkpoint_key
+from asyncretrain import AsyncRetrainer
+from pasttrades import PastTradesTracker
+from symbolstates import SymbolStates, UPPER, LOWER, NAMES
 
 
 # Version 7 of the algorithm in the cryptocurrency market. 
@@ -20,14 +29,15 @@ class StockMA(QCAlgorithm):
         self.SetCash(1000000)           #Set Strategy Cash
         self.initialCash = 1000000
 
-        ### Instrument
-        self.instrument = "SPY"
+        ### Instruments
+        # the securities are traded independently with the same model, each security trades an equal share of the portfolio value
+        self.instruments = ["SPY"]
 
         self.SetBrokerageModel(BrokerageName.InteractiveBrokersBrokerage, AccountType.Margin)
         self.SetBenchmark("SPY")
         
-        self.symbol = self.AddEquity(self.instrument, Resolution.Hour).Symbol
-        self.strikethrough = ""
+        self.symbols = [self.AddEquity(instrument, Resolution.Hour).Symbol for instrument in self.instruments]
+        self.symbolIndex = {symbol: i for i, symbol in enumerate(self.symbols)}
         
         ### Parameters
         self.n_days = 100 #Number of days used to calculate MA (= max MA)
@@ -54,6 +64,11 @@ class StockMA(QCAlgorithm):
         #LSTM param
         self.resolution = 200
         self.retrain = 150
+        self.benchmark_inference = False # log the latency of the numpy inference engine against keras after training
+        self.async_retrain = False # retrain on a worker thread while the current model keeps serving the predictions
+        self.retrain_policy = "skip" # "skip", "queue" or "wait", if a retrain is due while the previous one is still running
+        self.precompute_inference = False # (backtest only) predict the daily bars up to the next retrain in one batch, needs the history after the current time
+        self.checkpoint_dir = None # folder of the checkpoints of the trained LSTM weights, which are loaded instead of fitting again (None: always fit)
         
 
         #v7 param
@@ -63,40 +78,53 @@ class StockMA(QCAlgorithm):
         ### End Parameters
 
 
-        self.upperlinepos = ""
-        self.lowerlinepos = ""
-        self.cur_purchaseprice = 0
-        self.cont_liquidate = False
-        self.highwatermark = 0
+        # (v5) detector of the peaks and troughs for the dynamic MA, run for all the securities at once
+        self.turningPoints = TurningPointDetector(self.n_days, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+        # (v7) rolling store of the daily bars of all the securities, warmed up once here and fed by the daily consolidators afterwards
+        # it holds enough bars for the longest possible dynamic MA and the training window
+        longest_MA = int(max(self.n_days, self.default_MA)*self.MA_coef)
+        self.dailyBars = DailyBarPanel(len(self.symbols), max(longest_MA, self.resolution))
+        history = self.History(self.symbols, self.dailyBars.capacity, Resolution.Daily)
+        if 'close' in history:
+            for symbol, df in history.groupby(level=0, sort=False):
+                times = df.index.get_level_values("time")
+                self.dailyBars.extend(self.symbolIndex[symbol], times, df["open"].values, df["high"].values, df["low"].values, df["close"].values, df["volume"].values)
+        for symbol in self.symbols:
+            self.Consolidate(symbol, Resolution.Daily, self.OnDailyBar)
+
+        # (v5) cache of the quantities derived from daily data, recalculated once per daily bar
+        self.dailyCache = DailyCache()
+
+        # (v7) recent closed trades of each security for the past trades control, fed by the order events
+        # the trades of at least half of the cash allocated to a security are counted
+        self.pastTrades = [PastTradesTracker(timedelta(days=self.num_days_lookback), self.num_days_lookback*10, self.initialCash/len(self.symbols)//2) for _ in self.symbols]
+        self.closedTrades = 0
+
+        # the trading state of the securities, e.g. the positions of the price relative to the MA bands
+        self.states = SymbolStates(len(self.symbols))
 
         self.train = False
+        self.retrainer = AsyncRetrainer(self.retrain_policy)
+        self.predictions = PredictionTable()
+        self.checkpoints = CheckpointStore(self.checkpoint_dir)
+        # the key of the current weights in the checkpoint store, which the progressive retrain starts from
+        self.modelKey = None
 
     def TrainAlgo(self):
         '''Trains the algorithm with the deep learning model. '''
-        # obtains the past history
-        history = self.History(self.symbol, self.resolution, Resolution.Daily)
-
-        # if the history is incomplete, early exit the function
-        if history.shape[0] != self.resolution:
+        # the model is trained on the securities with complete history, if there is none, early exit the function
+        complete = self.dailyBars.count >= self.resolution
+        if not complete.any():
             return
-       
+
         # obtain open, high, low, close and volume as the input to the model
-        open = history["open"].values
-        high = history["high"].values
-        low = history["low"].values
-        close = history["close"].values
-        volume = history["volume"].values
-        x_train = []
-        y_train = []
-        
+        bars = self.dailyBars.window(self.resolution)[complete]
+        end = max(self.dailyBars.last_time[i] for i in np.flatnonzero(complete))
         # inputs: open, high, low, close and volume
         # output: future volatility after self.volatility_n_days
-        for i in range(self.past_volatility_n_days,len(close)-self.volatility_n_days):
-            x_train.append([open[i-self.past_volatility_n_days:i],high[i-self.past_volatility_n_days:i],low[i-self.past_volatility_n_days:i],close[i-self.past_volatility_n_days:i],volume[i-self.past_volatility_n_days:i]])
-            y_train.append([pd.DataFrame({"Close":close[i:i+self.volatility_n_days]})["Close"].pct_change().dropna().std()])
-
-        x_train = np.array(x_train)
-        y_train = np.array(y_train)
+        # the samples of all the securities are pooled, so that one model is shared by the securities
+        x_train, y_train = build_pooled_training_set(bars, self.past_volatility_n_days, self.volatility_n_days)
 
         # create an instance of the model and build its architecture
         self.regressorLSTM = Sequential()
@@ -114,9 +142,16 @@ class StockMA(QCAlgorithm):
         # Compiling the LSTM model
         self.regressorLSTM.compile(optimizer=SGD(learning_rate=0.001, momentum=0.9, nesterov=False),loss='mean_squared_error')
         # Fitting to the training set
-        self.regressorLSTM.fit(x_train,y_train,epochs=25,validation_split=0.1,batch_size=150)
+        self.modelKey = self.FitModel(self.regressorLSTM, x_train, y_train, end, epochs=25,validation_split=0.1,batch_size=150)
+        # export the trained weights to the numpy inference engine, which falls back to keras if its predictions differ
+        self.inferenceLSTM = export_inference(self.regressorLSTM, x_train[-10:])
+        self.LogInference()
+        self.PrecomputeVolatility(self.Time + timedelta(days=self.retrain+1))
+        if self.benchmark_inference:
+            self.Log(f"LSTM inference latency: {benchmark_inference(self.regressorLSTM, self.inferenceLSTM, x_train[-1:])}")
 
         self.train = True
+        self.dailyCache.invalidate("y_predict")
         self.lasttraintime = self.Time
         return
 
@@ -124,57 +159,219 @@ class StockMA(QCAlgorithm):
         '''Retrains the deep learning model with the progressive retrain mechanism. 
         This retrain mechanism introduces new, recent data to the model. 
         '''
-        # obtains the past history
-        history = self.History(self.symbol, timedelta(days=self.retrain), Resolution.Daily)
+        # the progressive retrain continues from the weights of the last retrain, so with the "queue" and "wait" policies,
+        # a new retrain is only built from the current model once the running retrain is swapped in
+        if self.async_retrain and self.retrainer.is_running() and self.retrainer.policy != "skip":
+            # "queue": the retrain is due again on the next bars, until OnData swaps in the running retrain
+            if self.retrainer.policy == "queue":
+                return
+            # "wait": block until the running retrain completes, and swap it in before the new retrain
+            self.retrainer.join()
+            self.SwapRetrainedModel()
 
-        # if the history is incomplete, early exit the function
-        if history.shape[0] != self.resolution:
+        # obtains the past history of all the securities in one request
+        history = self.History(self.symbols, timedelta(days=self.retrain), Resolution.Daily)
+        if 'close' not in history:
+            return
+
+        # the model is retrained on the securities with complete history, if there is none, early exit the function
+        bars = [df[["open", "high", "low", "close", "volume"]].values.T for _, df in history.groupby(level=0, sort=False) if df.shape[0] == self.resolution]
+        if not bars:
             return
        
         # obtain open, high, low, close and volume as the input to the model
-        open = history["open"].values
-        high = history["high"].values
-        low = history["low"].values
-        close = history["close"].values
-        volume = history["volume"].values
-        x_train = []
-        y_train = []
-        
         # inputs: open, high, low, close and volume
         # output: future volatility after self.volatility_n_days
-        for i in range(self.past_volatility_n_days,len(close)-self.volatility_n_days):
-            x_train.append([open[i-self.past_volatility_n_days:i],high[i-self.past_volatility_n_days:i],low[i-self.past_volatility_n_days:i],close[i-self.past_volatility_n_days:i],volume[i-self.past_volatility_n_days:i]])
-            y_train.append([pd.DataFrame({"Close":close[i:i+self.volatility_n_days]})["Close"].pct_change().dropna().std()])
-
-        x_train = np.array(x_train)
-        y_train = np.array(y_train)
+        # the samples of all the securities are pooled, so that one model is shared by the securities
+        x_train, y_train = build_pooled_training_set(np.stack(bars), self.past_volatility_n_days, self.volatility_n_days)
+        end = history.index.get_level_values("time").max()
+
+        if self.async_retrain:
+            # retrain a copy of the model on a worker thread, it is swapped in by OnData once the training completes
+            model = clone_model(self.regressorLSTM)
+            model.set_weights(self.regressorLSTM.get_weights())
+            model.compile(optimizer=SGD(learning_rate=0.001, momentum=0.9, nesterov=False),loss='mean_squared_error')
+            # the key of the weights which are retrained
+            previous = self.modelKey
+            def train():
+                key = self.FitModel(model, x_train, y_train, end, previous, epochs=25,validation_split=0.1,batch_size=150,verbose=0)
+                return model, export_inference(model, x_train[-10:]), key
+            self.retrainer.submit(train)
+            self.lasttraintime = self.Time
+            return
 
         # retrain the model with the new data feed
-        self.regressorLSTM.fit(x_train,y_train,epochs=25,validation_split=0.1,batch_size=150)
+        self.modelKey = self.FitModel(self.regressorLSTM, x_train, y_train, end, self.modelKey, epochs=25,validation_split=0.1,batch_size=150)
+        # export the trained weights to the numpy inference engine, which falls back to keras if its predictions differ
+        self.inferenceLSTM = export_inference(self.regressorLSTM, x_train[-10:])
+        self.LogInference()
+        self.PrecomputeVolatility(self.Time + timedelta(days=self.retrain+1))
 
         self.train = True
+        self.dailyCache.invalidate("y_predict")
 
         # updates the latest training time of the algo
         self.lasttraintime = self.Time
         return
 
 
+    def FitModel(self, model, x_train: np.array, y_train: np.array, end: datetime, previous=None, **fit_args) -> str:
+        '''Fits the model to the training set, or loads its weights from the checkpoint store if it has been trained
+        on the same window with the same hyperparameters before. The weights are saved to the store after each fit. 
+        Arguments:
+            model: The compiled model
+            x_train, y_train: The training set
+            end: The time of the last daily bar of the training window
+            previous: The key of the weights which are retrained, for the progressive retrain. Default: None
+            fit_args: The arguments of model.fit
+
+        Returns: The key of the weights in the checkpoint store. 
+        '''
+        optimizer = model.optimizer.get_config()
+        hyperparameters = {
+            "layers": [(type(layer).__name__, layer.get_config().get("units"), layer.get_config().get("rate")) for layer in model.layers],
+            "optimizer": (type(model.optimizer).__name__, optimizer.get("learning_rate"), optimizer.get("momentum"), optimizer.get("nesterov")),
+            "fit": {name: value for name, value in fit_args.items() if name != "verbose"},
+            "data": (x_train.shape, self.past_volatility_n_days, self.volatility_n_days),
+            "previous": previous,
+        }
+        key = checkpoint_key("-".join(self.instruments), end, hyperparameters)
+        weights = self.checkpoints.Read(key)
+        if weights is not None:
+            model.set_weights(weights)
+            self.Log(f"LSTM weights loaded from the checkpoint {key}")
+            return key
+        model.fit(x_train, y_train, **fit_args)
+        self.checkpoints.Save(key, model.get_weights())
+        return key
+
+    def OnDailyBar(self, bar: TradeBar):
+        '''Event handler of the daily consolidators. Stores the completed daily bar of a security. 
+        Arguments:
+            bar: The consolidated daily bar
+        '''
+        self.dailyBars.add(self.symbolIndex[bar.Symbol], bar.EndTime, bar.Open, bar.High, bar.Low, bar.Close, bar.Volume)
+
+    def CalculateMA(self):
+        '''Calculates the dynamic moving averages of the securities from the daily closes. 
+
+        Returns: The moving averages, NaN for the securities whose data is incomplete. 
+        '''
+        MA = np.full(len(self.symbols), np.nan)
+        # if data is incomplete, exit the function
+        complete = np.flatnonzero(self.dailyBars.count >= self.n_days)
+        if len(complete) == 0:
+            return MA
+
+        ### (v5) Analysis to calculate MA
+        # dynamic MA is calculated based on the number of peaks and troughs of the last self.n_days closes
+        # of all the securities in one batch
+        final_MA = self.turningPoints.batch_final_MA(self.dailyBars.last(self.n_days)[complete])
+        final_MA = np.minimum(self.max_MA, final_MA) ##NEW
+
+        ### end of dynamic MA calculation
+
+        # calculate the moving average of the securities, those with the same number of days are averaged together
+        final_MA = np.minimum(final_MA, self.dailyBars.count[complete])
+        closes = self.dailyBars.last(final_MA.max())[complete]
+        for n in np.unique(final_MA):
+            rows = final_MA == n
+            MA[complete[rows]] = closes[rows, -n:].mean(axis=1)
+        return MA
+
+    def PredictVolatility(self):
+        '''Predicts the future volatility of the securities with the deep learning model, in one forward pass. 
+
+        Returns: The predicted future volatility of each security, or None if the prediction fails. 
+        '''
+        # use the predictions calculated in one batch after the last (re)train, if they cover the current daily bars
+        if self.precompute_inference:
+            # the model may be kept after the predicted period, e.g. if a retrain is skipped
+            if self.predictions.expired(self.Time):
+                self.PrecomputeVolatility(self.Time + timedelta(days=self.retrain+1))
+            y_predict = [self.predictions.get((i, time)) for i, time in enumerate(self.dailyBars.last_time)]
+            if all(y is not None for y in y_predict):
+                return np.concatenate(y_predict)
+
+        # obtain the recent open, high, low, close and volume data for model prediction
+        x_test = self.dailyBars.window(self.past_volatility_n_days)
+
+        # predict the future volatility
+        try:
+            y_predict = self.inferenceLSTM.predict(x_test)
+        except:
+            return
+        return y_predict[:, 0]
+
+    def PrecomputeVolatility(self, until: datetime):
+        '''Predicts the future volatility of the securities for every daily bar up to the next retrain, in one forward pass. 
+        It is only used in backtests, as it requests the daily bars after the current time. 
+        Arguments:
+            until: The time of the next retrain
+        '''
+        if not self.precompute_inference or self.LiveMode:
+            return
+
+        # the daily bars from a few days before the current time, so that the inputs of the current day are also covered
+        start = self.Time - timedelta(days=3*self.past_volatility_n_days)
+        history = self.History(self.symbols, start, until, Resolution.Daily)
+        x_test, keys = [], []
+        if 'close' in history:
+            for symbol, df in history.groupby(level=0, sort=False):
+                windows, times = daily_windows(df[DailyBarPanel.FIELDS].values.T, df.index.get_level_values("time"), self.past_volatility_n_days)
+                x_test.append(windows)
+                keys += [(self.symbolIndex[symbol], time) for time in times]
+        self.predictions.fill(self.inferenceLSTM, np.concatenate(x_test) if x_test else None, keys, until)
+
+    def CountPastLosses(self, prices: np.array, active: np.array) -> np.array:
+        '''Calculates the number of recent trades which incur losses net the number of recent trades which are profitable, for each security. 
+
+        Arguments:
+            prices: The current prices of the securities. 
+            active: Whether each security is traded in this step, the others are not counted. 
+
+        Returns: The net number of losing trades of each security, floored at zero. 
+        '''
+        # only the trades closed within self.num_days_lookback days, among the last self.num_days_lookback*10 trades,
+        # with a value of at least half of the allocated cash are counted
+        pnl_count = np.zeros(len(self.symbols))
+        for i in np.flatnonzero(active):
+            if self.pastTrades[i].trades:
+                pnl_count[i] = self.pastTrades[i].pnl_count(self.UtcTime, prices[i])
+        return pnl_count
+
+    def LogInference(self):
+        '''Logs the reason if the LSTM model is not exported to the numpy inference engine, so that keras is used for its predictions. '''
+        if isinstance(self.inferenceLSTM, KerasInference):
+            self.Log(f"LSTM inference with keras: {self.inferenceLSTM.reason}")
+
+    def SwapRetrainedModel(self):
+        '''Swaps in the model retrained on the worker thread, if its training has completed. '''
+        retrained = self.retrainer.poll()
+        if retrained is not None:
+            self.regressorLSTM, self.inferenceLSTM, self.modelKey = retrained
+            self.LogInference()
+            self.PrecomputeVolatility(self.lasttraintime + timedelta(days=self.retrain+1))
+            self.dailyCache.invalidate("y_predict")
+
     def OnData(self, slice:Slice):
         '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
         Arguments:
             data: Slice object keyed by symbol containing the stock data
         '''
 
-        # first, check the existence of the data
-        if self.symbol in slice.Bars:
-            trade_bar = slice.Bars[self.symbol]
-            price = trade_bar.Close
-            high = trade_bar.High
-            low = trade_bar.Low
+        # first, check the existence of the data of each security
+        prices = np.full(len(self.symbols), np.nan)
+        for i, symbol in enumerate(self.symbols):
+            if symbol in slice.Bars:
+                prices[i] = slice.Bars[symbol].Close
         # if data does not exist, exit this function
-        else:
+        if np.isnan(prices).all():
             return
 
+        # swap in the model retrained on the worker thread, if its training has completed
+        self.SwapRetrainedModel()
+
         # if it is time for a retrain
         # we train the model
         if self.train and self.lasttraintime + timedelta(days=self.retrain) < self.Time:
@@ -187,218 +384,130 @@ class StockMA(QCAlgorithm):
             if not self.train:
                 return
         
-        # obtain the past history of the underlying
-        df = self.History(self.symbol, self.n_days, Resolution.Daily)
-        # self.Log(f"{'close' in df} {df.shape[0]}")
-
-        # if data is incomplete, exit the function
-        if 'close' not in df or df.shape[0] != self.n_days:
+        # (v5) the dynamic MAs only change when a new daily bar is completed
+        MA = self.dailyCache.get(self.dailyBars.added, "MA", self.CalculateMA)
+        # only the securities with data and complete history are traded
+        active = ~np.isnan(prices) & ~np.isnan(MA)
+        if not active.any():
             return
 
-        ### (v5) Analysis to calculate MA
-        # dynamic MA is calculated based on the number of peaks and troughs
-
-        # identify the peaks
-        lastmax = 0
-        lastmaxindex = 0
-        reset = True
-        high_points = []
-        low_points = []
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].max()
-                # pri,curmax,lastmax,lastmaxindex)
-                if curmax > lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            high_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax < lastmax:
-                        high_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 0
-                    reset = True
-
-        # identify the troughs
-        lastmax = 1000000000
-        lastmaxindex = 0
-        reset = True
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].min()
-                # pri,curmax,lastmax,lastmaxindex)
-                if curmax < lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 1000000000:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            low_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax > lastmax:
-                        low_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 1000000000
-                    reset = True
-
-        high_diff = []
-        if len(high_points) >= 2:
-            for i in range(1,len(high_points)):
-                high_diff.append(high_points[i]-high_points[i-1])
-
-        low_diff = []
-        if len(low_points) >= 2:
-            for i in range(1,len(low_points)):
-                low_diff.append(low_points[i]-low_points[i-1])
-        
-        if len(high_diff) == 0:
-            high_MA = self.default_MA
-        else:
-            high_MA = sum(high_diff) / len(high_diff)
-
-        if len(low_diff) == 0:
-            low_MA = self.default_MA
-        else:
-            low_MA = sum(low_diff) / len(low_diff)
-        
-        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
-
-        if final_MA < self.min_MA:
-            final_MA = self.min_MA
-        final_MA = min(self.max_MA,final_MA) ##NEW
-
-        ### end of dynamic MA calculation
-
-        df = self.History(self.symbol, final_MA, Resolution.Daily)
-
-        # calculate the moving average of the underlying
-        MA = df['close'].mean()
-
         # the same pair of MA bands is used to close trades
         close_MA = MA
 
-        quantity = self.Portfolio[self.symbol].Quantity
+        quantity = self.states.quantity.copy()
 
-        # obtain the recent open, high, low, close and volume data for model prediction
-        df3 = self.History(self.symbol, self.past_volatility_n_days, Resolution.Daily)
-        open = df3["open"].values
-        high = df3["high"].values
-        low = df3["low"].values
-        close = df3["close"].values
-        volume = df3["volume"].values
-
-        x_test = np.array([[open,high,low,close,volume]])
-        
-        # predict the future volatility
-        try:
-            y_predict = self.regressorLSTM.predict(x_test)
-        except:
+        # predict the future volatility, only once per daily bar as the model inputs are daily bars
+        y_predict = self.dailyCache.get(self.dailyBars.added, "y_predict", self.PredictVolatility)
+        if y_predict is None:
             return
-        # y_predict = np.squeeze(y_predict)
         # self.Log(y_predict)
 
         ### (v7) Past trades control
         # calculates the number of trades which incur losses net the number of trades which is profitable
-        trades = self.TradeBuilder.ClosedTrades
-        trades = trades[-min(len(trades),self.num_days_lookback*10):]
-        pnl_count = 0 #+ve: loss
-        for trade in trades:
-            if trade.ExitTime > self.UtcTime - timedelta(days=self.num_days_lookback) and trade.Quantity*price >= self.initialCash//2:
-                if not trade.IsWin:
-                    pnl_count += 1
-                else:
-                    pnl_count -= 1
-                
-        pnl_count = max(pnl_count,0)
+        # it is calculated on every bar rather than cached with the daily quantities, as it depends on the current price and the lookback of the trades
+        # the penalty is kept in the data type of the prediction, as it is added to the prediction
+        penalty = (self.CountPastLosses(prices, active) * self.penalty_coefficient).astype(y_predict.dtype)
         ### End (v7)
 
         # determine the width of the MA bands based on future volatility prediction of the LSTM model adjusted by the no. of trades which incur losses
-        self.percent_above = self.volatility_constant + y_predict[0] * self.volatility_coefficient + pnl_count * self.penalty_coefficient
+        self.percent_above = self.volatility_constant + y_predict * self.volatility_coefficient + penalty
         if self.adjustCloseVol:
             # penalty term added to close trades
-            self.close_above = self.close_volatility_constant + y_predict[0] * self.close_volatility_coefficient + pnl_count * self.penalty_coefficient
-        else:
-            self.close_above = self.close_volatility_constant + y_predict[0] * self.close_volatility_coefficient
-
-        # check for conditions to close the position and execute market orders
-        # the MA bands are used to close the positions in this version
-        if abs(quantity) > 1:
-            self.highwatermark = max(price,self.highwatermark)
-            self.lowwatermark = min(price,self.lowwatermark)
-            if self.cont_liquidate:
-                ticket = self.MarketOrder(self.symbol, -quantity)
-                if ticket.QuantityFilled != -quantity:
-                    self.cont_liquidate = True
-            elif self.takeprofit and ((self.strikethrough == "Upper" and price/self.cur_purchaseprice - 1 > self.takeprofitpercentage) or (self.strikethrough == "Lower" and 1 - price/self.cur_purchaseprice > self.takeprofitpercentage)):
-                self.Log("Take Profit {},{},{},{}".format(price,MA,self.strikethrough,quantity))
-                ticket = self.MarketOrder(self.symbol, -quantity)
-                if ticket.QuantityFilled != -quantity:
-                    self.cont_liquidate = True
-            elif self.trailingstoploss and ((self.strikethrough == "Upper" and price/self.highwatermark < 1 - self.trailingstoplosspercent) or (self.strikethrough == "Lower" and price/self.lowwatermark > 1 + self.trailingstoplosspercent)):
-                self.Log("Trailing stop loss: price: {}, highwm:{}, lowwm:{},{}, q:{}".format(price,self.highwatermark,self.lowwatermark,self.strikethrough,quantity))
-                ticket = self.MarketOrder(self.symbol, -quantity)
-                if ticket.QuantityFilled != -quantity:
-                    self.cont_liquidate = True
-            elif self.strikethrough == "Upper":
-                threshold = close_MA*(1+self.close_above)
-                if price <= threshold:
-                    self.Log("Pass Close MA: sell")
-                    ticket = self.MarketOrder(self.symbol, -quantity)
-                    if ticket.QuantityFilled != -quantity:
-                        self.cont_liquidate = True
-            elif self.strikethrough == "Lower":
-                
-                threshold = close_MA/(1+self.close_above)
-                if price >= threshold:
-                    self.Log("Pass Close MA: buy back")
-                    ticket = self.MarketOrder(self.symbol, -quantity)
-                    if ticket.QuantityFilled != -quantity:
-                        self.cont_liquidate = True
-        # otherwise, trade accordingly
+            self.close_above = self.close_volatility_constant + y_predict * self.close_volatility_coefficient + penalty
         else:
-            self.cont_liquidate = False
-            # self.Log(f"{self.upperlinepos} {self.lowerlinepos}")
-            
+            self.close_above = self.close_volatility_constant + y_predict * self.close_volatility_coefficient
+
+        # the MA bands of all the securities are checked at once, the securities without data are NaN and never pass the bands
+        s = self.states
+        with np.errstate(invalid="ignore", divide="ignore"):
+            upper_band = MA*(1+self.percent_above)
+            lower_band = MA/(1+self.percent_above)
+            invested = active & (np.abs(quantity) > 1)
+            flat = active & ~invested
+            s.highwatermark[invested] = np.maximum(prices, s.highwatermark)[invested]
+            s.lowwatermark[invested] = np.minimum(prices, s.lowwatermark)[invested]
+            upper = s.strikethrough == UPPER
+            lower = s.strikethrough == LOWER
+
+            # check for conditions to close the position and execute market orders
+            # the MA bands are used to close the positions in this version
+            takeprofit = self.takeprofit & ((upper & (prices/s.cur_purchaseprice - 1 > self.takeprofitpercentage)) | (lower & (1 - prices/s.cur_purchaseprice > self.takeprofitpercentage)))
+            trailingstoploss = self.trailingstoploss & ((upper & (prices/s.highwatermark < 1 - self.trailingstoplosspercent)) | (lower & (prices/s.lowwatermark > 1 + self.trailingstoplosspercent)))
+            pass_close_MA = (upper & (prices <= close_MA*(1+self.close_above))) | (lower & (prices >= close_MA/(1+self.close_above)))
+            liquidate = invested & (s.cont_liquidate | takeprofit | trailingstoploss | pass_close_MA)
+
+            # otherwise, trade accordingly
             # if the previous price position of the upper line is lower 
             # and the underlying price exceeds the upper MA band (indicating a cross)
             # buy (long) the underlying
-            if self.upperlinepos == "Lower" and price >= MA*(1+self.percent_above):
-                q = self.Portfolio.Cash/price 
-                ticket = self.MarketOrder(self.symbol, q)
-                self.Log(f"Price: {price}, MA: {MA}, buy {q}")
-                self.strikethrough = "Upper"
-                self.highwatermark = price
-                self.lowwatermark = price
-                self.cur_purchaseprice = price
-            
+            buy = flat & (s.upperlinepos == LOWER) & (prices >= upper_band)
             # if the previous price position of the upper line is upper
             # and the underlying price falls below the lower MA band (indicating a cross)
             # sell (short) the underlying
-            if self.lowerlinepos == "Upper" and price <= MA/(1+self.percent_above):
-                q = self.Portfolio.Cash/price
-                ticket = self.MarketOrder(self.symbol, -q)
-                self.Log(f"Price: {price}, MA: {MA}, sell {q}")
-                self.strikethrough = "Lower"
-                self.highwatermark = price
-                self.lowwatermark = price
-                self.cur_purchaseprice = price
-        
-        # update the positions of the upper and lower line
-        if price >= MA*(1+self.percent_above):
-            self.upperlinepos = "Upper"
-        else:
-            self.upperlinepos = "Lower"
-        
-        if price <= MA/(1+self.percent_above):
-            self.lowerlinepos = "Lower"
-        else:
-            self.lowerlinepos = "Upper"
+            sell = flat & (s.lowerlinepos == UPPER) & (prices <= lower_band)
+            s.cont_liquidate[flat] = False
+
+            # each security has an equal share of the portfolio value, which is fixed for the orders of the bar, so that
+            # the entries do not depend on the cash left by the orders of the other securities (with one security, this is the cash)
+            budget = self.Portfolio.TotalPortfolioValue/len(self.symbols)
+
+            # the orders are placed for the few securities which pass the bands
+            for i in np.flatnonzero(liquidate | buy | sell):
+                symbol, price = self.symbols[i], prices[i]
+                prefix = f"{symbol}: " if len(self.symbols) > 1 else ""
+                if liquidate[i]:
+                    if s.cont_liquidate[i]:
+                        pass
+                    elif takeprofit[i]:
+                        self.Log(prefix + "Take Profit {},{},{},{}".format(price,MA[i],NAMES[s.strikethrough[i]],quantity[i]))
+                    elif trailingstoploss[i]:
+                        self.Log(prefix + "Trailing stop loss: price: {}, highwm:{}, lowwm:{},{}, q:{}".format(price,s.highwatermark[i],s.lowwatermark[i],NAMES[s.strikethrough[i]],quantity[i]))
+                    elif upper[i]:
+                        self.Log(prefix + "Pass Close MA: sell")
+                    else:
+                        self.Log(prefix + "Pass Close MA: buy back")
+                    ticket = self.MarketOrder(symbol, -quantity[i])
+                    if ticket.QuantityFilled != -quantity[i]:
+                        s.cont_liquidate[i] = True
+                    continue
+
+                # each trade uses the share of the security less its open holding
+                if buy[i]:
+                    q = (budget - self.Portfolio[symbol].AbsoluteHoldingsValue)/price
+                    ticket = self.MarketOrder(symbol, q)
+                    self.Log(prefix + f"Price: {price}, MA: {MA[i]}, buy {q}")
+                    s.open(i, UPPER, price)
+                if sell[i]:
+                    q = (budget - self.Portfolio[symbol].AbsoluteHoldingsValue)/price
+                    ticket = self.MarketOrder(symbol, -q)
+                    self.Log(prefix + f"Price: {price}, MA: {MA[i]}, sell {q}")
+                    s.open(i, LOWER, price)
+
+            # update the positions of the upper and lower line
+            s.update_lines(active, prices >= upper_band, prices <= lower_band)
+
+    def OnOrderEvent(self, orderEvent: OrderEvent):
+        '''OnOrder event is an entry point which processes an order. 
+        Arguments:
+            orderEvent: OrderEvent object containing the order details. 
+        '''
+        if orderEvent.Status == OrderStatus.Filled or orderEvent.Status == OrderStatus.PartiallyFilled:
+            self.states.quantity[self.symbolIndex[orderEvent.Symbol]] = self.Portfolio[orderEvent.Symbol].Quantity
+            # (v7) the trades closed by the fill are added to the past trades control of their securities
+            trades = self.TradeBuilder.ClosedTrades
+            closed = {}
+            for trade in trades[self.closedTrades:]:
+                closed.setdefault(self.symbolIndex[trade.Symbol], []).append(trade)
+            for i, new_trades in closed.items():
+                self.pastTrades[i].extend(new_trades)
+            self.closedTrades = len(trades)
+
+    def OnEndOfAlgorithm(self):
+        '''Logs the hit and miss counts of the daily cache at the end of the algorithm. '''
+        self.Log(f"Daily cache: {self.dailyCache.hits} hits, {self.dailyCache.misses} misses, hit ratio {self.dailyCache.hit_ratio():.3f}")
+        if self.checkpoint_dir is not None:
+            self.Log(f"LSTM checkpoints: {self.checkpoints.summary()}")
+        if self.precompute_inference:
+            self.Log(f"Precomputed predictions: {self.predictions.hits} hits, {self.predictions.misses} misses")
+        if self.async_retrain:
+            self.Log(f"Asynchronous retrains: {self.retrainer.completed} completed, {self.retrainer.skipped} skipped")
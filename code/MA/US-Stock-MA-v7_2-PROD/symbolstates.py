@@ -0,0 +1,53 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+
+# the positions of the price relative to the MA bands, and the direction of the crossing which opened a trade
+UPPER = 1
+LOWER = -1
+NAMES = {UPPER: "Upper", LOWER: "Lower", 0: ""}
+
+
+# the trading state of each security, with one array per attribute so that all the securities are checked at once
+class SymbolStates:
+    def __init__(self, n_symbols: int):
+        '''Initializer method.
+
+        Arguments:
+            n_symbols: The number of securities.
+        '''
+        # the quantity held, updated by the order events
+        self.quantity = np.zeros(n_symbols)
+        # UPPER, LOWER or 0 before the first price is compared with the MA bands
+        self.upperlinepos = np.zeros(n_symbols, dtype=np.int8)
+        self.lowerlinepos = np.zeros(n_symbols, dtype=np.int8)
+        self.strikethrough = np.zeros(n_symbols, dtype=np.int8)
+        self.cur_purchaseprice = np.zeros(n_symbols)
+        self.highwatermark = np.zeros(n_symbols)
+        self.lowwatermark = np.zeros(n_symbols)
+        self.cont_liquidate = np.zeros(n_symbols, dtype=bool)
+
+    def open(self, i: int, direction: int, price: float):
+        '''Records a trade which is opened.
+
+        Arguments:
+            i: The index of the security.
+            direction: UPPER for a long position, LOWER for a short position.
+            price: The price of the security.
+        '''
+        self.strikethrough[i] = direction
+        self.highwatermark[i] = price
+        self.lowwatermark[i] = price
+        self.cur_purchaseprice[i] = price
+
+    def update_lines(self, active: np.array, above_upper: np.array, below_lower: np.array):
+        '''Updates the positions of the price relative to the upper and lower MA bands.
+
+        Arguments:
+            active: Whether each security is traded in this step.
+            above_upper: Whether the price is at or above the upper MA band.
+            below_lower: Whether the price is at or below the lower MA band.
+        '''
+        self.upperlinepos[active] = np.where(above_upper, UPPER, LOWER)[active]
+        self.lowerlinepos[active] = np.where(below_lower, LOWER, UPPER)[active]
@@ -0,0 +1,131 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import time
+import numpy as np
+from collections import deque
+
+
+# a scheduler of the retrains of a deep learning model, which keeps the compiled model and fine-tunes it on the windows of the
+# new bars since the last fit, together with a bounded replay buffer of older windows
+# a full retrain (a new model and new scalers) is only called for when the new windows drift from the data of the last full retrain:
+# when too many of their scaled values are out of the range of the scalers, or the error of the model on them is too high
+class RetrainScheduler:
+    def __init__(self, replay_size=240, max_out_of_range=0.2, max_error_ratio=10.0):
+        '''Initializer method.
+
+        Arguments:
+            replay_size: The maximum number of older windows which are replayed in the fine-tuning. Default: 240.
+            max_out_of_range: The maximum fraction of the scaled inputs of the new bars and their targets outside [-1, 1],
+                the feature range of the scalers. Default: 0.2.
+            max_error_ratio: The maximum ratio of the mean squared error of the model on the new windows (before the fine-tuning)
+                to its error on the training set of the last full retrain, which is in-sample and thus lower. Default: 10.0.
+        '''
+        self.replay_size = replay_size
+        self.max_out_of_range = max_out_of_range
+        self.max_error_ratio = max_error_ratio
+        self.replay_X = deque(maxlen=replay_size)
+        self.replay_y = deque(maxlen=replay_size)
+        # the time of the last window which the model is fitted to
+        self.last_time = None
+        # the mean squared error of the model on the training set of the last full retrain
+        self.base_error = None
+        # the drift metrics of the latest new windows
+        self.out_of_range = None
+        self.error_ratio = None
+        self.full_retrains = 0
+        self.fine_tunes = 0
+        self.full_retrain_seconds = 0
+        self.fine_tune_seconds = 0
+
+    def count_new_windows(self, times: np.array) -> int:
+        '''Counts the windows after the last window which the model is fitted to.
+
+        Arguments:
+            times: The times of the windows, in the chronological order.
+        '''
+        if self.last_time is None:
+            return len(times)
+        return len(times) - int(np.searchsorted(times, self.last_time, side="right"))
+
+    def mean_squared_error(self, model, X: np.array, y: np.array) -> float:
+        '''Calculates the mean squared error of the predictions of the model. '''
+        return float(np.mean((model.predict(X, verbose=0).ravel() - y) ** 2))
+
+    def has_drifted(self, model, X_new: np.array, y_new: np.array) -> bool:
+        '''Calculates the drift metrics of the new windows, and determines whether the model needs a full retrain.
+
+        Arguments:
+            model: The model of the last fit.
+            X_new: The new windows, scaled with the scalers of the last full retrain.
+            y_new: The targets of the new windows, scaled with the output scaler of the last full retrain.
+        '''
+        if self.base_error is None:
+            return True
+        # the last row of each window is a new bar
+        values = np.concatenate([X_new[:, -1, :].ravel(), y_new])
+        self.out_of_range = float(np.mean(np.abs(values) > 1))
+        self.error_ratio = self.mean_squared_error(model, X_new, y_new) / max(self.base_error, 1e-12)
+        return self.out_of_range > self.max_out_of_range or self.error_ratio > self.max_error_ratio
+
+    def fit(self, model, X: np.array, y: np.array, last_time) -> float:
+        '''Fits a new model to the training set of a full retrain, and fills the replay buffer with its last windows.
+
+        Arguments:
+            model: The compiled model.
+            X, y: The training set.
+            last_time: The time of the last window.
+
+        Returns: The training time in seconds.
+        '''
+        start = time.perf_counter()
+        model.fit(X, y)
+        self.base_error = self.mean_squared_error(model, X, y)
+        self.replay_X.clear()
+        self.replay_y.clear()
+        self.remember(X, y)
+        self.last_time = last_time
+        elapsed = time.perf_counter() - start
+        self.full_retrains += 1
+        self.full_retrain_seconds += elapsed
+        return elapsed
+
+    def fine_tune(self, model, X_new: np.array, y_new: np.array, last_time) -> float:
+        '''Fine-tunes the model on the new windows and the replayed older windows, and adds the new windows to the replay buffer.
+
+        Arguments:
+            model: The compiled model of the last fit.
+            X_new, y_new: The new windows and their targets.
+            last_time: The time of the last new window.
+
+        Returns: The training time in seconds.
+        '''
+        start = time.perf_counter()
+        if len(self.replay_X) > 0:
+            X = np.concatenate([np.array(self.replay_X), X_new])
+            y = np.concatenate([np.array(self.replay_y), y_new])
+        else:
+            X, y = X_new, y_new
+        model.fit(X, y)
+        self.remember(X_new, y_new)
+        self.last_time = last_time
+        elapsed = time.perf_counter() - start
+        self.fine_tunes += 1
+        self.fine_tune_seconds += elapsed
+        return elapsed
+
+    def remember(self, X: np.array, y: np.array):
+        '''Adds the last windows of a training set to the replay buffer, as copies of the windows. '''
+        if self.replay_size == 0:
+            return
+        for window, target in zip(X[-self.replay_size:], y[-self.replay_size:]):
+            self.replay_X.append(np.array(window))
+            self.replay_y.append(target)
+
+    def drift_summary(self) -> str:
+        '''Summarises the drift metrics of the latest new windows. '''
+        return f"out of range {self.out_of_range:.3f}, error ratio {self.error_ratio:.2f}"
+
+    def summary(self) -> str:
+        '''Summarises the retrains and their training time. '''
+        return f"{self.full_retrains} full retrains ({self.full_retrain_seconds:.1f}s), {self.fine_tunes} fine-tunes ({self.fine_tune_seconds:.1f}s)"
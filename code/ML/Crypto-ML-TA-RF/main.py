@@ -1,7 +1,9 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-import talib as tb
+import numpy as np
+from indicators import FEATURE_NAMES
+from featurestore import FeatureStore
 from sklearn.ensemble import RandomForestClassifier
 from datetime import datetime, timedelta
 from sklearn.preprocessing import StandardScaler
@@ -20,20 +22,17 @@ class ML(QCAlgorithm):
         if history.shape[0] != self.tradeHistory:
             return
 
-        # obtain different types of technical indicators as the input to the model
-        history["MA50"] = tb.MA(history["close"], timeperiod=50)
-        history["MA100"] = tb.MA(history["close"], timeperiod=100)
-        history["MA200"] = tb.MA(history["close"], timeperiod=200)
-        history["MACD"] =  tb.MACD(history["close"], fastperiod=12, slowperiod=26, signalperiod=9)[0]
-        history["RSI"] =  tb.RSI(history["close"], timeperiod=14)/100
-        history["lc"] = history["close"].shift(1)
-        history["pc"] = history["close"]/history["lc"] - 1 
+        # obtain different types of technical indicators as the input to the model from the feature store,
+        # which only calculates the indicators of the bars that are not stored
+        features = self.featureStore.update(self.stock, self.setResolution, history)
+        for name in FEATURE_NAMES:
+            history[name] = features[name]
         history["n5c"] = history["open"].shift(-self.tradePeriod)
         history["n5pc"] = history["n5c"]/history["open"] - 1
+        # the bars before the indicators have the full period within the history are dropped,
+        # so that the training set does not depend on the bars stored before the history
+        history = history.iloc[self.featureStore.warm_up_period - 1:].copy()
         history.dropna(inplace=True)
-        history["LMA50"] = (history["close"] - history["MA50"])/history["close"]
-        history["LMA100"] = (history["close"] - history["MA100"])/history["close"]
-        history["LMA200"] = (history["close"] - history["MA200"])/history["close"]
         history["signal"] =  history["n5pc"].apply(lambda x: 1 if x > self.npercent else ( -1 if x < -self.npercent else 0))   
         
         # define a scaler to scale all the raw inputs
@@ -77,6 +76,10 @@ class ML(QCAlgorithm):
         self.SetBrokerageModel(BrokerageName.Binance, AccountType.Margin)
         self.stock = self.AddCrypto("BTCBUSD", self.setResolution, Market.Binance).Symbol
 
+        #feature store
+        self.featureStoreDir = None # folder of the feature files, which keeps the technical indicators across backtests (None: in memory only)
+        self.featureStore = FeatureStore(self.featureStoreDir)
+
         #train
         self.model_trained = False
         self.TrainAlgo()
@@ -102,25 +105,21 @@ class ML(QCAlgorithm):
             self.TrainAlgo()
             return
 
-        # obtain the past history of data and obtain technical indicators
-        history = self.History(self.stock, 205, self.setResolution)
-        history["MA50"] = tb.MA(history["close"], timeperiod=50)
-        history["MA100"] = tb.MA(history["close"], timeperiod=100)
-        history["MA200"] = tb.MA(history["close"], timeperiod=200)
-        history["MACD"] =  tb.MACD(history["close"], fastperiod=12, slowperiod=26, signalperiod=9)[0]
-        history["RSI"] =  tb.RSI(history["close"], timeperiod=14)/100
-        history["lc"] = history["close"].shift(1)
-        history["pc"] = history["close"]/history["lc"] - 1 
-        # history["n5c"] = history["close"].shift(-self.tradePeriod)
-        # history["n5pc"] = history["n5c"]/history["close"] - 1
-        history.dropna(inplace=True)
-        history["LMA50"] = (history["close"] - history["MA50"])/history["close"]
-        history["LMA100"] = (history["close"] - history["MA100"])/history["close"]
-        history["LMA200"] = (history["close"] - history["MA200"])/history["close"]
-        # history["signal"] =  history["n5pc"].apply(lambda x: 1 if x > 0.03 else ( -1 if x < -0.03 else 0))
-        
-        # concatenate all the technical indicators into a DataFrame (or a 2D numpy array)
-        X = [history.iloc[-1][["LMA50","LMA100","LMA200","RSI","MACD","pc"]]]
+        # append the latest bar to the feature store,
+        # which is updated with the past history of data if it does not have the bars before
+        if not self.featureStore.append(self.stock, self.setResolution, trade_bar.EndTime, price):
+            history = self.History(self.stock, 205, self.setResolution)
+            self.featureStore.update(self.stock, self.setResolution, history)
+
+        # read the technical indicators of the latest bar from the feature store into a 2D numpy array
+        features = self.featureStore.window(self.stock, self.setResolution, trade_bar.EndTime, 1)
+        if features is None:
+            return
+        X = np.column_stack([features[name] for name in FEATURE_NAMES])
+
+        # if the indicators do not have the full period of data, early exit this function
+        if np.isnan(X).any():
+            return
         X = self.scaler.transform(X)
 
         # obtain predictions from the model and generate signals
@@ -214,3 +213,8 @@ class ML(QCAlgorithm):
                 self.Log(f"Price: {price}, signal: {signal}, sell {q}")
                 self.traded = True
                 self.placedTrade = self.Time.strftime("%Y-%m-%d")
+
+    def OnEndOfAlgorithm(self):
+        '''Saves the features of the latest bars to the feature store. '''
+        self.featureStore.flush()
+        self.Log(f"Feature store: {self.featureStore.summary()}")
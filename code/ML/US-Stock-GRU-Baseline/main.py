@@ -1,9 +1,12 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-import talib as tb
+from indicators import FEATURE_NAMES
+from featurestore import FeatureStore
+from retrainscheduler import RetrainScheduler
 from datetime import datetime, timedelta
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 from keras.models import Sequential
 from keras.layers import GRU, Dropout, Dense, TimeDistributed
@@ -24,36 +27,53 @@ class ML(QCAlgorithm):
         if history.shape[0] != self.tradeHistory:
             return
         
-        # obtain different types of technical indicators as the input to the model
-        history["MA50"] = tb.MA(history["close"], timeperiod=50)
-        history["MA100"] = tb.MA(history["close"], timeperiod=100)
-        history["MA200"] = tb.MA(history["close"], timeperiod=200)
-        history["MACD"] =  tb.MACD(history["close"], fastperiod=12, slowperiod=26, signalperiod=9)[0]
-        history["RSI"] =  tb.RSI(history["close"], timeperiod=14)/100
+        # obtain different types of technical indicators as the input to the model from the feature store,
+        # which only calculates the indicators of the bars that are not stored
+        features = self.featureStore.update(self.stock, self.setResolution, history)
+        for name in FEATURE_NAMES:
+            history[name] = features[name]
         history["lc"] = history["close"].shift(1)
-        history["pc"] = history["close"]/history["lc"] - 1 
         history["n5c"] = history["open"].shift(-self.tradePeriod)
         history["n5pc"] = history["n5c"]/history["open"] - 1
+        # the bars before the indicators have the full period within the history are dropped,
+        # so that the training set does not depend on the bars stored before the history
+        history = history.iloc[self.featureStore.warm_up_period - 1:].copy()
         history.dropna(inplace=True)
-        history["LMA50"] = (history["close"] - history["MA50"])/history["close"]
-        history["LMA100"] = (history["close"] - history["MA100"])/history["close"]
-        history["LMA200"] = (history["close"] - history["MA200"])/history["close"]
 
         # requirement set by the model: the class name must be non negative integers
         history["signal"] =  history["pc"].apply(lambda x: BUY_SIGNAL if x > self.npercent else (SELL_SIGNAL if x < -self.npercent else HOLD_SIGNAL))   
         
+        # the input matrix of the windows, with the targets and the times of the windows
+        X = history[["LMA50","LMA100","LMA200","RSI","MACD"]]
+        # signal: classification, close: regression
+        y_raw = history["lc"][self.modelpastndays:].values.reshape(-1, 1)
+        times = history.index.get_level_values("time")[self.modelpastndays:]
+
+        # fine-tune the model on the windows of the new bars since the last fit, with the scalers of the last full retrain,
+        # unless the new windows drift from the data of the last full retrain
+        if self.fineTune and self.model_trained:
+            n_new = self.scheduler.count_new_windows(times)
+            # the model is kept if there are no new windows
+            if n_new == 0:
+                return
+            X_new = self.preprocess_X(X, train=False)
+            if X_new is not None:
+                X_new = X_new[-n_new:]
+                y_new = self.output_scaler.transform(y_raw[-n_new:]).ravel()
+                if not self.scheduler.has_drifted(self.model, X_new, y_new):
+                    elapsed = self.scheduler.fine_tune(self.model, X_new, y_new, times[-1])
+                    self.Log(f'Model fine-tuned at {self.Time} on {n_new} new windows in {elapsed:.1f}s ({self.scheduler.drift_summary()})')
+                    return
+                self.Log(f'Model drifted at {self.Time} ({self.scheduler.drift_summary()}), retrain from scratch')
+
         # define a scaler to scale all the raw inputs
         self.scaler = MinMaxScaler(feature_range=(-1, 1))
         self.output_scaler = MinMaxScaler(feature_range=(-1, 1))
 
         # training
-        X = history[["LMA50","LMA100","LMA200","RSI","MACD"]]
         X = self.preprocess_X(X, train=True)
         if X is None:
             return
-        
-        # signal: classification, close: regression
-        y_raw = history["lc"][self.modelpastndays:].values.reshape(-1, 1)
         y = np.squeeze(self.output_scaler.fit_transform(y_raw))
 
         # create an instance of the model and build its architecture
@@ -74,12 +94,12 @@ class ML(QCAlgorithm):
         # regression: metrics=['mean_squared_error'], loss=mean_squared_error
         self.model.compile(loss='mean_squared_error',optimizer='adam',metrics=['mean_squared_error'])
 
-        self.model.fit(X,y)
+        elapsed = self.scheduler.fit(self.model, X, y, times[-1])
         self.model_trained = True
-        self.Log(f'Model trained at {self.Time}')
+        self.Log(f'Model trained at {self.Time} in {elapsed:.1f}s')
         return
 
-    def preprocess_X(self, X, train=False):
+    def preprocess_X(self, X, train=False, last_window=False):
         '''
         Method to pre-process the input matrix to the model, 
         such that it is compatible with the deep learning model format. 
@@ -87,12 +107,20 @@ class ML(QCAlgorithm):
         Arguments: 
             X: The input matrix, in the format of a numpy array. 
             train: A boolean to indicate whether the matrix is used in training or not. Default: False. 
+            last_window: A boolean to indicate whether only the last window is needed (e.g. for the prediction of the latest bar). 
+                Only the rows of the last window are scaled. Default: False. 
+        
+        Returns: A numpy array of shape (number of windows, modelpastndays, number of features), where each window 
+            contains the modelpastndays rows before a row of the matrix, or None if the matrix does not have a full window. 
         '''
-        output = []
-
-        # early exit if the input matrix is empty
-        if X.shape[0] == 0:
+        # early exit if the input matrix does not have a full window before its last row
+        n = X.shape[0]
+        if n <= self.modelpastndays:
             return None
+
+        # the last window only needs the modelpastndays rows before the last row
+        if last_window:
+            return self.scaler.transform(X[n-1-self.modelpastndays:n-1])[np.newaxis]
         
         # if the matrix is not used in training, we only need to transform the value through the scaler
         # no fitting of the scaler is performed in non-training instances
@@ -103,20 +131,10 @@ class ML(QCAlgorithm):
 
         # pre-process the shape of the matrix 
         # such that it is compatible with the input format of the deep learning models
-        n = scaled.shape[0]
-        d = X.shape[1]
-        for j in range(d):
-            output.append([])
-            for i in range(self.modelpastndays, n):
-                output[j].append(scaled[i-self.modelpastndays:i, j])
-        if not any(output):
-            return None
-        try:
-            output = np.moveaxis(output, [0], [2])
-            self.Log(output.shape)
-            return output
-        except Exception as e:
-            return None
+        # the windows are strided views of the scaled matrix, without copying the rows of each window
+        output = sliding_window_view(scaled[:-1], self.modelpastndays, axis=0).transpose(0, 2, 1)
+        self.Log(output.shape)
+        return output
         
     def Initialize(self):
         '''Initialise the data and resolution required, as well as the cash and start-end dates for your algorithm. 
@@ -144,6 +162,10 @@ class ML(QCAlgorithm):
         #ML specific param
         self.modelpastndays = 5 * 24
         self.gru_units = 64
+        self.fineTune = True # fine-tune the model on the new bars between the full retrains (False: retrain from scratch every time)
+        self.replaySize = 240 # maximum number of older windows which are replayed in the fine-tuning
+        self.maxOutOfRange = 0.2 # full retrain if a larger fraction of the scaled new bars and their targets is outside the range of the scalers
+        self.maxErrorRatio = 10.0 # full retrain if the error on the new windows exceeds this multiple of the training error of the last full retrain
 
         ### Instrument
         self.instrument = "SPY"
@@ -153,7 +175,12 @@ class ML(QCAlgorithm):
 
         self.stock = self.AddEquity(self.instrument, Resolution.Hour).Symbol
 
+        #feature store
+        self.featureStoreDir = None # folder of the feature files, which keeps the technical indicators across backtests (None: in memory only)
+        self.featureStore = FeatureStore(self.featureStoreDir)
+
         #train
+        self.scheduler = RetrainScheduler(self.replaySize, self.maxOutOfRange, self.maxErrorRatio)
         self.model_trained = False
         self.days_since_last_train = 0
         self.TrainAlgo()
@@ -181,29 +208,21 @@ class ML(QCAlgorithm):
             return
         self.days_since_last_train += 1
 
-        # obtain the past history of data and obtain technical indicators
-        history = self.History(self.stock, 200 + self.modelpastndays, self.setResolution)
-        history["MA50"] = tb.MA(history["close"], timeperiod=50)
-        history["MA100"] = tb.MA(history["close"], timeperiod=100)
-        history["MA200"] = tb.MA(history["close"], timeperiod=200)
-        history["MACD"] =  tb.MACD(history["close"], fastperiod=12, slowperiod=26, signalperiod=9)[0]
-        history["RSI"] =  tb.RSI(history["close"], timeperiod=14)/100
-        history["lc"] = history["close"].shift(1)
-        history["pc"] = history["close"]/history["lc"] - 1 
-        # history["n5c"] = history["close"].shift(-self.tradePeriod)
-        # history["n5pc"] = history["n5c"]/history["close"] - 1
-        history.dropna(inplace=True)
-        history["LMA50"] = (history["close"] - history["MA50"])/history["close"]
-        history["LMA100"] = (history["close"] - history["MA100"])/history["close"]
-        history["LMA200"] = (history["close"] - history["MA200"])/history["close"]
-        # history["signal"] =  history["n5pc"].apply(lambda x: 1 if x > 0.03 else ( -1 if x < -0.03 else 0))
-        
-        # concatenate all the technical indicators into a DataFrame (or a 2D numpy array)
-        X = history[["LMA50","LMA100","LMA200","RSI","MACD"]]
-        X = self.preprocess_X(X, train=False)
-        if X is None:
+        # append the latest bar to the feature store,
+        # which is updated with the past history of data if it does not have the bars before
+        if not self.featureStore.append(self.stock, self.setResolution, trade_bar.EndTime, price):
+            history = self.History(self.stock, 200 + self.modelpastndays, self.setResolution)
+            self.featureStore.update(self.stock, self.setResolution, history)
+
+        # read the technical indicators of the latest bars from the feature store into a 2D numpy array
+        features = self.featureStore.window(self.stock, self.setResolution, trade_bar.EndTime, self.modelpastndays + 1)
+        if features is None:
+            return
+        X = np.column_stack([features[name] for name in ["LMA50","LMA100","LMA200","RSI","MACD"]])
+        X = X[~np.isnan(X).any(axis=1)]
+        X_test = self.preprocess_X(X, last_window=True)
+        if X_test is None:
             return
-        X_test = np.array([X[-1]])
 
         # obtain predictions from the model and generate signals
         raw_pred = self.model.predict(X_test)
@@ -304,4 +323,10 @@ class ML(QCAlgorithm):
                 ticket = self.MarketOrder(self.stock, -q)
                 self.Log(f"Price: {price}, signal: {signal}, sell {q}")
                 self.traded = True
-                self.placedTrade = self.Time.strftime("%Y-%m-%d %H:%M")
\ No newline at end of file
+                self.placedTrade = self.Time.strftime("%Y-%m-%d %H:%M")
+
+    def OnEndOfAlgorithm(self):
+        '''Saves the features of the latest bars to the feature store, and logs the retrains of the model. '''
+        self.featureStore.flush()
+        self.Log(f"Feature store: {self.featureStore.summary()}")
+        self.Log(f"Retrains: {self.scheduler.summary()}")
@@ -0,0 +1,235 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from indicators import IndicatorEngine, FEATURE_NAMES
+
+# the columns of each table of the store, the closing prices of the bars and the features of the model
+COLUMNS = ["close"] + FEATURE_NAMES
+
+
+# a table of the closing prices and features of the bars of a symbol at a resolution, with one array per column
+# the arrays have spare capacity, so that the features of new bars are appended in place
+class FeatureTable:
+    def __init__(self):
+        '''Initializer method. '''
+        # the indicator engine is updated with every bar of the table, so that it continues from the last bar
+        self.engine = IndicatorEngine()
+        self.n = 0
+        # the number of rows which are saved to the files of the store
+        self.n_saved = 0
+        self.times = np.empty(0, dtype="datetime64[ns]")
+        self.columns = {name: np.empty(0) for name in COLUMNS}
+
+    def reserve(self, n: int):
+        '''Grows the arrays to hold at least n rows, doubling their capacity. '''
+        capacity = len(self.times)
+        if n <= capacity:
+            return
+        capacity = max(n, 2 * capacity, 256)
+        times = np.empty(capacity, dtype="datetime64[ns]")
+        times[:self.n] = self.times[:self.n]
+        self.times = times
+        for name, column in self.columns.items():
+            self.columns[name] = np.empty(capacity)
+            self.columns[name][:self.n] = column[:self.n]
+
+    def append(self, times: np.array, closes: np.array):
+        '''Appends bars after the last bar of the table, and calculates their features with the indicator engine.
+
+        Arguments:
+            times: The end times of the bars.
+            closes: The closing prices of the bars.
+        '''
+        start, end = self.n, self.n + len(times)
+        self.reserve(end)
+        self.times[start:end] = times
+        self.columns["close"][start:end] = closes
+        # the features of the bars before the indicators have the full period of prices are NaN, as in TA-Lib
+        features = np.full((len(times), len(FEATURE_NAMES)), np.nan)
+        for i, close in enumerate(closes):
+            self.engine.update(close)
+            if self.engine.is_ready:
+                features[i] = self.engine.features()[0]
+        for j, name in enumerate(FEATURE_NAMES):
+            self.columns[name][start:end] = features[:, j]
+        self.n = end
+
+    def find(self, time: np.datetime64) -> int:
+        '''Finds the row of the bar which ends at a time, or -1 if the table does not have the bar. '''
+        i = int(np.searchsorted(self.times[:self.n], time))
+        if i < self.n and self.times[i] == time:
+            return i
+        return -1
+
+    def slice(self, start: int, end: int) -> dict:
+        '''Obtains the read-only views of the feature columns of the rows from start (inclusive) to end (exclusive). '''
+        views = {}
+        for name in FEATURE_NAMES:
+            views[name] = self.columns[name][start:end]
+            views[name].flags.writeable = False
+        return views
+
+
+# a store of the features of the ML models, keyed by symbol, resolution, feature and the end time of the bars
+# the features of the bars which are already in the store are read as views of its columns without being calculated again,
+# and only the bars after the last stored bar are appended. if a directory is given, the columns are saved to one binary file
+# per feature, so that the features are kept across backtests, e.g. in the parameter sweeps
+class FeatureStore:
+    def __init__(self, directory=None):
+        '''Initializer method.
+
+        Arguments:
+            directory: The folder of the feature files, or None to keep the features in memory only. Default: None.
+        '''
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.tables = {}
+        self.warm_up_period = IndicatorEngine().warm_up_period
+        self.rows_read = 0
+        self.rows_calculated = 0
+        self.rebuilds = 0
+
+    def get_table_path(self, symbol, resolution) -> str:
+        '''Obtains the folder of the files of a table, one per column, together with the state of its indicator engine. '''
+        return os.path.join(self.directory, f"{symbol}_{str(resolution).split('.')[-1]}")
+
+    def table(self, symbol, resolution) -> FeatureTable:
+        '''Obtains the table of a symbol at a resolution, which is loaded from its files at the first use. '''
+        key = (str(symbol), str(resolution))
+        if key not in self.tables:
+            self.tables[key] = self.load(symbol, resolution)
+        return self.tables[key]
+
+    def load(self, symbol, resolution) -> FeatureTable:
+        '''Loads a table from its files, or creates an empty table if the files are missing or incomplete. '''
+        table = FeatureTable()
+        if self.directory is None:
+            return table
+        path = self.get_table_path(symbol, resolution)
+        try:
+            with open(os.path.join(path, "engine.pkl"), "rb") as f:
+                engine = pickle.load(f)
+            times = np.fromfile(os.path.join(path, "time.bin"), dtype="datetime64[ns]")
+            columns = {name: np.fromfile(os.path.join(path, f"{name}.bin")) for name in COLUMNS}
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return table
+        # the files are incomplete if the saving was interrupted, and outdated if the periods of the indicators have changed
+        n = len(times)
+        if engine.n != n or any(len(column) != n for column in columns.values()) or engine.periods != table.engine.periods:
+            return table
+        table.engine = engine
+        table.times = times
+        table.columns = columns
+        table.n = table.n_saved = n
+        return table
+
+    def save(self, symbol, resolution):
+        '''Appends the unsaved rows of a table to its files, and saves the state of its indicator engine. '''
+        table = self.table(symbol, resolution)
+        if self.directory is None or table.n_saved == table.n:
+            return
+        path = self.get_table_path(symbol, resolution)
+        os.makedirs(path, exist_ok=True)
+        # the files are rewritten if the table was rebuilt, and appended otherwise
+        mode = "ab" if table.n_saved > 0 else "wb"
+        start, end = table.n_saved, table.n
+        with open(os.path.join(path, "time.bin"), mode) as f:
+            table.times[start:end].tofile(f)
+        for name in COLUMNS:
+            with open(os.path.join(path, f"{name}.bin"), mode) as f:
+                table.columns[name][start:end].tofile(f)
+        # the state of the engine is written last, to a temporary file first, so that an interrupted save is detected when loading
+        temp_path = os.path.join(path, "engine.pkl.tmp")
+        with open(temp_path, "wb") as f:
+            pickle.dump(table.engine, f)
+        os.replace(temp_path, os.path.join(path, "engine.pkl"))
+        table.n_saved = end
+
+    def flush(self):
+        '''Saves the unsaved rows of all the tables. '''
+        for symbol, resolution in list(self.tables.keys()):
+            self.save(symbol, resolution)
+
+    def rebuild(self, symbol, resolution) -> FeatureTable:
+        '''Replaces the table of a symbol at a resolution with an empty table. '''
+        if self.table(symbol, resolution).n > 0:
+            self.rebuilds += 1
+        table = FeatureTable()
+        self.tables[(str(symbol), str(resolution))] = table
+        return table
+
+    def update(self, symbol, resolution, history: pd.DataFrame) -> dict:
+        '''Adds the bars of a history request to the store, and obtains their features.
+        The bars which are in the store are read from it, and the bars after the last stored bar are appended.
+        If the bars do not continue the stored bars (or their closing prices differ), the table is rebuilt from the history.
+
+        Arguments:
+            symbol: The symbol of the history.
+            resolution: The resolution of the history.
+            history: The history DataFrame of a single symbol, indexed by symbol and time.
+
+        Returns: A dictionary of the read-only views of the feature columns, in the order of the rows of the history.
+        '''
+        table = self.table(symbol, resolution)
+        if history.empty:
+            return table.slice(0, 0)
+        times = history.index.get_level_values("time").values.astype("datetime64[ns]")
+        closes = history["close"].values.astype(float)
+        start = table.find(times[0])
+        # the number of bars of the history which are in the table
+        n_stored = min(table.n - start, len(times)) if start >= 0 else 0
+        if start < 0 or not np.array_equal(table.times[start:start + n_stored], times[:n_stored]) or \
+                not np.array_equal(table.columns["close"][start:start + n_stored], closes[:n_stored]):
+            table = self.rebuild(symbol, resolution)
+            start, n_stored = 0, 0
+        table.append(times[n_stored:], closes[n_stored:])
+        self.rows_read += n_stored
+        self.rows_calculated += len(times) - n_stored
+        self.save(symbol, resolution)
+        return table.slice(start, start + len(times))
+
+    def append(self, symbol, resolution, time, close: float) -> bool:
+        '''Adds the latest bar to the store, if it is after the last stored bar.
+
+        Arguments:
+            symbol: The symbol of the bar.
+            resolution: The resolution of the bar.
+            time: The end time of the bar.
+            close: The closing price of the bar.
+
+        Returns: A boolean value indicating whether the store has the bar. If not (e.g. the store is empty), the store
+            should be updated with a history request.
+        '''
+        table = self.table(symbol, resolution)
+        if table.n == 0:
+            return False
+        time = np.datetime64(time, "ns")
+        if time > table.times[table.n - 1]:
+            table.append([time], [close])
+            self.rows_calculated += 1
+            return True
+        i = table.find(time)
+        if i >= 0 and table.columns["close"][i] == close:
+            self.rows_read += 1
+            return True
+        return False
+
+    def window(self, symbol, resolution, time, n: int) -> dict:
+        '''Obtains the features of the last n bars up to the bar which ends at a time.
+
+        Returns: A dictionary of the read-only views of the feature columns, or None if the store does not have the bar.
+        '''
+        table = self.table(symbol, resolution)
+        i = table.find(np.datetime64(time, "ns"))
+        if i < 0:
+            return None
+        return table.slice(max(i + 1 - n, 0), i + 1)
+
+    def summary(self) -> str:
+        '''Summarises the rows read from the store and calculated. '''
+        return f"{self.rows_read} rows read, {self.rows_calculated} rows calculated, {self.rebuilds} rebuilds"
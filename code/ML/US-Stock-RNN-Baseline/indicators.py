@@ -0,0 +1,145 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+from collections import deque
+
+
+# the names of the features of the model, in the order of the feature vector
+FEATURE_NAMES = ["LMA50", "LMA100", "LMA200", "RSI", "MACD", "pc"]
+
+
+# a streaming engine of the technical indicators of the model, which is updated with one closing price at a time
+# the moving averages are kept as running sums over ring buffers, and the MACD and RSI as the smoothed states of TA-Lib,
+# so that each update takes constant time, and the indicators are the same as tb.MA, tb.MACD and tb.RSI of the whole series
+class IndicatorEngine:
+    def __init__(self, ma_periods=(50, 100, 200), rsi_period=14, macd_periods=(12, 26, 9)):
+        '''Initializer method.
+
+        Arguments:
+            ma_periods: The periods of the moving averages of the LMA features. Default: (50, 100, 200).
+            rsi_period: The period of the RSI. Default: 14.
+            macd_periods: The fast, slow and signal periods of the MACD. Default: (12, 26, 9).
+        '''
+        self.ma_periods = ma_periods
+        self.rsi_period = rsi_period
+        self.fast_period, self.slow_period, self.signal_period = macd_periods
+        # the number of closing prices which the engine has been updated with, and the latest two of them
+        self.n = 0
+        self.close = None
+        self.last_close = None
+        # the latest closing prices of the longest moving average, and the running sum of each moving average
+        self.closes = deque(maxlen=max(max(ma_periods), self.slow_period))
+        self.ma_sums = {period: 0 for period in ma_periods}
+        self.updates_since_resum = 0
+        # the EMAs of the MACD, which are seeded with the simple averages of the first slow period of prices as in TA-Lib
+        self.fast_k = 2 / (self.fast_period + 1)
+        self.slow_k = 2 / (self.slow_period + 1)
+        self.fast_ema = None
+        self.slow_ema = None
+        # the smoothed gains and losses of the RSI, which are the simple averages of the first rsi_period of changes
+        self.avg_gain = 0
+        self.avg_loss = 0
+
+    def seed(self, closes: np.array):
+        '''Updates the engine with the past closing prices, in the chronological order.
+
+        Arguments:
+            closes: The past closing prices, e.g. the close column of History.
+        '''
+        for close in closes:
+            self.update(close)
+
+    def update(self, close: float):
+        '''Updates the indicators with the latest closing price.
+
+        Arguments:
+            close: The latest closing price.
+        '''
+        close = float(close)
+        self.last_close, self.close = self.close, close
+        self.n += 1
+        n = self.n
+
+        # the running sums of the moving averages, less the prices which leave the windows
+        for period in self.ma_periods:
+            self.ma_sums[period] += close
+            if n > period:
+                self.ma_sums[period] -= self.closes[-period]
+        self.closes.append(close)
+        self.updates_since_resum += 1
+        # the sums are recalculated once per window, so that the rounding errors of the updates do not accumulate
+        if self.updates_since_resum >= self.closes.maxlen:
+            self.resum()
+
+        # the EMAs start at the end of the first slow period, the fast EMA with the average of its last fast period of prices
+        if n == self.slow_period:
+            self.slow_ema = sum(self.closes) / self.slow_period
+            self.fast_ema = sum(list(self.closes)[-self.fast_period:]) / self.fast_period
+        elif n > self.slow_period:
+            self.slow_ema = (close - self.slow_ema) * self.slow_k + self.slow_ema
+            self.fast_ema = (close - self.fast_ema) * self.fast_k + self.fast_ema
+
+        # Wilder's smoothing of the gains and losses of the RSI, after the simple averages of the first rsi_period of changes
+        if n > 1:
+            change = close - self.last_close
+            gain, loss = max(change, 0), max(-change, 0)
+            if n <= self.rsi_period + 1:
+                self.avg_gain += gain
+                self.avg_loss += loss
+                if n == self.rsi_period + 1:
+                    self.avg_gain /= self.rsi_period
+                    self.avg_loss /= self.rsi_period
+            else:
+                self.avg_gain = (self.avg_gain * (self.rsi_period - 1) + gain) / self.rsi_period
+                self.avg_loss = (self.avg_loss * (self.rsi_period - 1) + loss) / self.rsi_period
+
+    def resum(self):
+        '''Recalculates the running sums of the moving averages from the prices in the ring buffer. '''
+        closes = list(self.closes)
+        for period in self.ma_periods:
+            self.ma_sums[period] = sum(closes[-period:])
+        self.updates_since_resum = 0
+
+    @property
+    def periods(self) -> tuple:
+        '''The periods of the indicators, which identify the features of the engine. '''
+        return (tuple(self.ma_periods), self.rsi_period, self.fast_period, self.slow_period, self.signal_period)
+
+    @property
+    def warm_up_period(self) -> int:
+        '''The number of prices for all the indicators to have their full period, i.e. the first bar where none of the TA-Lib outputs are NaN. '''
+        return max(max(self.ma_periods), self.slow_period + self.signal_period - 1, self.rsi_period + 1)
+
+    @property
+    def is_ready(self) -> bool:
+        '''Whether all the indicators have the full period of prices. '''
+        return self.n >= self.warm_up_period
+
+    def moving_average(self, period: int) -> float:
+        '''Obtains the simple moving average of a period, one of ma_periods. '''
+        return self.ma_sums[period] / period
+
+    @property
+    def macd(self) -> float:
+        '''Obtains the MACD line, the difference of the fast and slow EMAs. '''
+        return self.fast_ema - self.slow_ema
+
+    @property
+    def rsi(self) -> float:
+        '''Obtains the RSI, from 0 to 100. '''
+        total = self.avg_gain + self.avg_loss
+        # TA-Lib gives 0 when the prices have not changed over the period
+        if abs(total) < 1e-14:
+            return 0
+        return 100 * self.avg_gain / total
+
+    def features(self) -> np.array:
+        '''Obtains the feature vector of the model from the latest indicators.
+
+        Returns: A numpy array of shape (1, 6), with the LMA50, LMA100, LMA200, RSI (scaled to 0 to 1), MACD and pc features.
+        '''
+        close = self.close
+        lma = [(close - self.moving_average(period)) / close for period in self.ma_periods]
+        pc = close / self.last_close - 1
+        return np.array([lma + [self.rsi / 100, self.macd, pc]])
@@ -2,6 +2,7 @@
 from AlgorithmImports import *
 #endregion
 import numpy as np
+from collections import deque
 from scipy.stats import norm as normal
 
 
@@ -61,4 +62,80 @@ class LogNormal:
         Returns: The calculated tail value at risk (conditional value at risk). 
         '''
         assert 0 < alpha < 1
-        return np.exp(self.mu + 1 / 2 * self.sigma ** 2) * normal.cdf(self.sigma - normal.ppf(alpha)) / (1 - alpha)
\ No newline at end of file
+        return np.exp(self.mu + 1 / 2 * self.sigma ** 2) * normal.cdf(self.sigma - normal.ppf(alpha)) / (1 - alpha)
+
+
+# a log normal class over a rolling window of the latest prices, which is updated with one price at a time
+# the running sums of the log prices and the squared log prices give the same estimates as LogNormal.fit with "MLE" in constant time
+class RollingLogNormal(LogNormal):
+    def __init__(self, window: int):
+        '''Initializer method. 
+        
+        Arguments:
+            window: The number of the latest prices to fit the model to. 
+        '''
+        self.window = window
+        self.log_y = deque(maxlen=window)
+        self.n = 0
+        self.mu = None
+        self.sigma = None
+        # the log prices are shifted by a reference value close to their mean, so that the squared sums do not lose precision
+        self.shift = None
+        self.sum_log_y = 0
+        self.sum_squared_log_y = 0
+        self.updates_since_resum = 0
+        # the values at risk of the current parameters, by the probability level
+        self.values_at_risk = {}
+    
+    def update(self, y: float):
+        '''Adds the latest price to the window, and updates the model parameters. 
+        
+        Arguments: 
+            y: The latest price. 
+        '''
+        log_y = np.log(y)
+        if self.shift is None:
+            self.shift = log_y
+        if len(self.log_y) == self.window:
+            dropped = self.log_y[0] - self.shift
+            self.sum_log_y -= dropped
+            self.sum_squared_log_y -= dropped ** 2
+        self.log_y.append(log_y)
+        self.n = len(self.log_y)
+        self.sum_log_y += log_y - self.shift
+        self.sum_squared_log_y += (log_y - self.shift) ** 2
+        self.updates_since_resum += 1
+        # the sums are recalculated once per window, so that the rounding errors of the updates do not accumulate
+        if self.updates_since_resum >= self.window:
+            self.resum()
+        self.update_parameters()
+    
+    def resum(self):
+        '''Recalculates the running sums from the prices in the window, shifted by their current mean. '''
+        log_y = np.array(self.log_y)
+        self.shift = log_y.mean()
+        self.sum_log_y = (log_y - self.shift).sum()
+        self.sum_squared_log_y = ((log_y - self.shift) ** 2).sum()
+        self.updates_since_resum = 0
+    
+    def update_parameters(self):
+        '''Updates the model parameters from the running sums, and clears the cached values at risk if they change. '''
+        n = self.n
+        mu, sigma = self.mu, self.sigma
+        self.mu = self.shift + self.sum_log_y / n
+        if n > 1:
+            self.sigma = max(self.sum_squared_log_y - self.sum_log_y ** 2 / n, 0) / (n - 1)
+        if self.mu != mu or self.sigma != sigma:
+            self.values_at_risk = {}
+    
+    def calculate_value_at_risk(self, alpha: float) -> float:
+        '''Calculates the value at risk at a given probability level, which is cached until the parameters change. 
+        
+        Arguments: 
+            alpha: The probability level. 
+        
+        Returns: The calculated value at risk (percentile). 
+        '''
+        if alpha not in self.values_at_risk:
+            self.values_at_risk[alpha] = super().calculate_value_at_risk(alpha)
+        return self.values_at_risk[alpha]
@@ -1,7 +1,7 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-from lognormal import LogNormal
+from lognormal import RollingLogNormal
 
 # The trading strategy based on the log-normal assumption in the cryptocurrency market. 
 # NOTE: This algorithm is not published in the report and final results, 
@@ -55,8 +55,16 @@ class VaRTrading(QCAlgorithm):
         if not data.Bars.ContainsKey(self.ticker):
             return
         
+        # update the model with the latest close, the model is fitted to the past closes on the first bar
+        if self.model is None:
+            self.pastClosingPrices = self.GetPastClosingPrices(self.minutesBefore)
+            self.model = RollingLogNormal(self.minutesBefore)
+            for price in self.pastClosingPrices:
+                self.model.update(price)
+        else:
+            self.model.update(data.Bars[self.ticker].Close)
+
         # obtain high, low, close prices
-        self.pastClosingPrices = self.GetPastClosingPrices(self.minutesBefore)
         currentDayLow, currentDayHigh = data.Bars[self.ticker].Low, data.Bars[self.ticker].High
         holding = self.Portfolio[self.ticker]
 
@@ -67,12 +75,9 @@ class VaRTrading(QCAlgorithm):
         currentPrice = data.Bars[self.ticker].Close
         positions = holding.Quantity
         
-        if len(self.pastClosingPrices) < 2:
+        if self.model.n < 2:
             return
 
-        # fit model
-        self.model = LogNormal(self.pastClosingPrices)
-
         # trade
         if (positions > 0 and currentPrice < averagePrice * (1 - self.stopLossRatio)) or (positions < 0 and currentPrice > (1 + self.stopLossRatio)):
             self.Liquidate()
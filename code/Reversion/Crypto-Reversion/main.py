@@ -2,7 +2,7 @@
 from AlgorithmImports import *
 # endregion
 import numpy as numpy
-from scipy.stats import t
+from studentt import StudentT
 import talib as tb
 
 
@@ -24,6 +24,8 @@ class CryptoReversion(QCAlgorithm):
         self.nDaysHistory = 365
         self.percentile = 0.05
         self.extremePercentile = 0.01
+        self.fitMethod = "MLE" # method to fit the t distribution to the past ratios, "MLE" (warm-started from the previous day) or "QM" (quantile matching, faster)
+        self.ratioDistribution = StudentT(self.fitMethod)
 
         self.SetBrokerageModel(BrokerageName.Binance, AccountType.Margin)
 
@@ -69,8 +71,8 @@ class CryptoReversion(QCAlgorithm):
         currentRatio = history['Ratio'].values[-1]
 
         # determine the ratios to long, short and stop loss based on the critical values
-        lowRatio, highRatio = self.getLowAndHighRatios(pastRatios, self.percentile)
-        stopTradingLowRatio, stopTradingHighRatio = self.getLowAndHighRatios(pastRatios, self.extremePercentile)
+        (lowRatio, highRatio), (stopTradingLowRatio, stopTradingHighRatio) = \
+            self.getLowAndHighRatios(pastRatios, [self.percentile, self.extremePercentile])
         self.stopLossPercent = 1 - pastRatios.min()
         self.takeProfitPercent = pastRatios.max() - 1
 
@@ -103,16 +105,15 @@ class CryptoReversion(QCAlgorithm):
                     self.MarketOrder(self.stock, -positions)
 
     
-    def getLowAndHighRatios(self, x: np.array, percentile: float) -> (float, float):
+    def getLowAndHighRatios(self, x: np.array, percentiles: list) -> list:
         '''Method to obtain the upper and lower critical values of the price-to-MA ratios. 
+        The t distribution is fitted once, and the critical values at all the percentages are calculated from it. 
         
         Arguments:
             x: The input price array
-            percentile: The confidence interval percentage. 
+            percentiles: The confidence interval percentages. 
         
-        Returns: The lower critical value and upper critical values of the fitted distribution. 
+        Returns: The lower critical value and upper critical values of the fitted distribution at each percentage. 
         '''
-        degFreedom, mean, sd = t.fit(x)
-        lowerCriticalValue = t.ppf(percentile / 2, degFreedom, mean, sd)
-        upperCriticalValue = t.ppf(1 - percentile / 2, degFreedom, mean, sd)
-        return lowerCriticalValue, upperCriticalValue
\ No newline at end of file
+        self.ratioDistribution.fit(x)
+        return self.ratioDistribution.calculate_critical_values(percentiles)
\ No newline at end of file
@@ -0,0 +1,60 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+import numpy as np
+from scipy.stats import t
+
+# the degrees of freedom of the quantile matching, and the ratios of the 95% to the 50% central intervals of the t distribution,
+# which decrease with the degrees of freedom towards those of the normal distribution
+QM_DEGREES_OF_FREEDOM = np.geomspace(1, 200, 400)
+QM_INTERVAL_RATIOS = t.ppf(0.975, QM_DEGREES_OF_FREEDOM) / t.ppf(0.75, QM_DEGREES_OF_FREEDOM)
+
+
+# a Student's t distribution class to fit the data and calculate the critical values
+# the parameters of the previous fit are the starting values of the next fit, as the data of consecutive days mostly overlap
+class StudentT:
+    def __init__(self, method="MLE"):
+        '''Initializer method.
+
+        Arguments:
+            method: The algorithm to fit model parameters. "MLE" (warm-started from the previous fit) or "QM" are accepted. Default: "MLE".
+        '''
+        assert method in ("MLE", "QM")
+        self.method = method
+        self.df = None
+        self.loc = None
+        self.scale = None
+
+    def fit(self, y: np.array):
+        '''The method to fit the model parameters.
+
+        Arguments:
+            y: The array as an input
+        '''
+        # fit the parameters using either maximum likelihood estimation (MLE)
+        # or quantile matching (QM) of the median, the interquartile range and the 95% central interval
+        if self.method == 'MLE':
+            if self.df is None:
+                self.df, self.loc, self.scale = t.fit(y)
+            else:
+                self.df, self.loc, self.scale = t.fit(y, self.df, loc=self.loc, scale=self.scale)
+        elif self.method == 'QM':
+            q025, q25, q50, q75, q975 = np.quantile(y, [0.025, 0.25, 0.5, 0.75, 0.975])
+            # the ratios are decreasing, so they are reversed for the interpolation
+            ratio = (q975 - q025) / (q75 - q25)
+            self.df = np.interp(ratio, QM_INTERVAL_RATIOS[::-1], QM_DEGREES_OF_FREEDOM[::-1])
+            self.loc = q50
+            self.scale = (q75 - q25) / (2 * t.ppf(0.75, self.df))
+
+    def calculate_critical_values(self, percentiles: list) -> list:
+        '''Calculates the lower and upper critical values of the fitted distribution at several percentages.
+
+        Arguments:
+            percentiles: The confidence interval percentages.
+
+        Returns: A list of the lower and upper critical values at each percentage.
+        '''
+        percentiles = np.asarray(percentiles)
+        lower = t.ppf(percentiles / 2, self.df, self.loc, self.scale)
+        upper = t.ppf(1 - percentiles / 2, self.df, self.loc, self.scale)
+        return list(zip(lower, upper))
@@ -1,7 +1,7 @@
 # region imports
 from AlgorithmImports import *
 # endregion
-from lognormal import LogNormal
+from lognormal import RollingLogNormal
 
 # The trading strategy based on the log-normal assumption in the US stock market. 
 # NOTE: This algorithm is not published in the report and final results, 
@@ -56,8 +56,16 @@ class VaRTrading(QCAlgorithm):
         if not data.Bars.ContainsKey(self.ticker):
             return
         
+        # update the model with the latest close, the model is fitted to the past closes on the first bar
+        if self.model is None:
+            self.pastClosingPrices = self.GetPastClosingPrices(self.hoursBefore)
+            self.model = RollingLogNormal(self.hoursBefore)
+            for price in self.pastClosingPrices:
+                self.model.update(price)
+        else:
+            self.model.update(data.Bars[self.ticker].Close)
+
         # obtain high, low, close prices
-        self.pastClosingPrices = self.GetPastClosingPrices(self.hoursBefore)
         currentDayLow, currentDayHigh = data.Bars[self.ticker].Low, data.Bars[self.ticker].High
         holding = self.Portfolio[self.ticker]
 
@@ -68,8 +76,8 @@ class VaRTrading(QCAlgorithm):
         currentPrice = data.Bars[self.ticker].Close
         positions = holding.Quantity
         
-        # fit model
-        self.model = LogNormal(self.pastClosingPrices)
+        if self.model.n < 2:
+            return
 
         # normal trading hours: check if stop loss reached first
         if (positions > 0 and currentPrice < averagePrice * (1 - self.stopLossRatio)) or (positions < 0 and currentPrice > (1 + self.stopLossRatio)):
@@ -102,11 +110,11 @@ class VaRTrading(QCAlgorithm):
             else:
                 self.recentSellPrice = orderEvent.FillPrice
     
-    def GetPastClosingPrices(self, minutesBefore: int) -> np.array:
+    def GetPastClosingPrices(self, hoursBefore: int) -> np.array:
         '''Obtains the past closing prices. 
 
         Arguments: 
-            minutesBefore: The number of minutes before the current time point. 
+            hoursBefore: The number of hours before the current time point. 
 
         Returns: A numpy array containing the historical closing prices for the past history requested. 
         '''
@@ -1,5 +1,7 @@
 from AlgorithmImports import *
 from datetime import datetime, timedelta
+from turningpoints import TurningPointDetector
+from dailycache import DailyCache
 
 
 class CryptoMA(QCAlgorithm):
@@ -40,6 +42,12 @@ class CryptoMA(QCAlgorithm):
         ### End Parameters
 
 
+        # (v5) detector of the peaks and troughs for the dynamic MA
+        self.turningPoints = TurningPointDetector(self.n_days, self.rolling_window, self.rolling_reset, self.default_MA, self.MA_coef, self.min_MA)
+
+        # (v5) cache of the quantities derived from daily data, recalculated once per daily bar
+        self.dailyCache = DailyCache()
+
         self.upperlinepos = ""
         self.lowerlinepos = ""
         self.cur_purchaseprice = 0
@@ -49,6 +57,46 @@ class CryptoMA(QCAlgorithm):
 
 
 
+    def LastDailyBarTime(self):
+        '''Obtains the time of the latest daily bar returned by the history, which keys the daily cache. 
+        In live trading, the daily history may lag the bars of the algorithm, so the cache is only refreshed once the history has the new bar. 
+
+        Returns: The end time of the latest daily bar, or None if the history is empty. 
+        '''
+        df = self.History(self.symbol, 1, Resolution.Daily)
+        if 'close' not in df or df.shape[0] == 0:
+            return
+        return df.index.get_level_values("time")[-1]
+
+    def CalculateMA(self):
+        '''Calculates the dynamic moving average of the underlying from the daily closes. 
+
+        Returns: The moving average, or None if the data is incomplete. 
+        '''
+        df = self.History(self.symbol, self.n_days, Resolution.Daily)
+        # self.Log(f"{'close' in df} {df.shape[0]}")
+        if 'close' not in df or df.shape[0] != self.n_days:
+            return
+
+        ### (v5) Analysis to calculate MA
+        # dynamic MA is calculated based on the number of peaks and troughs
+        # the detector only consumes the daily closes which it has not seen before
+        self.turningPoints.sync(df.index.get_level_values("time"), df["close"].values)
+        final_MA = self.turningPoints.final_MA
+
+        df = self.History(self.symbol, final_MA, Resolution.Daily)
+        MA = df['close'].mean()
+        return MA
+
+    def CalculateVolatility(self):
+        '''Calculates the past volatility of the underlying to determine the width of the MA bands. 
+
+        Returns: The past volatility to open trades and the past volatility to close trades. 
+        '''
+        df3 = self.History(self.symbol, self.volatility_n_days, Resolution.Daily)
+        df4 = self.History(self.symbol, self.close_volatility_n_days, Resolution.Daily)
+        return df3['close'].pct_change().dropna().std(), df4['close'].pct_change().dropna().std()
+
     def OnData(self, slice:Slice):
         '''OnData event is the primary entry point for your algorithm. Each new data point will be pumped in here.
         Arguments:
@@ -63,100 +111,22 @@ class CryptoMA(QCAlgorithm):
         else:
             return
         
-        df = self.History(self.symbol, self.n_days, Resolution.Daily)
-        # self.Log(f"{'close' in df} {df.shape[0]}")
-        if 'close' not in df or df.shape[0] != self.n_days:
+        # (v5) the dynamic MA only changes when a new daily bar is completed
+        last_daily_bar_time = self.LastDailyBarTime()
+        if last_daily_bar_time is None:
+            return
+        MA = self.dailyCache.get(last_daily_bar_time, "MA", self.CalculateMA)
+        if MA is None:
             return
-
-        ### (v5) Analysis to calculate MA
-
-        lastmax = 0
-        lastmaxindex = 0
-        reset = True
-        high_points = []
-        low_points = []
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].max()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax > lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 0:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            high_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax < lastmax:
-                        high_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 0
-                    reset = True
-
-        lastmax = 1000000000
-        lastmaxindex = 0
-        reset = True
-        for i in range(len(df["close"].values)):
-            if i > 4:
-                curmax = df.iloc[i-self.rolling_window:i+1]["close"].min()
-                # print(i,curmax,lastmax,lastmaxindex)
-                if curmax < lastmax:
-                    if lastmaxindex >= i - self.rolling_window or lastmaxindex == 1000000000:
-                        lastmaxindex = i
-                        lastmax = curmax
-                    else:
-                        if not reset:
-                            low_points.append(lastmaxindex)
-                        lastmaxindex = i
-                        lastmax = curmax
-                        reset = False
-                if i - lastmaxindex > self.rolling_reset or i == len(df["close"].values)-1:
-                    if not reset or curmax > lastmax:
-                        low_points.append(lastmaxindex)
-                    lastmaxindex = 0
-                    lastmax = 1000000000
-                    reset = True
-
-        high_diff = []
-        if len(high_points) >= 2:
-            for i in range(1,len(high_points)):
-                high_diff.append(high_points[i]-high_points[i-1])
-
-        low_diff = []
-        if len(low_points) >= 2:
-            for i in range(1,len(low_points)):
-                low_diff.append(low_points[i]-low_points[i-1])
-        
-        if len(high_diff) == 0:
-            high_MA = self.default_MA
-        else:
-            high_MA = sum(high_diff) / len(high_diff)
-
-        if len(low_diff) == 0:
-            low_MA = self.default_MA
-        else:
-            low_MA = sum(low_diff) / len(low_diff)
-        
-        final_MA = int((high_MA + low_MA)/2*self.MA_coef)
-
-        if final_MA < self.min_MA:
-            final_MA = self.min_MA
-
-        df = self.History(self.symbol, final_MA, Resolution.Daily)
-        MA = df['close'].mean()
 
         close_MA = MA
 
         quantity = self.Portfolio[self.symbol].Quantity
 
-        df3 = self.History(self.symbol, self.volatility_n_days, Resolution.Daily)
-        self.percent_above = df3['close'].pct_change().dropna().std() * self.volatility_coefficient
+        volatility, close_volatility = self.dailyCache.get(last_daily_bar_time, "volatility", self.CalculateVolatility)
+        self.percent_above = volatility * self.volatility_coefficient
         
-        df4 = self.History(self.symbol, self.close_volatility_n_days, Resolution.Daily)
-        self.close_above = df4['close'].pct_change().dropna().std() * self.close_volatility_coefficient
+        self.close_above = close_volatility * self.close_volatility_coefficient
 
         if abs(quantity)*price > 10:
             self.highwatermark = max(price,self.highwatermark)
@@ -219,3 +189,7 @@ class CryptoMA(QCAlgorithm):
             self.lowerlinepos = "Lower"
         else:
             self.lowerlinepos = "Upper"
+
+    def OnEndOfAlgorithm(self):
+        '''Logs the hit and miss counts of the daily cache at the end of the algorithm. '''
+        self.Log(f"Daily cache: {self.dailyCache.hits} hits, {self.dailyCache.misses} misses, hit ratio {self.dailyCache.hit_ratio():.3f}")
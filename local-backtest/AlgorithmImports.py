@@ -0,0 +1,9 @@
+# the subset of the QuantConnect API used by the strategies, for the local backtest
+# the real AlgorithmImports also imports the common python packages into the strategies
+from datetime import datetime, timedelta, date
+from typing import Union, List, Dict, Tuple, Optional
+import numpy as np
+import pandas as pd
+from qctypes import *
+from portfolio import Security, SecurityHolding, Portfolio
+from algorithm import QCAlgorithm
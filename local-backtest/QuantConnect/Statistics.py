@@ -0,0 +1 @@
+from qctypes import Trade, TradeBuilder, FillGroupingMethod, FillMatchingMethod
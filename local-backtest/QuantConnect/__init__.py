@@ -0,0 +1 @@
+# the QuantConnect namespaces imported directly by the strategies
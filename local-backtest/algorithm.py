@@ -0,0 +1,418 @@
+import sys
+from datetime import datetime, timedelta
+import pandas as pd
+from qctypes import *
+from portfolio import Security, Portfolio
+from datafeed import DataFeed
+
+# the leverage of margin accounts, and the fee model (rate of the traded value, minimum fee, fee per unit) of each brokerage
+MARGIN_LEVERAGE = {BrokerageName.Binance: 3.0, BrokerageName.Bitfinex: 3.3}
+FEE_MODELS = {
+    BrokerageName.Default: (0.0, 0.0, 0.0),
+    BrokerageName.Binance: (0.001, 0.0, 0.0),
+    BrokerageName.Bitfinex: (0.002, 0.0, 0.0),
+    BrokerageName.InteractiveBrokersBrokerage: (0.0, 1.0, 0.005),
+}
+
+
+class OrderProperties:
+    def __init__(self):
+        self.TimeInForce = TimeInForce.GoodTilCanceled
+
+
+class AlgorithmSettings:
+    def __init__(self):
+        self.FreePortfolioValuePercentage = 0.0025
+
+
+class UniverseSettings:
+    def __init__(self):
+        self.Resolution = Resolution.Minute
+        self.DataNormalizationMode = DataNormalizationMode.Adjusted
+
+
+# aggregates the bars of a security into bars of a longer period, e.g. daily bars from hourly bars
+class Consolidator:
+    def __init__(self, symbol: Symbol, period: timedelta, handler):
+        '''Initializer method.
+
+        Arguments:
+            symbol: The symbol of the security.
+            period: The period of the consolidated bars, counted from midnight.
+            handler: The function called with each consolidated bar.
+        '''
+        self.symbol = symbol
+        self.period = period
+        self.handler = handler
+        self.working = None
+        self.period_end = None
+
+    def update(self, bar: TradeBar):
+        '''Adds a bar, and emits the consolidated bar once its period has ended. '''
+        if self.working is not None and bar.Time >= self.period_end:
+            self.emit()
+        if self.working is None:
+            midnight = datetime(bar.Time.year, bar.Time.month, bar.Time.day)
+            start = bar.Time - (bar.Time - midnight) % self.period
+            self.period_end = start + self.period
+            self.working = TradeBar(start, self.symbol, bar.Open, bar.High, bar.Low, bar.Close, bar.Volume, self.period)
+        else:
+            self.working.High = max(self.working.High, bar.High)
+            self.working.Low = min(self.working.Low, bar.Low)
+            self.working.Close = self.working.Price = self.working.Value = bar.Close
+            self.working.Volume += bar.Volume
+        if bar.EndTime >= self.period_end:
+            self.emit()
+
+    def emit(self):
+        bar, self.working = self.working, None
+        self.handler(bar)
+
+
+# a local stand-in of the QuantConnect QCAlgorithm, driven by the event loop in backtest.py
+class QCAlgorithm:
+    def __init__(self):
+        '''Initializer method. '''
+        self.Time = datetime(1998, 1, 1)
+        self.StartDate = self.Time
+        self.EndDate = datetime.now()
+        self.LiveMode = False
+        self.IsWarmingUp = False
+        self.Portfolio = Portfolio()
+        self.Securities = DataDictionary()
+        self.DefaultOrderProperties = OrderProperties()
+        self.Settings = AlgorithmSettings()
+        self.UniverseSettings = UniverseSettings()
+        self.TradeBuilder = TradeBuilder()
+        self.TimeZone = TimeZones.NewYork
+        self.Benchmark = None
+        self.brokerage = BrokerageName.Default
+        self.account_type = AccountType.Margin
+        self.feed = None
+        self.date_overrides = {}
+        # whether the history requests with an end time may return the bars after the current time
+        self.lookahead = False
+        self.consolidators = {}
+        self.open_orders = []
+        self.tickets = []
+        self.log_stream = sys.stdout
+        self.log_count = 0
+        self.initial_cash = 0.0
+
+    @property
+    def UtcTime(self) -> datetime:
+        # the data is replayed in the time zone of the data files, which is taken as UTC
+        return self.Time
+
+    ### set up
+
+    def SetStartDate(self, *date):
+        self.StartDate = self.date_overrides.get("start", self.to_datetime(*date))
+        self.Time = self.StartDate
+
+    def SetEndDate(self, *date):
+        self.EndDate = self.date_overrides.get("end", self.to_datetime(*date))
+
+    def SetCash(self, *args):
+        # SetCash(amount) or SetCash(currency, amount)
+        self.Portfolio.SetCash(args[-1])
+        self.initial_cash = args[-1]
+
+    def SetAccountCurrency(self, currency: str):
+        cash = self.Portfolio.Cash
+        self.Portfolio.CashBook = DataDictionary({currency: self.Portfolio.CashBook[self.Portfolio.currency]})
+        self.Portfolio.currency = currency
+        self.Portfolio.SetCash(cash)
+
+    def SetBrokerageModel(self, brokerage: BrokerageName, account_type=AccountType.Margin):
+        self.brokerage = brokerage
+        self.account_type = account_type
+        if account_type == AccountType.Cash:
+            self.Portfolio.leverage = 1.0
+        else:
+            self.Portfolio.leverage = MARGIN_LEVERAGE.get(brokerage, 2.0)
+
+    def SetTimeZone(self, time_zone: str):
+        self.TimeZone = time_zone
+
+    def SetBenchmark(self, benchmark):
+        self.Benchmark = benchmark
+
+    def SetWarmUp(self, *args):
+        self.Log("SetWarmUp is not supported by the local backtest, use History in Initialize instead")
+
+    def SetTradeBuilder(self, trade_builder: TradeBuilder):
+        self.TradeBuilder = trade_builder
+
+    def AddCrypto(self, ticker: str, resolution=Resolution.Minute, market=Market.Binance, *args, **kwargs) -> Security:
+        return self.add_security(Symbol(ticker, SecurityType.Crypto, market), resolution, 1e-8)
+
+    def AddEquity(self, ticker: str, resolution=Resolution.Minute, market=Market.USA, *args, **kwargs) -> Security:
+        return self.add_security(Symbol(ticker, SecurityType.Equity, market), resolution, 1)
+
+    def AddData(self, *args, **kwargs):
+        raise NotImplementedError("Custom data is not supported by the local backtest")
+
+    def AddOption(self, *args, **kwargs):
+        raise NotImplementedError("Options are not supported by the local backtest")
+
+    def add_security(self, symbol: Symbol, resolution: Resolution, lot_size: float) -> Security:
+        '''Subscribes to the data of a security. '''
+        security = Security(symbol, resolution, lot_size)
+        self.Securities[symbol] = security
+        self.Portfolio.add_security(security)
+        # the price is known from the last bar before the start date, as in a QuantConnect backtest
+        series = self.feed.load(symbol, resolution)
+        last = series.count_until(self.Time)
+        if last > 0:
+            self.update_price(security, series.values[last-1, 3])
+        return security
+
+    def Consolidate(self, symbol, period, handler):
+        '''Registers a handler of the bars consolidated over a period (a resolution or a timedelta). '''
+        if isinstance(period, Resolution):
+            period = RESOLUTION_PERIODS[period]
+        consolidator = Consolidator(self.Securities[symbol].Symbol, period, handler)
+        self.consolidators.setdefault(consolidator.symbol, []).append(consolidator)
+        return consolidator
+
+    ### data
+
+    def History(self, *args, **kwargs):
+        '''Requests the historical bars which end at or before the current time, following the overloads of QuantConnect:
+            History(symbol(s), periods, resolution=None): a DataFrame indexed by symbol and time
+            History(symbol(s), start, end, resolution=None): a DataFrame indexed by symbol and time
+            History(periods, resolution=None): a list of slices of all the subscribed securities
+        where periods is either a number of bars or a timedelta.
+        '''
+        if isinstance(args[0], type):
+            raise NotImplementedError("Custom data is not supported by the local backtest")
+        resolution = kwargs.get("resolution")
+        if isinstance(args[0], (int, timedelta)):
+            periods = args[0]
+            if len(args) > 1:
+                resolution = args[1]
+            return self.history_slices(list(self.Securities.keys()), periods, resolution)
+
+        symbols = args[0] if isinstance(args[0], (list, tuple)) else [args[0]]
+        if isinstance(args[1], datetime):
+            span = (args[1], args[2])
+            if len(args) > 3:
+                resolution = args[3]
+        else:
+            span = args[1]
+            if len(args) > 2:
+                resolution = args[2]
+        frames = []
+        for symbol in symbols:
+            series = self.series(symbol, resolution)
+            start, end = self.history_range(series, span)
+            if end > start:
+                frames.append(series.frame(start, end))
+        if not frames:
+            return pd.DataFrame()
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+    def series(self, symbol, resolution=None):
+        '''Obtains the bars of a subscribed security, at the subscription resolution by default. '''
+        security = self.Securities[symbol]
+        return self.feed.load(security.Symbol, resolution or security.Resolution)
+
+    def history_range(self, series, span) -> tuple:
+        '''Finds the range of the bars in a history request.
+
+        Arguments:
+            series: The bars of the security.
+            span: A number of bars, a timedelta, or a pair of start and end times.
+
+        Returns: The indices of the first bar (inclusive) and the last bar (exclusive).
+        '''
+        if isinstance(span, tuple):
+            return series.count_until(span[0]), series.count_until(span[1] if self.lookahead else min(span[1], self.Time))
+        end = series.count_until(self.Time)
+        if isinstance(span, timedelta):
+            return series.count_until(self.Time - span), end
+        return max(end - int(span), 0), end
+
+    def history_slices(self, symbols: list, span, resolution=None) -> list:
+        '''Creates the slices of a history request over several securities. '''
+        bars = {}
+        for symbol in symbols:
+            series = self.series(symbol, resolution)
+            start, end = self.history_range(series, span)
+            for i in range(start, end):
+                bar = series.bar(i)
+                bars.setdefault(bar.EndTime, {})[bar.Symbol] = bar
+        return [Slice(time, bars[time]) for time in sorted(bars)]
+
+    def update_price(self, security: Security, price: float):
+        security.Price = security.Close = price
+        security.Holdings.Price = price
+
+    ### orders
+
+    def MarketOrder(self, symbol, quantity: float, asynchronous=False, tag="", order_properties=None) -> OrderTicket:
+        return self.submit_order(symbol, quantity, OrderType.Market, tag=tag)
+
+    def LimitOrder(self, symbol, quantity: float, limit_price: float, tag="", order_properties=None) -> OrderTicket:
+        return self.submit_order(symbol, quantity, OrderType.Limit, limit_price=limit_price, tag=tag)
+
+    def StopLimitOrder(self, symbol, quantity: float, stop_price: float, limit_price: float, tag="", order_properties=None) -> OrderTicket:
+        return self.submit_order(symbol, quantity, OrderType.StopLimit, limit_price=limit_price, stop_price=stop_price, tag=tag)
+
+    def MarketOnCloseOrder(self, symbol, quantity: float, tag="", order_properties=None) -> OrderTicket:
+        return self.submit_order(symbol, quantity, OrderType.MarketOnClose, tag=tag)
+
+    def Buy(self, symbol, quantity: float) -> OrderTicket:
+        return self.MarketOrder(symbol, abs(quantity))
+
+    def Sell(self, symbol, quantity: float) -> OrderTicket:
+        return self.MarketOrder(symbol, -abs(quantity))
+
+    def SetHoldings(self, symbol, percentage: float, liquidate_existing_holdings=False, tag=""):
+        '''Trades a security to a target percentage of the portfolio value. '''
+        security = self.Securities[symbol]
+        if liquidate_existing_holdings:
+            for other in self.Portfolio:
+                if other != security.Symbol and self.Portfolio[other].Invested:
+                    self.Liquidate(other)
+        if security.Price == 0:
+            return
+        value = self.Portfolio.TotalPortfolioValue * (1 - self.Settings.FreePortfolioValuePercentage) * percentage
+        quantity = security.round_quantity(value / security.Price - security.Holdings.Quantity)
+        if quantity != 0:
+            self.MarketOrder(symbol, quantity, tag=tag)
+
+    def Liquidate(self, symbol=None, tag="Liquidated") -> list:
+        '''Cancels the open orders and closes the holdings of one or all securities. '''
+        symbols = [self.Securities[symbol].Symbol] if symbol is not None else list(self.Portfolio.keys())
+        tickets = []
+        for ticket in self.open_orders:
+            if ticket.Symbol in symbols:
+                self.cancel_order(ticket)
+        for s in symbols:
+            quantity = self.Portfolio[s].Quantity
+            if quantity != 0:
+                tickets.append(self.MarketOrder(s, -quantity, tag=tag))
+        return tickets
+
+    def submit_order(self, symbol, quantity: float, order_type: OrderType, limit_price=None, stop_price=None, tag="") -> OrderTicket:
+        '''Validates an order, then fills a market order immediately or queues the other orders. '''
+        security = self.Securities[symbol]
+        quantity = security.round_quantity(quantity)
+        ticket = OrderTicket(len(self.tickets) + 1, security.Symbol, quantity, order_type, self.Time,
+                             self.DefaultOrderProperties.TimeInForce, limit_price, stop_price, tag)
+        self.tickets.append(ticket)
+        price = limit_price if limit_price is not None else security.Price
+        if quantity == 0 or security.Price == 0:
+            return self.reject(ticket, "The order quantity is zero or the security has no price")
+        if not self.has_buying_power(security, price, quantity):
+            return self.reject(ticket, "Insufficient buying power to complete the order")
+        if order_type == OrderType.Market:
+            self.fill(ticket, security, security.Price)
+        else:
+            self.open_orders.append(ticket)
+        return ticket
+
+    def has_buying_power(self, security: Security, price: float, quantity: float) -> bool:
+        '''Determines whether the margin remaining covers the increase in the exposure of an order. '''
+        holding = security.Holdings.Quantity
+        increase = (abs(holding + quantity) - abs(holding)) * price
+        if increase <= 0:
+            return True
+        fee = self.fee(security, price, quantity)
+        return increase / self.Portfolio.leverage + fee <= self.Portfolio.MarginRemaining + 1e-9
+
+    def fee(self, security: Security, price: float, quantity: float) -> float:
+        '''Calculates the fee of a fill with the fee model of the brokerage. '''
+        rate, minimum, per_unit = FEE_MODELS.get(self.brokerage, FEE_MODELS[BrokerageName.Default])
+        if security.Symbol.SecurityType == SecurityType.Crypto:
+            minimum, per_unit = 0.0, 0.0
+        return max(minimum, abs(quantity) * (price * rate + per_unit))
+
+    def reject(self, ticket: OrderTicket, message: str) -> OrderTicket:
+        ticket.Status = OrderStatus.Invalid
+        self.Log(f"Order Error: id: {ticket.OrderId}, {message}")
+        self.OnOrderEvent(OrderEvent(ticket.OrderId, ticket.Symbol, self.Time, OrderStatus.Invalid, message=message))
+        return ticket
+
+    def cancel_order(self, ticket: OrderTicket):
+        ticket.Cancel()
+        self.open_orders.remove(ticket)
+        self.OnOrderEvent(OrderEvent(ticket.OrderId, ticket.Symbol, self.Time, OrderStatus.Canceled))
+
+    def fill(self, ticket: OrderTicket, security: Security, price: float):
+        '''Fills the whole order at a price, and records the fill in the portfolio and the trade builder. '''
+        fee = self.fee(security, price, ticket.Quantity)
+        self.Portfolio.apply_fill(security, price, ticket.Quantity, fee)
+        self.TradeBuilder.process_fill(security.Symbol, self.Time, price, ticket.Quantity, fee)
+        ticket.QuantityFilled = ticket.Quantity
+        ticket.AverageFillPrice = price
+        ticket.Status = OrderStatus.Filled
+        self.OnOrderEvent(OrderEvent(ticket.OrderId, ticket.Symbol, self.Time, OrderStatus.Filled, price, ticket.Quantity, fee))
+
+    def process_orders(self, security: Security, bar: TradeBar):
+        '''Fills the open orders of a security against a new bar, following the fill models of LEAN. '''
+        for ticket in [ticket for ticket in self.open_orders if ticket.Symbol == security.Symbol]:
+            if ticket.TimeInForce == TimeInForce.Day and bar.Time.date() > ticket.Time.date():
+                self.cancel_order(ticket)
+                continue
+            price = None
+            buy = ticket.Quantity > 0
+            if ticket.OrderType == OrderType.MarketOnClose:
+                price = bar.Close
+            elif ticket.OrderType == OrderType.Limit:
+                if buy and bar.Low < ticket.LimitPrice:
+                    price = min(ticket.LimitPrice, bar.Open)
+                elif not buy and bar.High > ticket.LimitPrice:
+                    price = max(ticket.LimitPrice, bar.Open)
+            elif ticket.OrderType == OrderType.StopLimit:
+                if buy and (bar.High > ticket.StopPrice or ticket.StopTriggered):
+                    ticket.StopTriggered = True
+                    if bar.Close < ticket.LimitPrice:
+                        price = min(bar.High, ticket.LimitPrice)
+                elif not buy and (bar.Low < ticket.StopPrice or ticket.StopTriggered):
+                    ticket.StopTriggered = True
+                    if bar.Close > ticket.LimitPrice:
+                        price = max(bar.Low, ticket.LimitPrice)
+            if price is not None:
+                self.open_orders.remove(ticket)
+                self.fill(ticket, security, price)
+
+    ### events
+
+    def update_consolidators(self, bar: TradeBar):
+        for consolidator in self.consolidators.get(bar.Symbol, ()):
+            consolidator.update(bar)
+
+    def Initialize(self):
+        pass
+
+    def OnData(self, data: Slice):
+        pass
+
+    def OnOrderEvent(self, orderEvent: OrderEvent):
+        pass
+
+    def OnEndOfAlgorithm(self):
+        pass
+
+    ### logging
+
+    def Log(self, message):
+        self.log_count += 1
+        if self.log_stream is not None:
+            self.log_stream.write(f"{self.Time:%Y-%m-%d %H:%M:%S} {message}\n")
+
+    def Debug(self, message):
+        self.Log(message)
+
+    def Error(self, message):
+        self.Log(message)
+
+    @staticmethod
+    def to_datetime(*date) -> datetime:
+        '''Converts the arguments of SetStartDate and SetEndDate, either (year, month, day) or a datetime. '''
+        if len(date) == 1:
+            return pd.Timestamp(date[0]).to_pydatetime()
+        return datetime(*date)
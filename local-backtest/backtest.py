@@ -0,0 +1,209 @@
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# the strategies import the QuantConnect API from AlgorithmImports, which is provided by this folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from algorithm import QCAlgorithm
+from datafeed import DataFeed
+from qctypes import Slice
+
+
+class BacktestResult:
+    def __init__(self, algorithm: QCAlgorithm, bars: int, slices: int, initialize_seconds: float, loop_seconds: float, strategy_seconds: float):
+        '''Initializer method.
+
+        Arguments:
+            algorithm: The algorithm after the backtest.
+            bars: The number of bars replayed.
+            slices: The number of slices passed to OnData.
+            initialize_seconds: The wall time of Initialize.
+            loop_seconds: The wall time of the event loop.
+            strategy_seconds: The wall time spent in OnData and the consolidator handlers.
+        '''
+        self.algorithm = algorithm
+        self.bars = bars
+        self.slices = slices
+        self.initialize_seconds = initialize_seconds
+        self.loop_seconds = loop_seconds
+        self.strategy_seconds = strategy_seconds
+        self.bars_per_second = bars / loop_seconds if loop_seconds > 0 else float("inf")
+        self.final_value = algorithm.Portfolio.TotalPortfolioValue
+        trades = algorithm.TradeBuilder.ClosedTrades
+        self.orders = sum(1 for ticket in algorithm.tickets if ticket.QuantityFilled != 0)
+        self.closed_trades = len(trades)
+        self.win_rate = sum(trade.IsWin for trade in trades) / len(trades) if trades else 0
+
+    def summary(self) -> dict:
+        '''Summarises the throughput and the performance of the backtest. '''
+        return {
+            "bars": self.bars,
+            "bars/sec": round(self.bars_per_second, 1),
+            "event loop (s)": round(self.loop_seconds, 3),
+            "strategy code (s)": round(self.strategy_seconds, 3),
+            "initialize (s)": round(self.initialize_seconds, 3),
+            "final portfolio value": round(self.final_value, 2),
+            "filled orders": self.orders,
+            "closed trades": self.closed_trades,
+            "win rate": round(self.win_rate, 4),
+            "log lines": self.algorithm.log_count,
+        }
+
+
+def load_algorithm(path: str, class_name=None) -> type:
+    '''Imports a strategy and finds its algorithm class.
+
+    Arguments:
+        path: The strategy folder, or the path of its main.py.
+        class_name: The name of the algorithm class. Default: None, the only QCAlgorithm subclass in the file.
+
+    Returns: The algorithm class.
+    '''
+    if os.path.isdir(path):
+        path = os.path.join(path, "main.py")
+    # the helper modules of the strategy are imported from its folder
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location("main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if class_name is not None:
+        return getattr(module, class_name)
+    classes = [obj for obj in vars(module).values() if isinstance(obj, type) and issubclass(obj, QCAlgorithm) and obj is not QCAlgorithm]
+    if len(classes) != 1:
+        raise ValueError(f"Cannot identify the algorithm class in {path}, please specify it")
+    return classes[0]
+
+
+def pin_parameters(algorithm_class: type, parameters: dict) -> type:
+    '''Creates a subclass of an algorithm whose parameters are fixed to the given values.
+    The assignments of these attributes in Initialize are ignored, so that everything derived from them in Initialize
+    (e.g. the window sizes of the helper objects) uses the given values.
+
+    Arguments:
+        algorithm_class: The algorithm class.
+        parameters: A dictionary of the parameter names and values.
+
+    Returns: The subclass of the algorithm.
+    '''
+    attributes = {name: property(lambda self, value=value: value, lambda self, value: None) for name, value in parameters.items()}
+    return type(algorithm_class.__name__, (algorithm_class,), attributes)
+
+
+def create_algorithm(algorithm_class: type, data, start=None, end=None, log_stream=sys.stdout, parameters=None, lookahead=False) -> QCAlgorithm:
+    '''Creates an algorithm over the bars in the data files, before Initialize is called.
+
+    Arguments:
+        algorithm_class: The algorithm class, a subclass of QCAlgorithm.
+        data: The folder of the data files, named <ticker>.csv or <ticker>.parquet, or a DataFeed.
+        start, end: The start and end dates overriding those set by the algorithm. Default: None.
+        log_stream: The stream of the log messages, or None to discard them. Default: sys.stdout.
+        parameters: A dictionary of the parameters of the algorithm overriding those set in Initialize. Default: None.
+        lookahead: Whether the history requests with an end time may return the bars after the current time,
+            e.g. for the precomputed predictions of the MA strategies. Default: False.
+
+    Returns: The algorithm.
+    '''
+    if parameters:
+        algorithm_class = pin_parameters(algorithm_class, parameters)
+    algorithm = algorithm_class()
+    algorithm.feed = data if isinstance(data, DataFeed) else DataFeed(data)
+    algorithm.log_stream = log_stream
+    algorithm.lookahead = lookahead
+    if start is not None:
+        algorithm.date_overrides["start"] = pd.Timestamp(start).to_pydatetime()
+    if end is not None:
+        algorithm.date_overrides["end"] = pd.Timestamp(end).to_pydatetime()
+    return algorithm
+
+
+def run_backtest(algorithm_class: type, data, start=None, end=None, log_stream=sys.stdout, parameters=None, lookahead=False) -> BacktestResult:
+    '''Runs a backtest of an algorithm over the bars in the data files.
+
+    Arguments:
+        algorithm_class: The algorithm class, a subclass of QCAlgorithm.
+        data: The folder of the data files, named <ticker>.csv or <ticker>.parquet, or a DataFeed.
+        start, end: The start and end dates overriding those set by the algorithm. Default: None.
+        log_stream: The stream of the log messages, or None to discard them. Default: sys.stdout.
+        parameters: A dictionary of the parameters of the algorithm overriding those set in Initialize. Default: None.
+        lookahead: Whether the history requests with an end time may return the bars after the current time. Default: False.
+
+    Returns: The result of the backtest.
+    '''
+    algorithm = create_algorithm(algorithm_class, data, start, end, log_stream, parameters, lookahead)
+
+    initialize_start = time.perf_counter()
+    algorithm.Initialize()
+    initialize_seconds = time.perf_counter() - initialize_start
+
+    # the bars of all the subscriptions within the backtest period, merged by their end times
+    subscriptions = []
+    for security in algorithm.Securities.values():
+        series = algorithm.feed.load(security.Symbol, security.Resolution)
+        first = series.count_until(algorithm.StartDate)
+        last = series.count_until(algorithm.EndDate)
+        subscriptions.append((security, series, first, last))
+    if not subscriptions:
+        raise ValueError("The algorithm has not subscribed to any data")
+    times = np.unique(np.concatenate([series.end_times[first:last] for _, series, first, last in subscriptions]))
+
+    bars = 0
+    strategy_seconds = 0.0
+    positions = [first for _, _, first, _ in subscriptions]
+    loop_start = time.perf_counter()
+    for end_time in times:
+        algorithm.Time = pd.Timestamp(end_time).to_pydatetime()
+        slice_bars = {}
+        for k, (security, series, _, last) in enumerate(subscriptions):
+            i = positions[k]
+            if i < last and series.end_times[i] == end_time:
+                bar = series.bar(i)
+                positions[k] = i + 1
+                slice_bars[security.Symbol] = bar
+                algorithm.update_price(security, bar.Close)
+                algorithm.process_orders(security, bar)
+        bars += len(slice_bars)
+
+        strategy_start = time.perf_counter()
+        for bar in slice_bars.values():
+            algorithm.update_consolidators(bar)
+        algorithm.OnData(Slice(algorithm.Time, slice_bars))
+        strategy_seconds += time.perf_counter() - strategy_start
+    loop_seconds = time.perf_counter() - loop_start
+
+    algorithm.OnEndOfAlgorithm()
+    return BacktestResult(algorithm, bars, len(times), initialize_seconds, loop_seconds, strategy_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a QuantConnect strategy locally over OHLCV data files.")
+    parser.add_argument("strategy", help="the strategy folder or its main.py")
+    parser.add_argument("--data", required=True, help="the folder of the data files, named <ticker>.csv or <ticker>.parquet")
+    parser.add_argument("--class", dest="class_name", help="the algorithm class, if the file defines more than one")
+    parser.add_argument("--start", help="overrides the start date of the algorithm")
+    parser.add_argument("--end", help="overrides the end date of the algorithm")
+    parser.add_argument("--quiet", action="store_true", help="discards the log messages of the algorithm")
+    parser.add_argument("--lookahead", action="store_true", help="lets the history requests with an end time return the bars after the current time")
+    parser.add_argument("--profile", action="store_true", help="prints the functions with the highest cumulative time")
+    args = parser.parse_args()
+
+    algorithm_class = load_algorithm(args.strategy, args.class_name)
+    log_stream = None if args.quiet else sys.stdout
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        result = profiler.runcall(run_backtest, algorithm_class, args.data, args.start, args.end, log_stream, lookahead=args.lookahead)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        result = run_backtest(algorithm_class, args.data, args.start, args.end, log_stream, lookahead=args.lookahead)
+    for name, value in result.summary().items():
+        print(f"{name:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
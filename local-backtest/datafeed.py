@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import pandas as pd
+from qctypes import Resolution, RESOLUTION_PERIODS, Symbol, TradeBar
+
+FIELDS = ["open", "high", "low", "close", "volume"]
+TIME_COLUMNS = ["time", "timestamp", "datetime", "date", "open_time"]
+
+
+# the bars of one security at one resolution, stored as numpy arrays
+class BarSeries:
+    def __init__(self, symbol: Symbol, times: np.array, values: np.array, period):
+        '''Initializer method.
+
+        Arguments:
+            symbol: The symbol of the security.
+            times: The start times of the bars, as numpy datetime64 in ascending order.
+            values: A numpy array of shape (n, 5) with the open, high, low, close and volume in columns.
+            period: The length of the bars, as a timedelta.
+        '''
+        self.symbol = symbol
+        self.period = period
+        self.times = times
+        self.end_times = times + np.timedelta64(period)
+        self.values = values
+
+    def __len__(self):
+        return len(self.times)
+
+    def count_until(self, time) -> int:
+        '''Counts the bars which end at or before a point in time. '''
+        return int(np.searchsorted(self.end_times, np.datetime64(time), side="right"))
+
+    def count_before(self, time) -> int:
+        '''Counts the bars which end before a point in time. '''
+        return int(np.searchsorted(self.end_times, np.datetime64(time), side="left"))
+
+    def bar(self, i: int) -> TradeBar:
+        '''Creates the i-th trade bar. '''
+        open, high, low, close, volume = self.values[i].tolist()
+        return TradeBar(pd.Timestamp(self.times[i]).to_pydatetime(), self.symbol, open, high, low, close, volume, self.period)
+
+    def frame(self, start: int, end: int) -> pd.DataFrame:
+        '''Creates a history DataFrame of the bars from index start (inclusive) to end (exclusive),
+        indexed by symbol and end time as in QuantConnect.
+        '''
+        n = end - start
+        index = pd.MultiIndex.from_arrays([[self.symbol] * n, pd.DatetimeIndex(self.end_times[start:end])], names=["symbol", "time"])
+        return pd.DataFrame(self.values[start:end], index=index, columns=FIELDS)
+
+
+# loads the OHLCV files of a data folder, and resamples them to the requested resolutions
+class DataFeed:
+    def __init__(self, data_dir: str):
+        '''Initializer method.
+
+        Arguments:
+            data_dir: The folder of the data files, named <ticker>.csv or <ticker>.parquet.
+        '''
+        self.data_dir = data_dir
+        self.raw = {}
+        self.series = {}
+
+    def path(self, ticker: str) -> str:
+        '''Finds the data file of a ticker. '''
+        for name in os.listdir(self.data_dir):
+            stem, extension = os.path.splitext(name)
+            if stem.lower() == ticker.lower() and extension.lower() in (".csv", ".parquet"):
+                return os.path.join(self.data_dir, name)
+        raise FileNotFoundError(f"No data file for {ticker} in {self.data_dir}")
+
+    def read(self, ticker: str) -> pd.DataFrame:
+        '''Reads the data file of a ticker into a DataFrame indexed by the bar start time. '''
+        if ticker in self.raw:
+            return self.raw[ticker]
+        path = self.path(ticker)
+        df = pd.read_parquet(path) if path.lower().endswith(".parquet") else pd.read_csv(path)
+        df.columns = [str(column).lower() for column in df.columns]
+        time_column = next((column for column in TIME_COLUMNS if column in df.columns), None)
+        times = df[time_column] if time_column is not None else df.index.to_series()
+        if pd.api.types.is_numeric_dtype(times):
+            # epoch timestamps, in milliseconds (e.g. Binance klines) or in seconds
+            times = pd.to_datetime(times, unit="ms" if times.max() > 1e11 else "s")
+        times = pd.DatetimeIndex(pd.to_datetime(times))
+        if times.tz is not None:
+            times = times.tz_convert("UTC").tz_localize(None)
+        missing = [field for field in FIELDS if field not in df.columns]
+        if missing:
+            raise ValueError(f"{path} does not have the columns {missing}")
+        df = pd.DataFrame(df[FIELDS].values.astype(np.float64), index=times, columns=FIELDS)
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        self.raw[ticker] = df
+        return df
+
+    def add_series(self, series: BarSeries, resolution: Resolution):
+        '''Adds the bars of a security which are loaded elsewhere (e.g. from shared memory).
+
+        Arguments:
+            series: The bars of the security.
+            resolution: The resolution of the bars.
+        '''
+        self.series[(series.symbol.Value, resolution)] = series
+
+    def load(self, symbol: Symbol, resolution: Resolution) -> BarSeries:
+        '''Obtains the bars of a security at a resolution.
+
+        Arguments:
+            symbol: The symbol of the security.
+            resolution: The resolution of the bars.
+
+        Returns: The bars of the security, resampled from the data file if necessary.
+        '''
+        key = (symbol.Value, resolution)
+        if key in self.series:
+            return self.series[key]
+        df = self.read(symbol.Value)
+        period = RESOLUTION_PERIODS[resolution]
+        file_period = pd.Series(df.index).diff().median() if len(df) > 1 else period
+        if file_period > period:
+            raise ValueError(f"The data of {symbol} has bars of {file_period}, which cannot be resampled to {resolution.name}")
+        if file_period < period:
+            df = df.resample(pd.Timedelta(period), label="left", closed="left").agg(
+                {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}).dropna(subset=["close"])
+        series = BarSeries(symbol, df.index.values.astype("datetime64[ns]"), np.ascontiguousarray(df.values), period)
+        self.series[key] = series
+        return series
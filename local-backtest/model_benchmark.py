@@ -0,0 +1,120 @@
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backtest import create_algorithm, load_algorithm
+from qctypes import Resolution
+
+
+def daily_windows(algorithm, n_bars=None) -> list:
+    '''Obtains the windows of the past daily closes which the strategy fits its model to, one per daily bar of the backtest.
+
+    Arguments:
+        algorithm: The algorithm after Initialize, with the data feed of the backtest.
+        n_bars: The maximum number of windows, from the start of the backtest. Default: None (all the daily bars).
+
+    Returns: A list of numpy arrays with the last daysBefore closes of each day.
+    '''
+    a = algorithm
+    daily = a.feed.load(a.ticker, Resolution.Daily)
+    closes = daily.values[:, 3]
+    start, end = daily.count_until(a.StartDate), daily.count_until(a.EndDate)
+    start = max(start, 2)
+    if n_bars is not None:
+        end = min(end, start + n_bars)
+    return [closes[max(0, k - a.daysBefore):k] for k in range(start, end)]
+
+
+def model_factories(algorithm) -> tuple:
+    '''Creates the functions which fit the model of an ARIMA or GARCH strategy, with a full refit or with the rolling model.
+
+    Returns: The name of the model, a function of a window fitting a new model, and a function of refit_every creating the
+        rolling model, where both models return the forecasts of the strategy.
+    '''
+    a = algorithm
+    if hasattr(a, "GARCHp"):
+        module = importlib.import_module("ModelGARCH")
+
+        def full(y):
+            model = module.GarchModel(y, y[-1], p=a.GARCHp, q=a.GARCHq)
+            model.fit()
+            return model.predict_forecasts(print_output=False)
+
+        def rolling(refit_every):
+            model = module.RollingGarchModel(p=a.GARCHp, q=a.GARCHq, refit_every=refit_every)
+
+            def update(y):
+                model.update(y, y[-1])
+                return model.predict_forecasts(print_output=False)
+            return update
+        return f"GARCH({a.GARCHp}, {a.GARCHq})", full, rolling
+    if hasattr(a, "modelTSOrder"):
+        module = importlib.import_module("ModelARIMA")
+        n_steps = getattr(a, "predictNDays", 1)
+
+        def full(y):
+            model = module.ArimaModel(y, order=a.modelTSOrder, percent_ci=a.predictionIntervalConfidenceLevel)
+            model.fit()
+            return model.predict_forecasts(n_steps=n_steps, print_output=False)
+
+        def rolling(refit_every):
+            model = module.RollingArimaModel(order=a.modelTSOrder, percent_ci=a.predictionIntervalConfidenceLevel, refit_every=refit_every)
+
+            def update(y):
+                model.update(y)
+                return model.predict_forecasts(n_steps=n_steps, print_output=False)
+            return update
+        return f"ARIMA{a.modelTSOrder}", full, rolling
+    raise ValueError("The strategy is not one of the ARIMA or GARCH strategies")
+
+
+def run_model(fit, windows: list) -> tuple:
+    '''Fits a model to each window in turn.
+
+    Returns: A numpy array of the forecasts of each window, and the time per window in milliseconds.
+    '''
+    forecasts = []
+    start_time = time.perf_counter()
+    # the optimizers print their progress, which is not timed as a part of the fits
+    with contextlib.redirect_stdout(io.StringIO()):
+        for y in windows:
+            forecasts.append(fit(y))
+    elapsed = time.perf_counter() - start_time
+    return np.array(forecasts, dtype=float), elapsed * 1000 / len(windows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the rolling ARIMA and GARCH models with daily full refits, in latency and forecast drift.")
+    parser.add_argument("strategy", help="the strategy folder or its main.py, one of the ARIMA or GARCH strategies")
+    parser.add_argument("--data", required=True, help="the folder of the data files")
+    parser.add_argument("--start", help="overrides the start date of the algorithm")
+    parser.add_argument("--end", help="overrides the end date of the algorithm")
+    parser.add_argument("--bars", type=int, help="the maximum number of daily bars (default: all the bars of the backtest)")
+    parser.add_argument("--refit-every", default="1,5,10", help="the comma-separated values of refit_every of the rolling model (default: 1,5,10)")
+    args = parser.parse_args()
+
+    algorithm = create_algorithm(load_algorithm(args.strategy), args.data, args.start, args.end, None)
+    algorithm.Initialize()
+    windows = daily_windows(algorithm, args.bars)
+    name, full, rolling = model_factories(algorithm)
+    print(f"{name} on {len(windows)} daily windows of up to {algorithm.daysBefore} closes")
+
+    expected, full_ms = run_model(full, windows)
+    print(f"{'model':>16} {'ms per bar':>10} {'speedup':>8} {'median drift':>13} {'max drift':>10}")
+    print(f"{'full refit':>16} {full_ms:10.2f} {1:8.1f}")
+    for refit_every in [int(value) for value in args.refit_every.split(",")]:
+        forecasts, ms = run_model(rolling(refit_every), windows)
+        # the drift is the relative difference of each forecast (the point estimate and the interval or the standard deviation)
+        drift = np.abs(forecasts - expected) / np.abs(expected)
+        print(f"{f'refit every {refit_every}':>16} {ms:10.2f} {full_ms / ms:8.1f} {np.nanmedian(drift):13.2e} {np.nanmax(drift):10.2e}")
+
+
+if __name__ == "__main__":
+    main()
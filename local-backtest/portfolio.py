@@ -0,0 +1,183 @@
+from qctypes import Symbol, SecurityType, DataNormalizationMode, DataDictionary
+
+
+# a subscribed security and its latest price
+class Security:
+    def __init__(self, symbol: Symbol, resolution, lot_size: float):
+        '''Initializer method.
+
+        Arguments:
+            symbol: The symbol of the security.
+            resolution: The resolution of the data subscription.
+            lot_size: The minimum tradable quantity, the order quantities are rounded down to a multiple of it.
+        '''
+        self.Symbol = symbol
+        self.Resolution = resolution
+        self.lot_size = lot_size
+        self.Price = 0.0
+        self.Close = 0.0
+        self.DataNormalizationMode = DataNormalizationMode.Adjusted
+        self.Holdings = SecurityHolding(symbol)
+
+    def SetDataNormalizationMode(self, mode: DataNormalizationMode):
+        self.DataNormalizationMode = mode
+
+    def round_quantity(self, quantity: float) -> float:
+        '''Rounds an order quantity towards zero to a multiple of the lot size. '''
+        lots = abs(quantity) / self.lot_size
+        # quantities which are already multiples of the lot size (e.g. the whole holding) are kept exactly
+        if abs(lots - round(lots)) < 1e-6:
+            return quantity
+        rounded = int(lots) * self.lot_size
+        if self.Symbol.SecurityType == SecurityType.Equity:
+            rounded = int(rounded)
+        return rounded if quantity > 0 else -rounded
+
+
+class SecurityHolding:
+    def __init__(self, symbol: Symbol):
+        '''Initializer method.
+
+        Arguments:
+            symbol: The symbol of the security.
+        '''
+        self.Symbol = symbol
+        self.Quantity = 0
+        self.AveragePrice = 0.0
+        self.Price = 0.0
+        self.TotalFees = 0.0
+        self.Profit = 0.0
+
+    @property
+    def Invested(self) -> bool:
+        return self.Quantity != 0
+
+    @property
+    def IsLong(self) -> bool:
+        return self.Quantity > 0
+
+    @property
+    def IsShort(self) -> bool:
+        return self.Quantity < 0
+
+    @property
+    def HoldingsValue(self) -> float:
+        return self.Quantity * self.Price
+
+    @property
+    def AbsoluteHoldingsValue(self) -> float:
+        return abs(self.Quantity * self.Price)
+
+    @property
+    def UnrealizedProfit(self) -> float:
+        return (self.Price - self.AveragePrice) * self.Quantity
+
+    def apply_fill(self, price: float, quantity: float, fee: float) -> float:
+        '''Updates the holding with a fill.
+
+        Arguments:
+            price: The price of the fill.
+            quantity: The signed quantity of the fill.
+            fee: The fee of the fill.
+
+        Returns: The profit realized by the fill, before fees.
+        '''
+        realized = 0.0
+        new_quantity = self.Quantity + quantity
+        if self.Quantity == 0 or (self.Quantity > 0) == (quantity > 0):
+            # the position is opened or increased
+            self.AveragePrice = (self.AveragePrice * self.Quantity + price * quantity) / new_quantity
+        else:
+            # the position is reduced, closed or reversed
+            closed = -self.Quantity if abs(quantity) > abs(self.Quantity) else quantity
+            realized = (self.AveragePrice - price) * closed
+            if new_quantity == 0:
+                self.AveragePrice = 0.0
+            elif (new_quantity > 0) != (self.Quantity > 0):
+                self.AveragePrice = price
+        self.Quantity = new_quantity
+        self.TotalFees += fee
+        self.Profit += realized
+        return realized
+
+
+class Cash:
+    def __init__(self, symbol: str, amount: float):
+        self.Symbol = symbol
+        self.Amount = amount
+        self.ConversionRate = 1.0
+
+
+# the cash and holdings of the algorithm, in a single account currency
+class Portfolio(DataDictionary):
+    def __init__(self, currency="USD"):
+        '''Initializer method.
+
+        Arguments:
+            currency: The account currency. Default: "USD".
+        '''
+        super().__init__()
+        self.currency = currency
+        self.CashBook = DataDictionary({currency: Cash(currency, 0.0)})
+        self.leverage = 1.0
+
+    def __missing__(self, key):
+        raise KeyError(f"{key} is not subscribed")
+
+    @property
+    def Cash(self) -> float:
+        return self.CashBook[self.currency].Amount
+
+    def SetCash(self, amount: float):
+        self.CashBook[self.currency].Amount = amount
+
+    def add_security(self, security: Security):
+        self[security.Symbol] = security.Holdings
+
+    @property
+    def Invested(self) -> bool:
+        return any(holding.Invested for holding in self.values())
+
+    @property
+    def TotalHoldingsValue(self) -> float:
+        return sum(holding.HoldingsValue for holding in self.values())
+
+    @property
+    def TotalAbsoluteHoldingsCost(self) -> float:
+        return sum(abs(holding.Quantity * holding.AveragePrice) for holding in self.values())
+
+    @property
+    def TotalPortfolioValue(self) -> float:
+        return self.Cash + self.TotalHoldingsValue
+
+    @property
+    def TotalUnrealizedProfit(self) -> float:
+        return sum(holding.UnrealizedProfit for holding in self.values())
+
+    @property
+    def TotalProfit(self) -> float:
+        return sum(holding.Profit for holding in self.values())
+
+    @property
+    def TotalFees(self) -> float:
+        return sum(holding.TotalFees for holding in self.values())
+
+    @property
+    def TotalMarginUsed(self) -> float:
+        return sum(holding.AbsoluteHoldingsValue for holding in self.values()) / self.leverage
+
+    @property
+    def MarginRemaining(self) -> float:
+        return self.TotalPortfolioValue - self.TotalMarginUsed
+
+    def apply_fill(self, security: Security, price: float, quantity: float, fee: float):
+        '''Settles a fill against the cash and the holding of the security.
+
+        Arguments:
+            security: The security of the fill.
+            price: The price of the fill.
+            quantity: The signed quantity of the fill.
+            fee: The fee of the fill.
+        '''
+        security.Holdings.apply_fill(price, quantity, fee)
+        self.CashBook[self.currency].Amount -= price * quantity + fee
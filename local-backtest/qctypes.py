@@ -0,0 +1,373 @@
+from datetime import datetime, timedelta
+from enum import Enum
+
+
+# enumerations of the QuantConnect API which are used by the strategies
+class Resolution(Enum):
+    Tick = 0
+    Second = 1
+    Minute = 2
+    Hour = 3
+    Daily = 4
+
+
+# the length of a bar in each resolution
+RESOLUTION_PERIODS = {
+    Resolution.Second: timedelta(seconds=1),
+    Resolution.Minute: timedelta(minutes=1),
+    Resolution.Hour: timedelta(hours=1),
+    Resolution.Daily: timedelta(days=1),
+}
+
+
+class Market:
+    Binance = "binance"
+    Bitfinex = "bitfinex"
+    GDAX = "gdax"
+    USA = "usa"
+
+
+class BrokerageName(Enum):
+    Default = 0
+    Binance = 1
+    Bitfinex = 2
+    InteractiveBrokersBrokerage = 3
+
+
+class AccountType(Enum):
+    Cash = 0
+    Margin = 1
+
+
+class SecurityType(Enum):
+    Equity = 0
+    Crypto = 1
+
+
+class TimeInForce(Enum):
+    GoodTilCanceled = 0
+    Day = 1
+
+
+class OrderType(Enum):
+    Market = 0
+    Limit = 1
+    StopLimit = 2
+    MarketOnClose = 3
+
+
+class OrderStatus(Enum):
+    New = 0
+    Submitted = 1
+    PartiallyFilled = 2
+    Filled = 3
+    Canceled = 4
+    Invalid = 5
+
+
+class OrderDirection(Enum):
+    Buy = 0
+    Sell = 1
+    Hold = 2
+
+
+class DataNormalizationMode(Enum):
+    Raw = 0
+    Adjusted = 1
+
+
+class FillGroupingMethod(Enum):
+    FillToFill = 0
+    FlatToFlat = 1
+    FlatToReduced = 2
+
+
+class FillMatchingMethod(Enum):
+    FIFO = 0
+    LIFO = 1
+
+
+class TimeZones:
+    Utc = "UTC"
+    NewYork = "America/New_York"
+    Toronto = "America/Toronto"
+    HongKong = "Asia/Hong_Kong"
+
+
+# the identifier of a security, which compares equal to its ticker
+class Symbol:
+    def __init__(self, value: str, security_type: SecurityType, market: str):
+        '''Initializer method.
+
+        Arguments:
+            value: The ticker of the security.
+            security_type: The type of the security.
+            market: The market of the security.
+        '''
+        self.Value = value
+        self.SecurityType = security_type
+        self.ID = f"{value} {market}"
+
+    def __eq__(self, other):
+        if isinstance(other, Symbol):
+            return self.Value == other.Value
+        return self.Value == other
+
+    def __hash__(self):
+        return hash(self.Value)
+
+    def __str__(self):
+        return self.Value
+
+    __repr__ = __str__
+
+
+class TradeBar:
+    def __init__(self, time: datetime, symbol: Symbol, open: float, high: float, low: float, close: float, volume: float, period: timedelta):
+        '''Initializer method.
+
+        Arguments:
+            time: The start time of the bar.
+            symbol: The symbol of the security.
+            open, high, low, close, volume: The prices and volume of the bar.
+            period: The length of the bar.
+        '''
+        self.Time = time
+        self.EndTime = time + period
+        self.Period = period
+        self.Symbol = symbol
+        self.Open = open
+        self.High = high
+        self.Low = low
+        self.Close = close
+        self.Volume = volume
+        self.Price = close
+        self.Value = close
+
+
+# a dictionary keyed by symbol, with the C#-style methods used by the strategies
+class DataDictionary(dict):
+    def ContainsKey(self, key) -> bool:
+        return key in self
+
+    def Get(self, key, default=None):
+        return self.get(key, default)
+
+
+# the data of all the securities at one point in time
+class Slice:
+    def __init__(self, time: datetime, bars: dict):
+        '''Initializer method.
+
+        Arguments:
+            time: The time of the slice.
+            bars: A dictionary of the trade bars keyed by symbol.
+        '''
+        self.Time = time
+        self.Bars = DataDictionary(bars)
+        self.OptionChains = DataDictionary()
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self.Bars
+
+    def __getitem__(self, symbol):
+        return self.Bars[symbol]
+
+    def ContainsKey(self, symbol) -> bool:
+        return symbol in self.Bars
+
+    def Get(self, symbol, default=None):
+        return self.Bars.get(symbol, default)
+
+
+class OrderEvent:
+    def __init__(self, order_id: int, symbol: Symbol, time: datetime, status: OrderStatus, fill_price=0.0, fill_quantity=0.0, fee=0.0, message=""):
+        '''Initializer method.
+
+        Arguments:
+            order_id: The identifier of the order.
+            symbol: The symbol of the order.
+            time: The time of the event.
+            status: The status of the order after the event.
+            fill_price: The price of the fill. Default: 0.
+            fill_quantity: The signed quantity of the fill. Default: 0.
+            fee: The fee of the fill. Default: 0.
+            message: A message describing the event. Default: "".
+        '''
+        self.OrderId = order_id
+        self.Symbol = symbol
+        self.UtcTime = time
+        self.Status = status
+        self.FillPrice = fill_price
+        self.FillQuantity = fill_quantity
+        self.AbsoluteFillQuantity = abs(fill_quantity)
+        self.Direction = OrderDirection.Buy if fill_quantity > 0 else OrderDirection.Sell if fill_quantity < 0 else OrderDirection.Hold
+        self.OrderFee = fee
+        self.Message = message
+
+    def __str__(self):
+        return f"OrderEvent {self.OrderId} {self.Symbol} {self.Status.name} {self.FillQuantity} @ {self.FillPrice}"
+
+
+# an order and its state, returned to the strategy when the order is placed
+class OrderTicket:
+    def __init__(self, order_id: int, symbol: Symbol, quantity: float, order_type: OrderType, time: datetime,
+                 time_in_force: TimeInForce, limit_price=None, stop_price=None, tag=""):
+        '''Initializer method.
+
+        Arguments:
+            order_id: The identifier of the order.
+            symbol: The symbol of the order.
+            quantity: The signed quantity of the order.
+            order_type: The type of the order.
+            time: The time the order is placed.
+            time_in_force: The time in force of the order.
+            limit_price: The limit price of limit and stop limit orders. Default: None.
+            stop_price: The stop price of stop limit orders. Default: None.
+            tag: The tag of the order. Default: "".
+        '''
+        self.OrderId = order_id
+        self.Symbol = symbol
+        self.Quantity = quantity
+        self.OrderType = order_type
+        self.Time = time
+        self.TimeInForce = time_in_force
+        self.LimitPrice = limit_price
+        self.StopPrice = stop_price
+        self.StopTriggered = False
+        self.Tag = tag
+        self.Status = OrderStatus.Submitted
+        self.QuantityFilled = 0
+        self.AverageFillPrice = 0
+
+    def is_open(self) -> bool:
+        '''Determines whether the order can still be filled. '''
+        return self.Status in (OrderStatus.Submitted, OrderStatus.PartiallyFilled)
+
+    def Cancel(self, tag=""):
+        '''Cancels the order if it is still open. '''
+        if self.is_open():
+            self.Status = OrderStatus.Canceled
+
+
+class Trade:
+    def __init__(self, symbol: Symbol, entry_time: datetime, entry_price: float, quantity: float,
+                 exit_time: datetime, exit_price: float, fees: float):
+        '''Initializer method.
+
+        Arguments:
+            symbol: The symbol of the trade.
+            entry_time, entry_price: The time and average price of the entry.
+            quantity: The signed quantity of the trade, positive for long trades.
+            exit_time, exit_price: The time and average price of the exit.
+            fees: The total fees of the fills in the trade.
+        '''
+        self.Symbol = symbol
+        self.EntryTime = entry_time
+        self.EntryPrice = entry_price
+        self.Direction = OrderDirection.Buy if quantity > 0 else OrderDirection.Sell
+        self.Quantity = abs(quantity)
+        self.ExitTime = exit_time
+        self.ExitPrice = exit_price
+        self.ProfitLoss = (exit_price - entry_price) * quantity
+        self.TotalFees = fees
+        self.IsWin = self.ProfitLoss > 0
+        self.Duration = exit_time - entry_time
+
+
+# groups the fills of each security into closed trades, following the LEAN trade builder
+class TradeBuilder:
+    def __init__(self, grouping=FillGroupingMethod.FlatToFlat, matching=FillMatchingMethod.FIFO):
+        '''Initializer method.
+
+        Arguments:
+            grouping: The method to group the fills into trades. Default: FillGroupingMethod.FlatToFlat.
+            matching: The method to match the exit fills against the entry fills. Default: FillMatchingMethod.FIFO.
+        '''
+        self.grouping = grouping
+        self.matching = matching
+        self.ClosedTrades = []
+        # symbol -> list of open entry lots [time, price, signed quantity, fee]
+        self.lots = {}
+        # symbol -> the exits of the current FlatToFlat trade [time, price, quantity, fee]
+        self.exits = {}
+        # symbol -> the signed position
+        self.positions = {}
+
+    def process_fill(self, symbol: Symbol, time: datetime, price: float, quantity: float, fee: float):
+        '''Processes one fill, and records the trades closed by the fill.
+
+        Arguments:
+            symbol: The symbol of the fill.
+            time: The time of the fill.
+            price: The price of the fill.
+            quantity: The signed quantity of the fill.
+            fee: The fee of the fill.
+        '''
+        lots = self.lots.setdefault(symbol, [])
+        position = self.positions.get(symbol, 0)
+        self.positions[symbol] = position + quantity
+        if position == 0 or (position > 0) == (quantity > 0):
+            lots.append([time, price, quantity, fee])
+            return
+
+        # the fill reduces the position, a fill crossing zero is split into an exit and a new entry
+        closing = -position if abs(quantity) > abs(position) else quantity
+        remaining = quantity - closing
+        fee_closing = fee * closing / quantity
+        if self.grouping == FillGroupingMethod.FlatToFlat:
+            self.exits.setdefault(symbol, []).append([time, price, closing, fee_closing])
+            if closing == -position:
+                exits = self.exits.pop(symbol)
+                self.ClosedTrades.append(self.combine(symbol, lots, exits))
+                lots.clear()
+        else:
+            consumed = self.consume(lots, -closing)
+            if self.grouping == FillGroupingMethod.FlatToReduced:
+                self.ClosedTrades.append(self.combine(symbol, consumed, [[time, price, closing, fee_closing]]))
+            else:
+                for lot in consumed:
+                    share = -lot[2] / closing
+                    self.ClosedTrades.append(self.combine(symbol, [lot], [[time, price, -lot[2], fee_closing * share]]))
+        if remaining != 0:
+            lots.append([time, price, remaining, fee - fee_closing])
+
+    def consume(self, lots: list, quantity: float) -> list:
+        '''Removes the entry lots matched by an exit.
+
+        Arguments:
+            lots: The open entry lots.
+            quantity: The signed quantity of the entry lots to be matched.
+
+        Returns: The matched (parts of the) entry lots.
+        '''
+        consumed = []
+        while quantity != 0:
+            index = 0 if self.matching == FillMatchingMethod.FIFO else -1
+            lot = lots[index]
+            if abs(lot[2]) <= abs(quantity):
+                consumed.append(lots.pop(index))
+                quantity -= lot[2]
+            else:
+                share = quantity / lot[2]
+                consumed.append([lot[0], lot[1], quantity, lot[3] * share])
+                lot[2] -= quantity
+                lot[3] -= lot[3] * share
+                quantity = 0
+        return consumed
+
+    def combine(self, symbol: Symbol, entries: list, exits: list) -> Trade:
+        '''Combines the entry and exit fills into a trade.
+
+        Arguments:
+            symbol: The symbol of the trade.
+            entries: The entry fills [time, price, signed quantity, fee].
+            exits: The exit fills [time, price, signed quantity, fee].
+
+        Returns: The closed trade.
+        '''
+        quantity = sum(fill[2] for fill in entries)
+        entry_price = sum(fill[1] * fill[2] for fill in entries) / quantity
+        exit_price = sum(fill[1] * fill[2] for fill in exits) / sum(fill[2] for fill in exits)
+        fees = sum(fill[3] for fill in entries) + sum(fill[3] for fill in exits)
+        return Trade(symbol, entries[0][0], entry_price, quantity, exits[-1][0], exit_price, fees)
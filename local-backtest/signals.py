@@ -0,0 +1,300 @@
+import argparse
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backtest import create_algorithm, load_algorithm, run_backtest
+from qctypes import Resolution
+
+# the MA versions without a machine learning model, whose signals only depend on the past closes
+VERSIONS = [0, 1, 2, 3, 4, 5]
+
+
+def strategy_version(path: str) -> int:
+    '''Identifies the version of an MA strategy from its folder name, e.g. Crypto-MA-v3 or US-Stock-MA-v5. '''
+    match = re.search(r"MA-v(\d+)", os.path.abspath(path))
+    if match is None or int(match.group(1)) not in VERSIONS:
+        raise ValueError(f"{path} is not one of the MA strategies v0 to v5, please specify the version")
+    return int(match.group(1))
+
+
+### daily quantities
+# the arrays below are indexed by the number of completed daily bars k, i.e. the value at k is calculated
+# from closes[:k], which is the daily history seen by the algorithm until the next daily bar is completed
+
+def window_mean(closes: np.array, window: int) -> np.array:
+    '''Calculates the mean of the last window daily closes, NaN if less than window closes are completed. '''
+    sums = np.concatenate([[0.0], np.cumsum(closes)])
+    means = np.full(len(closes) + 1, np.nan)
+    means[window:] = (sums[window:] - sums[:-window]) / window
+    return means
+
+
+def varying_window_mean(closes: np.array, windows: np.array) -> np.array:
+    '''Calculates the mean of the last windows[k] daily closes at each k, or of all the closes if there are fewer. '''
+    sums = np.concatenate([[0.0], np.cumsum(closes)])
+    k = np.arange(len(closes) + 1)
+    valid = windows > 0
+    start = np.maximum(k - np.where(valid, windows, 0), 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums - sums[start]) / (k - start)
+    return np.where(valid, means, np.nan)
+
+
+def window_volatility(closes: np.array, n_closes: int) -> np.array:
+    '''Calculates the standard deviation of the daily returns among the last n_closes daily closes
+    (among all the closes if there are fewer), as df['close'].pct_change().dropna().std().
+    '''
+    returns = pd.Series(closes[1:] / closes[:-1] - 1)
+    # the returns among closes[k-n_closes:k] are returns[k-n_closes:k-1]
+    window = max(n_closes - 1, 1)
+    rolling = returns.rolling(window, min_periods=min(window, 2)).std().values
+    volatility = np.full(len(closes) + 1, np.nan)
+    volatility[3:] = rolling[1:]
+    return volatility
+
+
+def dynamic_windows(closes: np.array, detector) -> np.array:
+    '''Calculates the dynamic MA (v5) at each k with the turning point detector of the strategy.
+    The dynamic MA only depends on the last n_days closes, so the windows of all the days are calculated in one batch.
+
+    Arguments:
+        closes: The daily closes.
+        detector: The TurningPointDetector of the strategy.
+
+    Returns: The number of days of the dynamic MA at each k, 0 before n_days closes are completed.
+    '''
+    n_days = detector.n_days
+    windows = np.zeros(len(closes) + 1, dtype=np.int64)
+    if len(closes) >= n_days:
+        # the window of closes[k-n_days:k] is the row k-n_days
+        windows[n_days:] = detector.batch_final_MA(sliding_window_view(closes, n_days))
+    return windows
+
+
+def daily_bands(version: int, algorithm, closes: np.array) -> dict:
+    '''Calculates the MA and the widths of the MA bands of a strategy from the daily closes.
+
+    Arguments:
+        version: The version of the MA strategy.
+        algorithm: The algorithm after Initialize, which holds the parameters.
+        closes: The daily closes.
+
+    Returns: A dictionary of the arrays indexed by k: MA and close_MA, and above and close_above
+        (the widths of the bands to open and to close trades, as a fraction of the MA).
+    '''
+    a = algorithm
+    n = len(closes) + 1
+    MA = window_mean(closes, a.n_days)
+    if version == 0:
+        return {"MA": MA, "close_MA": MA, "above": np.zeros(n), "close_above": np.zeros(n)}
+    if version in (1, 2):
+        above = np.full(n, a.percent_above)
+        # v1 closes the positions at the MA, v2 at the MA bands
+        return {"MA": MA, "close_MA": MA, "above": above, "close_above": above if version == 2 else np.zeros(n)}
+    if version == 3:
+        above = window_volatility(closes, a.volatility_n_days + 1) * a.volatility_coefficient
+        return {"MA": MA, "close_MA": MA, "above": above, "close_above": above}
+    above = window_volatility(closes, a.volatility_n_days) * a.volatility_coefficient
+    if version == 4:
+        close_MA = window_mean(closes, a.close_n_days)
+        # the algorithm only trades when both MAs have complete histories
+        MA = np.where(np.isnan(close_MA), np.nan, MA)
+        close_above = window_volatility(closes, a.close_volatility_n_days) * a.close_volatility_coefficient if a.close_percent_above else np.zeros(n)
+        return {"MA": MA, "close_MA": close_MA, "above": above, "close_above": close_above}
+    # v5: the dynamic MA of the turning points in the last n_days closes
+    windows = dynamic_windows(closes, a.turningPoints)
+    MA = np.where(np.isnan(MA), np.nan, varying_window_mean(closes, windows))
+    close_above = window_volatility(closes, a.close_volatility_n_days) * a.close_volatility_coefficient
+    return {"MA": MA, "close_MA": MA, "above": above, "close_above": close_above}
+
+
+### signals
+
+def generate_signals(algorithm, version: int) -> pd.DataFrame:
+    '''Generates the signals of an MA strategy (v0 to v5) over the whole backtest period at once.
+    The MAs, the volatilities and the band crossings are calculated with numpy for all the bars, and only the
+    positions are tracked bar by bar, as the take profit and the trailing stop loss depend on the entry price.
+
+    Arguments:
+        algorithm: The algorithm after Initialize, with the data feed of the backtest.
+        version: The version of the MA strategy.
+
+    Returns: A DataFrame indexed by the end times of the bars, with the closes, the MA bands, and the signals:
+        entry (1 to open a long position, -1 to open a short position), exit (True to close the position)
+        and position (the direction of the position after the bar).
+    '''
+    a = algorithm
+    security = a.Securities[a.symbol]
+    bars = a.feed.load(security.Symbol, security.Resolution)
+    daily = a.feed.load(security.Symbol, Resolution.Daily)
+    start, end = bars.count_until(a.StartDate), bars.count_until(a.EndDate)
+    times = bars.end_times[start:end]
+    close = bars.values[start:end, 3]
+
+    # the number of completed daily bars seen by the history requests at each bar
+    k = np.searchsorted(daily.end_times, times, side="right")
+    closes = daily.values[:k[-1] if len(k) else 0, 3]
+    bands = daily_bands(version, a, closes)
+    MA, close_MA = bands["MA"][k], bands["close_MA"][k]
+    above, close_above = bands["above"][k], bands["close_above"][k]
+
+    upper, lower = MA * (1 + above), MA / (1 + above)
+    close_upper, close_lower = close_MA * (1 + close_above), close_MA / (1 + close_above)
+    # the algorithm returns before the positions of the lines are updated if the history is incomplete
+    valid = ~np.isnan(MA)
+    upper_pos = close >= upper
+    lower_pos = close <= lower
+    previous = np.concatenate([[False], valid[:-1]])
+    upper_prev = np.concatenate([[False], upper_pos[:-1]])
+    lower_prev = np.concatenate([[False], lower_pos[:-1]])
+    # crossing the upper band from below, or the lower band from above
+    cross_up = valid & previous & ~upper_prev & upper_pos
+    cross_down = valid & previous & ~lower_prev & lower_pos
+
+    entry = np.zeros(len(close), dtype=np.int8)
+    exit = np.zeros(len(close), dtype=bool)
+    if version == 0:
+        # v0 always holds a position, which is reversed at each crossing of the MA
+        entry[cross_up] = 1
+        entry[valid & previous & upper_prev & (close <= MA)] = -1
+        position = pd.Series(entry.astype(float)).replace(0, np.nan).ffill().fillna(0).values.astype(np.int8)
+    else:
+        position = track_positions(a, close, cross_up, cross_down, valid & (close <= close_upper), valid & (close >= close_lower), entry, exit)
+
+    return pd.DataFrame({"close": close, "MA": MA, "upper": upper, "lower": lower, "close_upper": close_upper, "close_lower": close_lower,
+                         "entry": entry, "exit": exit, "position": position}, index=pd.DatetimeIndex(times, name="time"))
+
+
+def track_positions(algorithm, close, cross_up, cross_down, close_long, close_short, entry, exit) -> np.array:
+    '''Tracks the position bar by bar, which is the only sequential part of the signals.
+
+    Arguments:
+        algorithm: The algorithm after Initialize, which holds the parameters.
+        close: The closes of the bars.
+        cross_up, cross_down: Whether the close crosses the upper (lower) MA band to open a long (short) position.
+        close_long, close_short: Whether the close passes the MA bands to close a long (short) position.
+        entry, exit: The arrays of the entry and exit signals, filled by this function.
+
+    Returns: The direction of the position after each bar.
+    '''
+    a = algorithm
+    takeprofit, takeprofit_percentage = a.takeprofit, a.takeprofitpercentage
+    trailing, trailing_percent = a.trailingstoploss, a.trailingstoplosspercent
+    candidates = np.flatnonzero(cross_up | cross_down).tolist()
+    close, cross_up, cross_down = close.tolist(), cross_up.tolist(), cross_down.tolist()
+    close_long, close_short = close_long.tolist(), close_short.tolist()
+
+    position = np.zeros(len(close), dtype=np.int8)
+    direction = 0
+    highwatermark = lowwatermark = purchaseprice = 0.0
+    c = 0
+    i = candidates[0] if candidates else len(close)
+    while i < len(close):
+        price = close[i]
+        if direction == 0:
+            # open a position, the short signal is checked after the long signal as in OnData
+            if cross_up[i]:
+                direction = 1
+                entry[i] = 1
+            if cross_down[i]:
+                direction = -1
+                entry[i] = -1
+            highwatermark = lowwatermark = purchaseprice = price
+            start = i
+            i += 1
+            continue
+
+        highwatermark = max(price, highwatermark)
+        lowwatermark = min(price, lowwatermark)
+        if takeprofit and ((direction == 1 and price/purchaseprice - 1 > takeprofit_percentage) or (direction == -1 and 1 - price/purchaseprice > takeprofit_percentage)):
+            closed = True
+        elif trailing and ((direction == 1 and price/highwatermark < 1 - trailing_percent) or (direction == -1 and price/lowwatermark > 1 + trailing_percent)):
+            closed = True
+        else:
+            closed = close_long[i] if direction == 1 else close_short[i]
+        if closed:
+            exit[i] = True
+            position[start:i] = direction
+            direction = 0
+            # skip to the next crossing after the exit
+            while c < len(candidates) and candidates[c] <= i:
+                c += 1
+            i = candidates[c] if c < len(candidates) else len(close)
+        else:
+            i += 1
+    if direction != 0:
+        position[start:] = direction
+    return position
+
+
+def expected_orders(signals: pd.DataFrame) -> list:
+    '''Lists the orders implied by the signals, as (time, direction) pairs. '''
+    entries = signals.index[signals["entry"] != 0]
+    orders = [(time, int(direction)) for time, direction in zip(entries, signals.loc[entries, "entry"])]
+    exits = signals.index[signals["exit"]]
+    # the position which is closed is the one held before the exit bar
+    before = signals["position"].shift(1).fillna(0)
+    orders += [(time, -int(before[time])) for time in exits]
+    return sorted(orders)
+
+
+def compare_with_backtest(algorithm_class: type, data, version: int, start=None, end=None, parameters=None) -> tuple:
+    '''Compares the signals with the orders of the event-driven backtest of the same algorithm.
+
+    Returns: The number of the orders of the backtest and the first mismatch, or None if they all match.
+    '''
+    algorithm = create_algorithm(algorithm_class, data, start, end, None, parameters)
+    algorithm.Initialize()
+    expected = expected_orders(generate_signals(algorithm, version))
+    result = run_backtest(algorithm_class, data, start, end, log_stream=None, parameters=parameters)
+    actual = [(pd.Timestamp(ticket.Time), int(np.sign(ticket.QuantityFilled))) for ticket in result.algorithm.tickets if ticket.QuantityFilled != 0]
+    for i, (e, b) in enumerate(zip(expected, actual)):
+        if e != b:
+            return len(actual), (i, e, b)
+    if len(expected) != len(actual):
+        i = min(len(expected), len(actual))
+        return len(actual), (i, expected[i] if i < len(expected) else None, actual[i] if i < len(actual) else None)
+    return len(actual), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates the signals of an MA strategy (v0 to v5) over the whole backtest period with numpy.")
+    parser.add_argument("strategy", help="the strategy folder or its main.py")
+    parser.add_argument("--data", required=True, help="the folder of the data files")
+    parser.add_argument("--version", type=int, choices=VERSIONS, help="the version of the MA strategy (default: from the folder name)")
+    parser.add_argument("--class", dest="class_name", help="the algorithm class, if the file defines more than one")
+    parser.add_argument("--start", help="overrides the start date of the algorithm")
+    parser.add_argument("--end", help="overrides the end date of the algorithm")
+    parser.add_argument("--output", help="writes the signals to a csv file")
+    parser.add_argument("--check", action="store_true", help="compares the signals with the orders of the event-driven backtest")
+    args = parser.parse_args()
+
+    version = args.version if args.version is not None else strategy_version(args.strategy)
+    algorithm_class = load_algorithm(args.strategy, args.class_name)
+    algorithm = create_algorithm(algorithm_class, args.data, args.start, args.end, None)
+    algorithm.Initialize()
+    # the data files are loaded by Initialize, so only the signals are timed
+    start_time = time.perf_counter()
+    signals = generate_signals(algorithm, version)
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(signals)} bars in {elapsed*1000:.1f}ms: {(signals['entry'] != 0).sum()} entries, {signals['exit'].sum()} exits")
+    if args.output:
+        signals.to_csv(args.output)
+    if args.check:
+        orders, mismatch = compare_with_backtest(algorithm_class, args.data, version, args.start, args.end)
+        if mismatch is None:
+            print(f"The signals match the {orders} orders of the event-driven backtest")
+        else:
+            i, expected, actual = mismatch
+            print(f"Order {i} of the backtest does not match the signals: expected {expected}, got {actual}")
+
+
+if __name__ == "__main__":
+    main()
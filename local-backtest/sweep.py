@@ -0,0 +1,271 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backtest import load_algorithm, run_backtest
+from datafeed import BarSeries, DataFeed
+from qctypes import Resolution, RESOLUTION_PERIODS, Symbol, SecurityType
+
+# the hand-tuned parameters of the MA strategies
+MA_PARAMETERS = ["MA_coef", "volatility_coefficient", "close_volatility_coefficient", "penalty_coefficient",
+                 "num_days_lookback", "rolling_window", "rolling_reset", "min_MA"]
+
+
+def grid_search(space: dict) -> list:
+    '''Enumerates all the combinations of the parameter values.
+
+    Arguments:
+        space: A dictionary of the parameter names and the lists of their values.
+
+    Returns: A list of dictionaries of the parameters.
+    '''
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space: dict, n_samples: int, seed=None) -> list:
+    '''Samples the parameters at random.
+
+    Arguments:
+        space: A dictionary of the parameter names and either a list of values (sampled uniformly) or a (low, high) tuple
+            (sampled uniformly within the range, as integers if both bounds are integers).
+        n_samples: The number of samples.
+        seed: The random seed. Default: None.
+
+    Returns: A list of dictionaries of the parameters.
+    '''
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n_samples):
+        sample = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                sample[name] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) else rng.uniform(low, high)
+            else:
+                sample[name] = rng.choice(values)
+        samples.append(sample)
+    return samples
+
+
+def parse_value(text: str):
+    '''Parses a parameter value of the command line as an int, a float, a boolean or a string. '''
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return {"True": True, "False": False}.get(text, text)
+
+
+def parse_space(specs: list) -> dict:
+    '''Parses the parameter space of the command line, given as name=v1,v2,... (a list) or name=low:high (a range). '''
+    space = {}
+    for spec in specs:
+        name, values = spec.split("=", 1)
+        if ":" in values:
+            low, high = values.split(":", 1)
+            space[name] = (parse_value(low), parse_value(high))
+        else:
+            space[name] = [parse_value(value) for value in values.split(",")]
+    return space
+
+
+### shared memory
+
+def share_data(feed: DataFeed, tickers: list, resolutions: list) -> tuple:
+    '''Copies the bars of the tickers at each resolution into shared memory, so that the workers do not reload them.
+
+    Arguments:
+        feed: The data feed of the data folder.
+        tickers: The tickers to be shared.
+        resolutions: The resolutions to be shared, those finer than the data files are skipped.
+
+    Returns: The descriptions of the shared bars for the workers, and the shared memory blocks to be released afterwards.
+    '''
+    descriptors = []
+    blocks = []
+    for ticker in tickers:
+        for resolution in resolutions:
+            # the security type only affects the lot size and fees, which are set by the algorithm itself
+            symbol = Symbol(ticker, SecurityType.Crypto, "")
+            try:
+                series = feed.load(symbol, resolution)
+            except ValueError:
+                continue
+            arrays = {}
+            for name, array in (("times", series.times.view(np.int64)), ("values", series.values)):
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                blocks.append(block)
+                arrays[name] = (block.name, array.shape, array.dtype.str)
+            descriptors.append((ticker, resolution, arrays))
+    return descriptors, blocks
+
+
+def attach_data(data_dir: str, descriptors: list) -> tuple:
+    '''Creates a data feed of the bars in shared memory, without copying them.
+
+    Arguments:
+        data_dir: The folder of the data files, used for the bars which are not shared.
+        descriptors: The descriptions of the shared bars.
+
+    Returns: The data feed, and the attached shared memory blocks which must be kept alive with it.
+    '''
+    feed = DataFeed(data_dir)
+    blocks = []
+    for ticker, resolution, arrays in descriptors:
+        views = {}
+        for name, (block_name, shape, dtype) in arrays.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            view.flags.writeable = False
+            views[name] = view
+        times = views["times"].view("datetime64[ns]")
+        feed.add_series(BarSeries(Symbol(ticker, SecurityType.Crypto, ""), times, views["values"], RESOLUTION_PERIODS[resolution]), resolution)
+    return feed, blocks
+
+
+### workers
+
+# the state of each worker process, set up once by init_worker
+worker = {}
+
+
+def init_worker(strategy: str, class_name, data_dir: str, descriptors: list, start, end, lookahead=False):
+    # the numerical libraries use one thread per worker, so that the workers do not compete for the cores
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = "1"
+    worker["algorithm_class"] = load_algorithm(strategy, class_name)
+    worker["feed"], worker["blocks"] = attach_data(data_dir, descriptors)
+    worker["start"], worker["end"] = start, end
+    worker["lookahead"] = lookahead
+
+
+def run_candidate(parameters: dict) -> dict:
+    '''Runs the backtest of one set of parameters in a worker.
+
+    Returns: A dictionary of the parameters and the results of the backtest.
+    '''
+    row = dict(parameters)
+    start = time.perf_counter()
+    try:
+        result = run_backtest(worker["algorithm_class"], worker["feed"], worker["start"], worker["end"], log_stream=None, parameters=parameters,
+                              lookahead=worker["lookahead"])
+        initial_cash = result.algorithm.initial_cash
+        row.update({
+            "final_value": result.final_value,
+            "total_return": result.final_value / initial_cash - 1 if initial_cash else np.nan,
+            "filled_orders": result.orders,
+            "closed_trades": result.closed_trades,
+            "win_rate": result.win_rate,
+            "bars": result.bars,
+            "bars_per_second": result.bars_per_second,
+            "error": "",
+        })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    row["worker"] = os.getpid()
+    return row
+
+
+def run_sweep(strategy: str, data_dir: str, candidates: list, output: str, workers=None, class_name=None, start=None, end=None,
+              tickers=None, resolutions=(Resolution.Hour, Resolution.Daily), lookahead=False) -> pd.DataFrame:
+    '''Runs the backtests of the candidate parameters across a process pool, and writes the results to one columnar file.
+
+    Arguments:
+        strategy: The strategy folder or its main.py.
+        data_dir: The folder of the data files.
+        candidates: A list of dictionaries of the parameters.
+        output: The path of the results, a .parquet file (or .csv if parquet is not available).
+        workers: The number of worker processes. Default: None, the number of cores.
+        class_name: The name of the algorithm class. Default: None.
+        start, end: The start and end dates overriding those set by the algorithm. Default: None.
+        tickers: The tickers shared with the workers. Default: None, all the data files.
+        resolutions: The resolutions shared with the workers. Default: hourly and daily.
+        lookahead: Whether the history requests with an end time may return the bars after the current time. Default: False.
+
+    Returns: A DataFrame of the results, one row per candidate.
+    '''
+    feed = DataFeed(data_dir)
+    if tickers is None:
+        tickers = [os.path.splitext(name)[0] for name in sorted(os.listdir(data_dir)) if name.lower().endswith((".csv", ".parquet"))]
+    # the data is loaded and resampled once here, and the workers read it from shared memory
+    descriptors, blocks = share_data(feed, tickers, resolutions)
+    del feed
+
+    workers = workers or os.cpu_count()
+    start_time = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(strategy, class_name, data_dir, descriptors, start, end, lookahead)) as executor:
+            rows = list(executor.map(run_candidate, candidates))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    elapsed = time.perf_counter() - start_time
+
+    results = pd.DataFrame(rows)
+    write_results(results, output)
+    print(f"{len(candidates)} backtests in {elapsed:.1f}s with {workers} workers "
+          f"({results['bars'].sum() / elapsed if 'bars' in results else 0:.0f} bars/sec in total)")
+    return results
+
+
+def write_results(results: pd.DataFrame, output: str):
+    '''Writes the results to a parquet file, or to a csv file if no parquet engine is installed. '''
+    if output.lower().endswith(".csv"):
+        results.to_csv(output, index=False)
+        return
+    try:
+        results.to_parquet(output, index=False)
+    except ImportError:
+        output = os.path.splitext(output)[0] + ".csv"
+        print(f"No parquet engine is installed (pyarrow or fastparquet), the results are written to {output} instead")
+        results.to_csv(output, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a grid or random search over the parameters of a strategy with a process pool.")
+    parser.add_argument("strategy", help="the strategy folder or its main.py")
+    parser.add_argument("--data", required=True, help="the folder of the data files")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=SPEC",
+                        help=f"a parameter and its values v1,v2,... or its range low:high (random search only), e.g. {MA_PARAMETERS[0]}=2,2.5,3")
+    parser.add_argument("--samples", type=int, help="the number of random samples, a grid search is run if it is not given")
+    parser.add_argument("--seed", type=int, help="the random seed")
+    parser.add_argument("--workers", type=int, help="the number of worker processes (default: the number of cores)")
+    parser.add_argument("--output", default="sweep.parquet", help="the results file (default: sweep.parquet)")
+    parser.add_argument("--class", dest="class_name", help="the algorithm class, if the file defines more than one")
+    parser.add_argument("--start", help="overrides the start date of the algorithm")
+    parser.add_argument("--end", help="overrides the end date of the algorithm")
+    parser.add_argument("--lookahead", action="store_true", help="lets the history requests with an end time return the bars after the current time")
+    args = parser.parse_args()
+
+    space = parse_space(args.param)
+    if args.samples is None:
+        if any(isinstance(values, tuple) for values in space.values()):
+            parser.error("Ranges low:high are only supported by the random search (--samples)")
+        candidates = grid_search(space)
+    else:
+        candidates = random_search(space, args.samples, args.seed)
+    results = run_sweep(args.strategy, args.data, candidates, args.output, args.workers, args.class_name, args.start, args.end,
+                        lookahead=args.lookahead)
+    columns = [column for column in ("final_value", "total_return", "closed_trades", "win_rate") if column in results]
+    if columns:
+        print(results.sort_values(columns[0], ascending=False).head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()